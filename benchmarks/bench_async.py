@@ -0,0 +1,76 @@
+import sys
+import os
+import time
+import random
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB
+from call_db.async_calls import asyncCallDB
+
+
+def bench_async(db_file, requests=500, readers=(1, 2, 4, 8)):
+    """
+    Send a number of simultaneous requests (counts over random ranges, daily details and weather)
+    to asyncCallDB with different numbers of reader threads and compare the throughput with
+    running the same requests one after another on a callDB object. The caches are disabled.
+    The largest delay of a task which wakes up every millisecond shows how long the event loop
+    was blocked.
+    """
+    db = callDB(db_file=db_file, load_only=True, cache_size=0)
+    days = [row[0] for row in db.query_db("SELECT id FROM dates ORDER BY id;")]
+    random.seed(0)
+    ranges = []
+    for i in range(requests):
+        start = random.randint(db.first_timestamp, db.last_timestamp)
+        ranges.append((start, start + random.randint(3600, 86400*30)))
+    sample = [random.choice(days) for i in range(requests)]
+
+    start = time.perf_counter()
+    for i in range(requests):
+        db.count_between(start_ts=ranges[i][0], end_ts=ranges[i][1])
+        db.get_date_details(sample[i])
+        db.get_weather(sample[i])
+    elapsed = time.perf_counter() - start
+    results = {"sequential": elapsed}
+    print(f"{'sequential':>12}: {elapsed:6.2f} s, {3*requests/elapsed:8.0f} requests/s")
+    db.close()
+
+    async def ticker(done, lag):
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag.append(time.perf_counter() - start - 0.001)
+
+    async def run(adb):
+        done = asyncio.Event()
+        lag = [0]
+        task = asyncio.create_task(ticker(done, lag))
+        calls = []
+        for i in range(requests):
+            calls.append(adb.count_between(start_ts=ranges[i][0], end_ts=ranges[i][1]))
+            calls.append(adb.get_date_details(sample[i]))
+            calls.append(adb.get_weather(sample[i]))
+        await asyncio.gather(*calls)
+        done.set()
+        await task
+        return(max(lag))
+
+    for n in readers:
+        adb = asyncCallDB(db_file, readers=n, cache_size=0)
+        start = time.perf_counter()
+        lag = asyncio.run(run(adb))
+        elapsed = time.perf_counter() - start
+        adb.close()
+        results.update({n: elapsed})
+        print(f"{str(n) + ' readers':>12}: {elapsed:6.2f} s, {3*requests/elapsed:8.0f} requests/s, max. event loop lag {lag*1e3:.1f} ms")
+
+    return(results)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_async(args[1])
@@ -0,0 +1,32 @@
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB
+from train_categories import train_category_models
+
+
+def bench_categories(db_file, min_calls=5000, workers=(1, 2, 4, 8)):
+    """
+    Measure the wall-clock time of training the per-category models with different numbers of
+    worker processes.
+    """
+    db = callDB(db_file=db_file, load_only=True)
+    results = {}
+    for n in workers:
+        start = time.perf_counter()
+        artifact = train_category_models(db, min_calls, workers=n, cache_dir=None)
+        elapsed = time.perf_counter() - start
+        results.update({n: elapsed})
+        print(f"{n:>2} workers: {len(artifact['targets'])} models in {elapsed:6.2f} s")
+    db.close()
+    return(results)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_categories(args[1], int(args[2]) if len(args) > 2 else 5000)
@@ -0,0 +1,68 @@
+import sys
+import os
+import time
+import random
+import sqlite3
+import datetime as dt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB
+
+
+def fresh_connection_lookup(db_file, queries, data):
+    """
+    Perform a lookup the way callDB did before connections were reused: connect, run the queries
+    and close.
+    """
+    conn = sqlite3.connect(db_file)
+    result = [conn.execute(query, data).fetchall() for query in queries]
+    conn.close()
+    return(result)
+
+
+def bench_connections(db_file, samples=2000):
+    """
+    Compare the per-lookup latency of a fresh connection per lookup with the persistent
+    connection of callDB. The cache of callDB is disabled, so both run the same queries.
+    """
+    db = callDB(db_file=db_file, load_only=True, cache_size=0)
+    total_days = (db.last_date - db.first_date).days + 1
+    dates = [(db.first_date + dt.timedelta(days=random.randrange(total_days))).strftime("%Y-%m-%d")
+             for i in range(samples)]
+
+    details = ["SELECT id, holiday, calls, population FROM dates WHERE id = ?",
+               "SELECT id FROM holiday_names WHERE name = (SELECT holiday FROM dates WHERE id = ?)",
+               "SELECT type, count FROM daily_type_counts WHERE date = ?",
+               "SELECT hour, count FROM daily_hourly_counts WHERE date = ?"]
+    lookups = [("exists", ["SELECT EXISTS(SELECT * FROM dates WHERE id = ?);"], lambda date: db.exists(date, table="dates")),
+               ("get_date_details", details, db.get_date_details)]
+    if db.weather_info:
+        lookups.append(("get_weather", ["SELECT * FROM weather WHERE date = ? ORDER BY rowid LIMIT 1"], db.get_weather))
+    if db.covid_info:
+        lookups.append(("get_covid_info", ["SELECT * FROM covid WHERE id = ?"], db.get_covid_info))
+
+    results = {}
+    for name, queries, method in lookups:
+        start = time.perf_counter()
+        for date in dates:
+            fresh_connection_lookup(db_file, queries, (date,))
+        before = (time.perf_counter() - start)/samples*1e6
+
+        start = time.perf_counter()
+        for date in dates:
+            method(date)
+        after = (time.perf_counter() - start)/samples*1e6
+
+        results.update({name: (before, after)})
+        print(f"{name:>18}: {before:8.1f} us with a fresh connection, {after:8.1f} us with the persistent connection")
+
+    db.close()
+    return(results)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_connections(args[1])
@@ -0,0 +1,50 @@
+import sys
+import os
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB
+
+
+def bench_count_index(db_file, windows=10000, widths=(3600, 86400*30)):
+    """
+    Compare sliding window counts (e.g. surge checks) of an hour and of 30 days answered by
+    SQL queries and by the count index at different resolutions.
+    """
+    db = callDB(db_file=db_file, load_only=True)
+    random.seed(0)
+    starts = [random.randint(db.first_timestamp, db.last_timestamp) for i in range(windows)]
+
+    results = {}
+    for resolution in [None, "second", "minute", "hour"]:
+        if resolution == None:
+            db.drop_count_index()
+            name = "sql"
+        else:
+            db.build_count_index(resolution)
+            name = resolution
+
+            # Build the index before timing the lookups.
+            start = time.perf_counter()
+            db.count_between(start_ts=0, end_ts=1)
+            print(f"{name:>8}: index built in {time.perf_counter() - start:.2f} s")
+
+        for width in widths:
+            start = time.perf_counter()
+            for ts in starts:
+                db.count_between(start_ts=ts, end_ts=ts + width)
+            latency = (time.perf_counter() - start)/windows*1e6
+            results.update({(name, width): latency})
+            print(f"{name:>8}: {latency:8.1f} us per window of {width} s")
+
+    db.close()
+    return(results)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_count_index(args[1])
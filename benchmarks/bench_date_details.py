@@ -0,0 +1,49 @@
+import sys
+import os
+import time
+import json
+import sqlite3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB
+
+
+def bench_date_details(db_file, repeat=5):
+    """
+    Compare the read path of the daily details: decoding a json blob per day as older versions
+    of callDB did, the full get_date_details view and the slices read by the accessors.
+    """
+    db = callDB(db_file=db_file, load_only=True)
+    days = [row[0] for row in db.query_db("SELECT id FROM dates ORDER BY id;")]
+
+    # Store the details of every day as json in an in-memory table as a baseline.
+    legacy = sqlite3.connect(":memory:")
+    legacy.execute("CREATE TABLE dates (id text PRIMARY KEY, details text);")
+    legacy.executemany("INSERT INTO dates VALUES (?,?);", [(day, json.dumps(db.get_date_details(day))) for day in days])
+
+    readers = [("json blob", lambda day: json.loads(legacy.execute("SELECT details FROM dates WHERE id = ?", (day,)).fetchall()[0][0])),
+               ("get_date_details", db.get_date_details),
+               ("without counts", lambda day: db.get_date_details(day, type_stats=False, hourly_stats=False)),
+               ("type counts (3 types)", lambda day: db.get_daily_type_counts(day, types=["Aid Response", "Medic Response", "Auto Fire Alarm"])),
+               ("hourly counts", db.get_daily_hourly_counts)]
+
+    results = {}
+    for name, reader in readers:
+        start = time.perf_counter()
+        for i in range(repeat):
+            for day in days:
+                reader(day)
+        latency = (time.perf_counter() - start)/repeat/len(days)*1e6
+        results.update({name: latency})
+        print(f"{name:>22}: {latency:8.1f} us per day")
+
+    db.close()
+    return(results)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_date_details(args[1])
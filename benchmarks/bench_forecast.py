@@ -0,0 +1,42 @@
+import sys
+import os
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB
+from pop_predict.predict import shared_predictor
+from train import train_model, prediction_features, relevant_features
+from forecast import forecast
+
+
+def bench_forecast(db_file, first_date="2024-01-01", last_date="2024-12-31"):
+    """
+    Compare a year of daily forecasts computed date by date (features of one date and one call
+    of the model per date) and computed as a batch.
+    """
+    db = callDB(db_file=db_file, load_only=True)
+    model = train_model(relevant_features, cache_dir=None, call_db=db)["model"]
+    pop = shared_predictor()
+    dates = pd.date_range(first_date, last_date, freq="D").strftime("%Y-%m-%d")
+
+    start = time.perf_counter()
+    single = [model.predict(pd.DataFrame([prediction_features(db, pop, date)]))[0] for date in dates]
+    loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = forecast(model, db, first_date=first_date, last_date=last_date, pop=pop)
+    batch = time.perf_counter() - start
+
+    assert (abs(result["CALLS"].to_numpy() - single) < 1e-9).all()
+    print(f"{len(dates)} days: {loop*1e3:8.1f} ms date by date, {batch*1e3:6.1f} ms as batch")
+    db.close()
+    return({"loop": loop, "batch": batch})
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_forecast(args[1])
@@ -0,0 +1,48 @@
+import sys
+import os
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB
+from pop_predict.predict import shared_predictor
+from train_hourly import train_hourly_model, forecast_hourly
+
+
+def bench_hourly(db_file, repeat=20):
+    """
+    Measure the time needed to build the days x 24 target matrix (day by day and as one array
+    operation), to train the hourly model and to predict the 168 hourly values of a week.
+    """
+    db = callDB(db_file=db_file, load_only=True, cache_size=0)
+    days = [row[0] for row in db.query_db("SELECT id FROM dates ORDER BY id;")]
+
+    start = time.perf_counter()
+    per_day = np.array([db.get_daily_hourly_counts(day) for day in days])
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    matrix = db.get_hourly_matrix()
+    array = time.perf_counter() - start
+    assert (per_day == matrix).all()
+    print(f"target matrix of {len(days)} days: {loop*1e3:8.1f} ms day by day, {array*1e3:6.1f} ms as array")
+
+    artifact = train_hourly_model(db, cache_dir=None)
+    print(f"training: {artifact['metrics']['seconds']:.2f} s, MAE per hour {artifact['metrics']['mae']:.2f}, MAE per day {artifact['metrics']['daily_mae']:.2f}")
+
+    pop = shared_predictor()
+    start = time.perf_counter()
+    for i in range(repeat):
+        forecast_hourly(artifact["model"], db, "2024-03-04", pop=pop)
+    inference = (time.perf_counter() - start)/repeat
+    print(f"inference: {inference*1e3:.1f} ms per week (168 values)")
+
+    db.close()
+    return({"loop": loop, "array": array, "training": artifact["metrics"]["seconds"], "inference": inference})
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_hourly(args[1])
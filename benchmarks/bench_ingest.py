@@ -0,0 +1,55 @@
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB
+
+
+def bench_ingest(csvfile, engines=("stream", "columnar", "parallel"), dmin=None, dmax=None, workers=None):
+    """
+    Build a database from csvfile with every engine and compare the time needed to parse
+    the csv file and write the calls table. Returns a dictionary with the ingest statistics
+    for every engine.
+    """
+    stats = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for engine in engines:
+            db = callDB(csvfile, os.path.join(tmp_dir, f"{engine}.db"), rebuild=True,
+                        dmin=dmin, dmax=dmax, engine=engine, workers=workers)
+            stats.update({engine: db.ingest_stats})
+
+    base = stats[engines[0]]["seconds"]
+    for engine in engines:
+        rows = stats[engine]["rows"]
+        seconds = stats[engine]["seconds"]
+        print(f"{engine:>10}: {rows} rows in {seconds:.2f} s ({rows/seconds:.0f} rows/s, speedup {base/seconds:.1f}x)")
+    return(stats)
+
+
+
+def bench_workers(csvfile, workers=(1, 2, 4, 8), dmin=None, dmax=None):
+    """
+    Measure how the parallel engine scales with the number of worker processes.
+    """
+    stats = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n in workers:
+            db = callDB(csvfile, os.path.join(tmp_dir, f"parallel_{n}.db"), rebuild=True,
+                        dmin=dmin, dmax=dmax, engine="parallel", workers=n)
+            stats.update({n: db.ingest_stats})
+
+    base = stats[workers[0]]["seconds"]
+    for n in workers:
+        seconds = stats[n]["seconds"]
+        print(f"{n:>3} workers: {seconds:.2f} s (speedup {base/seconds:.1f}x, efficiency {base/seconds/n*workers[0]:.0%})")
+    return(stats)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_ingest(args[1])
+    bench_workers(args[1])
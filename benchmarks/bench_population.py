@@ -0,0 +1,39 @@
+import sys
+import os
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pop_predict.predict import populationPredictor
+
+
+def bench_population(days=10000, first_year=2020):
+    """
+    Compare the population of the years of many days predicted day by day with predict and with
+    one call of predict_many.
+    """
+    pop = populationPredictor()
+    years = first_year + np.arange(days) // 365
+
+    start = time.perf_counter()
+    single = [pop.predict(int(year)) for year in years]
+    loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    many = pop.predict_many(years)
+    batch = time.perf_counter() - start
+
+    assert list(many) == single
+    print(f"{days} days: {loop*1e3:8.1f} ms day by day, {batch*1e3:6.2f} ms with predict_many")
+    return({"loop": loop, "batch": batch})
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    if len(args) > 1:
+        bench_population(int(args[1]))
+    else:
+        bench_population()
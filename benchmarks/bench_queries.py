@@ -0,0 +1,67 @@
+import sys
+import os
+import time
+import random
+import datetime as dt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB
+
+
+def time_range_queries(db, dates):
+    """
+    Run count_daily, get_type_stats and get_hourly_stats for all dates. Returns the mean
+    latency per query in milliseconds.
+    """
+    latency = {}
+    for name, method in [("count_daily", db.count_daily), ("get_type_stats", db.get_type_stats),
+                         ("get_hourly_stats", db.get_hourly_stats)]:
+        start = time.perf_counter()
+        for date in dates:
+            method(date)
+        latency.update({name: (time.perf_counter() - start)/len(dates)*1000})
+    return(latency)
+
+
+def time_dates_build(db, days):
+    """
+    Collect the daily info of the first days of the database. Returns the time needed in seconds.
+    """
+    start = time.perf_counter()
+    db._callDB__collect_dates_info(db.first_date, min(db.first_date + dt.timedelta(days=days-1), db.last_date))
+    return(time.perf_counter() - start)
+
+
+def bench_queries(db_file, samples=200, days=365):
+    """
+    Compare the latency of range queries and the time needed to build the dates table
+    without and with the indexes of the calls table.
+    """
+    db = callDB(db_file=db_file, load_only=True)
+    total_days = (db.last_date - db.first_date).days + 1
+    dates = [(db.first_date + dt.timedelta(days=random.randrange(total_days))).strftime("%Y-%m-%d")
+             for i in range(samples)]
+
+    results = {}
+    for indexed in [False, True]:
+        if indexed:
+            db.create_indexes()
+        else:
+            db.drop_indexes()
+        latency = time_range_queries(db, dates)
+        latency.update({"dates_build": time_dates_build(db, days)})
+        results.update({indexed: latency})
+
+    print(f"{db.count_between()} calls in {total_days} days")
+    for name in results[True].keys():
+        unit = "s" if name == "dates_build" else "ms"
+        print(f"{name:>18}: {results[False][name]:10.3f} {unit} without indexes, {results[True][name]:10.3f} {unit} with indexes")
+    return(results)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_queries(args[1])
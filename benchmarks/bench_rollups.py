@@ -0,0 +1,64 @@
+import sys
+import os
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB, DAY_END
+
+
+def bench_rollups(db_file, repeat=5):
+    """
+    Compare dashboard queries over the full history answered by a GROUP BY over the calls table
+    and by the rollup tables, and check that both give the same numbers. The scans use the day
+    bounds of the dates table (see DAY_END), which the rollups mirror.
+    """
+    db = callDB(db_file=db_file, load_only=True)
+    days = f"hour*3600 + minute*60 + second < {DAY_END}"
+
+    def by_type(rows):
+        result = {}
+        for year, month, call_type, cnt in rows:
+            result.setdefault(f"{year:04d}-{month:02d}", Counter()).update({call_type: cnt})
+        return(result)
+
+    queries = [("calls per month", f"SELECT year, month, COUNT(*) FROM calls WHERE {days} GROUP BY year, month;",
+                lambda rows: {f"{year:04d}-{month:02d}": cnt for year, month, cnt in rows},
+                lambda: db.get_rollup("month")),
+               ("calls per year", f"SELECT year, COUNT(*) FROM calls WHERE {days} GROUP BY year;",
+                lambda rows: {f"{year:04d}": cnt for year, cnt in rows},
+                lambda: db.get_rollup("year")),
+               ("calls per month and type", f"SELECT year, month, type, COUNT(*) FROM calls WHERE {days} GROUP BY year, month, type;",
+                by_type,
+                lambda: db.get_rollup("month", by_type=True)),
+               ("calls in range", f"SELECT COUNT(*) FROM calls WHERE {days};",
+                lambda rows: rows[0][0],
+                lambda: db.count_days(db.first_date, db.last_date))]
+
+    results = {}
+    for name, query, convert, rollup in queries:
+        start = time.perf_counter()
+        for i in range(repeat):
+            expected = db.query_db(query)
+        scan = (time.perf_counter() - start)/repeat*1e3
+
+        start = time.perf_counter()
+        for i in range(repeat):
+            result = rollup()
+        fast = (time.perf_counter() - start)/repeat*1e3
+
+        assert result == convert(expected), name
+
+        results.update({name: (scan, fast)})
+        print(f"{name:>24}: {scan:9.2f} ms scan, {fast:7.2f} ms rollup")
+
+    db.close()
+    return(results)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_rollups(args[1])
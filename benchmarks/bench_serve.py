@@ -0,0 +1,73 @@
+import sys
+import os
+import time
+import json
+import random
+import threading
+import urllib.request
+import datetime as dt
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB
+from serve import callsPredictor, create_server
+
+
+def bench_serve(db_file, requests=2000, clients=8, batch=30):
+    """
+    Load test of the prediction server. The server is started in this process and a pool of
+    clients sends single GET requests, single POST requests and batch requests of a number of
+    dates. Reports the p50/p99 latency and the number of requests per second.
+    """
+    db = callDB(db_file=db_file, load_only=True)
+    server = create_server(callsPredictor(db), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    random.seed(0)
+    days = [(dt.date(2024, 1, 1) + dt.timedelta(days=random.randint(0, 365))).strftime("%Y-%m-%d") for i in range(requests)]
+
+    def get(day):
+        start = time.perf_counter()
+        with urllib.request.urlopen(f"{url}/predict?date={day}&TMAX={random.randint(0, 30)}") as response:
+            json.loads(response.read())
+        return(time.perf_counter() - start)
+
+    def post(day):
+        start = time.perf_counter()
+        body = json.dumps({"date": day, "weather": {"PRCP": 5}}).encode()
+        with urllib.request.urlopen(urllib.request.Request(f"{url}/predict", data=body)) as response:
+            json.loads(response.read())
+        return(time.perf_counter() - start)
+
+    def post_batch(day):
+        start = time.perf_counter()
+        first = dt.date.fromisoformat(day)
+        body = json.dumps({"requests": [{"date": (first + dt.timedelta(days=i)).strftime("%Y-%m-%d")} for i in range(batch)]}).encode()
+        with urllib.request.urlopen(urllib.request.Request(f"{url}/predict/batch", data=body)) as response:
+            json.loads(response.read())
+        return(time.perf_counter() - start)
+
+    results = {}
+    for name, client, n in [("GET /predict", get, requests), ("POST /predict", post, requests),
+                            (f"POST /predict/batch ({batch} dates)", post_batch, requests//batch)]:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            latencies = np.array(list(pool.map(client, days[:n])))*1e3
+        elapsed = time.perf_counter() - start
+        results.update({name: {"p50": np.percentile(latencies, 50), "p99": np.percentile(latencies, 99), "rps": n/elapsed}})
+        print(f"{name:>30}: p50 {results[name]['p50']:6.1f} ms, p99 {results[name]['p99']:6.1f} ms, {n/elapsed:7.1f} requests/s")
+
+    server.shutdown()
+    server.server_close()
+    db.close()
+    return(results)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_serve(args[1])
@@ -0,0 +1,61 @@
+import sys
+import os
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from call_db.calls import callDB, _haversine
+
+
+def bench_spatial(db_file, queries=200, radius=1000, days=30):
+    """
+    Compare radius queries ("calls within 1 km of a point") answered by a full scan of the calls
+    table with a haversine filter and by the spatial index, without and with a time range of
+    days days. The points are coordinates of random calls.
+    """
+    db = callDB(db_file=db_file, load_only=True)
+    random.seed(0)
+    points = db.query_db("SELECT lat, lon FROM calls WHERE lat IS NOT NULL ORDER BY random() LIMIT ?;", (queries,))
+    starts = [random.randint(db.first_timestamp, max(db.first_timestamp, db.last_timestamp - days*86400)) for i in range(queries)]
+
+    results = {}
+    for time_range in [False, True]:
+        bounds = [(ts, ts + days*86400) if time_range else (None, None) for ts in starts]
+        name = f"{days} days" if time_range else "all time"
+
+        start = time.perf_counter()
+        scan = []
+        for (lat, lon), (start_ts, end_ts) in zip(points, bounds):
+            query = "SELECT id, lat, lon FROM calls WHERE lat IS NOT NULL"
+            data = ()
+            if time_range:
+                query += " AND timestamp >= ? AND timestamp < ?"
+                data = (start_ts, end_ts)
+            rows = db.query_db(query + ";", data)
+            scan.append(sorted([row[0] for row in rows if _haversine(lat, lon, row[1], row[2]) <= radius]))
+        full = (time.perf_counter() - start)/queries*1e3
+
+        start = time.perf_counter()
+        indexed = [db.find_calls_near(lat, lon, radius, start_ts=start_ts, end_ts=end_ts) for (lat, lon), (start_ts, end_ts) in zip(points, bounds)]
+        index = (time.perf_counter() - start)/queries*1e3
+
+        assert scan == [sorted([row[0] for row in result]) for result in indexed]
+        results.update({(name, "scan"): full, (name, "index"): index})
+        print(f"{name:>10}: {full:8.2f} ms per query with a full scan, {index:6.2f} ms with the spatial index")
+
+    start = time.perf_counter()
+    for lat, lon in points:
+        db.nearest_calls(lat, lon, 10)
+    results.update({("all time", "nearest"): (time.perf_counter() - start)/queries*1e3})
+    print(f"{'nearest':>10}: {results[('all time', 'nearest')]:8.2f} ms per query for the 10 nearest calls")
+
+    db.close()
+    return(results)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    bench_spatial(args[1])
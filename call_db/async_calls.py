@@ -0,0 +1,103 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from call_db.calls import callDB
+
+
+class asyncCallDB:
+    """
+    The asyncCallDB class provides awaitable queries of an existing callDB database for asyncio
+    applications. Read queries run on a bounded pool of threads, each with its own read-only
+    connection, so they never block the event loop. Writes are serialized by a single writer
+    thread with its own connection.
+    """
+
+    def __init__(self, db_file='calls.db', readers=4, cache_size=1024):
+        """
+        Open an existing database.
+        - db_file='calls.db': name of the database file.
+        - readers=4: number of threads (and read-only connections) running read queries.
+        - cache_size=1024: size of the cache of the per-date methods, see callDB.
+        """
+        # The writer is opened first, so databases of older versions are migrated.
+        self.writer = callDB(db_file=db_file, load_only=True, cache_size=0)
+        self.reader = callDB(db_file=db_file, load_only=True, cache_size=cache_size, read_only=True)
+        self.db_file = db_file
+        self.__readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="callDB-reader")
+        self.__writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="callDB-writer")
+
+    async def __read(self, method, *args, **kwargs):
+        """
+        Run a method of the reader on the pool of reader threads.
+        """
+        loop = asyncio.get_running_loop()
+        return(await loop.run_in_executor(self.__readers, functools.partial(method, *args, **kwargs)))
+
+    async def query_db(self, query, data=()):
+        """ Perform a SQL query on the database and return results """
+        return(await self.__read(self.reader.query_db, query, data))
+
+    async def count_between(self, start=None, end=None, start_ts=None, end_ts=None, call_type=None):
+        """ Awaitable version of callDB.count_between. """
+        return(await self.__read(self.reader.count_between, start, end, start_ts, end_ts, call_type))
+
+    async def count_daily(self, date=None, date_tuple=None, timestamp=None):
+        """ Awaitable version of callDB.count_daily. """
+        return(await self.__read(self.reader.count_daily, date, date_tuple, timestamp))
+
+    async def get_date_details(self, date, type_stats=True, hourly_stats=True):
+        """ Awaitable version of callDB.get_date_details. """
+        return(await self.__read(self.reader.get_date_details, date, type_stats, hourly_stats))
+
+    async def get_weather(self, date):
+        """ Awaitable version of callDB.get_weather. """
+        return(await self.__read(self.reader.get_weather, date))
+
+    async def get_covid_info(self, date):
+        """ Awaitable version of callDB.get_covid_info. """
+        return(await self.__read(self.reader.get_covid_info, date))
+
+    async def get_type_stats(self, date=None, start_ts=None, end_ts=None):
+        """ Awaitable version of callDB.get_type_stats. """
+        return(await self.__read(self.reader.get_type_stats, date, start_ts, end_ts))
+
+    async def get_hourly_stats(self, date=None, start_ts=None, end_ts=None):
+        """ Awaitable version of callDB.get_hourly_stats. """
+        return(await self.__read(self.reader.get_hourly_stats, date, start_ts, end_ts))
+
+    async def find_calls_in_box(self, min_lat, max_lat, min_lon, max_lon, start=None, end=None, start_ts=None, end_ts=None, call_type=None):
+        """ Awaitable version of callDB.find_calls_in_box. """
+        return(await self.__read(self.reader.find_calls_in_box, min_lat, max_lat, min_lon, max_lon, start, end, start_ts, end_ts, call_type))
+
+    async def find_calls_near(self, lat, lon, radius, start=None, end=None, start_ts=None, end_ts=None, call_type=None):
+        """ Awaitable version of callDB.find_calls_near. """
+        return(await self.__read(self.reader.find_calls_near, lat, lon, radius, start, end, start_ts, end_ts, call_type))
+
+    async def nearest_calls(self, lat, lon, k=10, start=None, end=None, start_ts=None, end_ts=None, call_type=None, radius=250):
+        """ Awaitable version of callDB.nearest_calls. """
+        return(await self.__read(self.reader.nearest_calls, lat, lon, k, start, end, start_ts, end_ts, call_type, radius))
+
+    async def write_db(self, query, data=(), dates=None):
+        """
+        Perform a SQL command on the writer thread and commit it. Pass the list of dates
+        ('YYYY-MM-DD') changed by the command as dates to keep the cached results of other dates.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.__writer, functools.partial(self.writer.write_db, query, data, True, dates))
+        self.reader.invalidate(dates)
+
+    def close(self):
+        """
+        Wait for running queries and close all connections.
+        """
+        self.__readers.shutdown(wait=True)
+        self.__writer.shutdown(wait=True)
+        self.reader.close()
+        self.writer.close()
+
+    async def __aenter__(self):
+        return(self)
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
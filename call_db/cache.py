@@ -0,0 +1,94 @@
+import copy
+import datetime as dt
+import threading
+from collections import OrderedDict
+
+
+def date_key(date):
+    """
+    Returns the date of a date, a datetime or a string ('YYYY-MM-DD', optionally followed by a
+    time) as 'YYYY-MM-DD'. Entries and invalidations use this key, so all forms of a date match.
+    """
+    if isinstance(date, dt.date):
+        return(date.strftime("%Y-%m-%d"))
+    return(str(date)[:10])
+
+
+class dateCache:
+    """
+    The dateCache class is a bounded least recently used (LRU) cache for results of callDB
+    methods which belong to a date. Entries can be invalidated per date. Results are stored
+    and returned as deep copies, so callers cannot modify cached entries.
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        Create an empty cache.
+        - maxsize=1024: maximal number of entries. The cache is disabled if maxsize is 0.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__keys_by_date = {}
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Look up a key. Returns a tuple (hit, value) where value is a copy of the cached result.
+        """
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return(True, copy.deepcopy(self.__entries[key][1]))
+            self.misses += 1
+            return(False, None)
+
+    def put(self, key, date, value):
+        """
+        Store a copy of value for key. The entry is invalidated if date is invalidated.
+        """
+        if self.maxsize <= 0:
+            return
+        date = date_key(date)
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+            self.__entries[key] = (date, copy.deepcopy(value))
+            self.__keys_by_date.setdefault(date, set()).add(key)
+
+            # Remove the least recently used entries.
+            while len(self.__entries) > self.maxsize:
+                self.__remove(next(iter(self.__entries)))
+
+    def invalidate(self, dates=None):
+        """
+        Remove all entries of the given dates (an iterable of dates, datetimes or date strings,
+        see date_key). All entries are removed if dates is None.
+        """
+        with self.__lock:
+            if dates == None:
+                self.__entries.clear()
+                self.__keys_by_date.clear()
+                return
+            for date in set([date_key(date) for date in dates]):
+                for key in self.__keys_by_date.pop(date, set()):
+                    del self.__entries[key]
+
+    def info(self):
+        """
+        Returns a dictionary with the number of hits and misses, the current size and the maximal size.
+        """
+        with self.__lock:
+            return({"hits": self.hits, "misses": self.misses, "size": len(self.__entries), "maxsize": self.maxsize})
+
+    def __remove(self, key):
+        """
+        Remove a single entry.
+        """
+        date, value = self.__entries.pop(key)
+        keys = self.__keys_by_date[date]
+        keys.discard(key)
+        if len(keys) == 0:
+            del self.__keys_by_date[date]
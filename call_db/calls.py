@@ -1,11 +1,168 @@
 import sqlite3
 import csv
+import io
+import os
+import pathlib
 import datetime as dt
 import time
-from collections import Counter
+import math
+import itertools
+import threading
+import weakref
+from contextlib import contextmanager
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 import holidays
 import json
+import hashlib
+import numpy as np
+import pandas as pd
 
+from call_db.cache import dateCache, date_key
+from call_db.count_index import countIndex
+from pop_predict.predict import shared_predictor
+
+
+# End of a day in seconds after midnight (exclusive). Days range from 00:00:00 to 23:59:59, so
+# calls at 23:59:59 are not counted in the daily data. All day bounds are derived from this value,
+# see callDB.__date_to_ts and callDB.__day_condition.
+DAY_END = 86399
+
+# Mean radius of the earth in meters, used for the radius queries of the spatial index.
+EARTH_RADIUS = 6371008.8
+
+
+def _convert_call_row(row, wa_holidays, date_min=None, date_max=None):
+    """
+    Convert a row of the csv-file containing 911-calls to a tuple which can be written to the
+    calls table. Returns None if the call is not between date_min and date_max.
+    """
+
+    # Convert time.
+    t = dt.datetime.strptime(row[2], "%m/%d/%Y %I:%M:%S %p")
+    ts = int(t.timestamp())
+
+    # Check if date is within boundaries.
+    if date_min != None and t < date_min:
+        return(None)
+    if date_max != None and t > date_max:
+        return(None)
+
+    # Try to convert coordinates to float.
+    try:
+        lat = float(row[3])
+        lon = float(row[4])
+    except ValueError:
+        lat,lon=None,None
+
+    # Check if the date is a holiday.
+    hd_name = None
+    if t in wa_holidays:
+        hd_name = wa_holidays.get(t)
+
+    return((row[6], row[0], t.strftime("%Y-%m-%d"), row[1], t.year,
+            t.month, t.day, t.weekday(), t.hour, t.minute, t.second,
+            hd_name, ts, lat, lon))
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """
+    Returns the great-circle distance in meters between two points given in degrees.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1)/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin((lon2 - lon1)/2)**2
+    return(2*EARTH_RADIUS*math.asin(min(1.0, math.sqrt(a))))
+
+
+class _connectionHolder:
+    """
+    Holds the connection of a thread in a threading.local object. The holder is deleted when
+    the thread ends, which closes the connection, see _release_connection.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+
+def _release_connection(connection, connections, lock):
+    """
+    Commit and close the connection of a finished thread and remove it from the list of open
+    connections, unless it was already closed by callDB.close.
+    """
+    with lock:
+        if connection in connections:
+            connections.remove(connection)
+            connection.commit()
+            connection.close()
+
+
+def _shard_offsets(csvfile, shards):
+    """
+    Split a csv-file into byte ranges of roughly equal size. Every range starts at the beginning
+    of a record: a range only ends at a line break outside of quoted fields, which is detected by
+    counting quotation marks. The header line is not part of any range.
+    Returns a list of offsets, range i is offsets[i]:offsets[i+1].
+    """
+    size = os.path.getsize(csvfile)
+    with open(csvfile, 'rb') as f:
+        f.readline()
+        offsets = [f.tell()]
+        pos = offsets[0]
+        quotes = 0
+        for k in range(1, shards):
+            target = offsets[0] + (size - offsets[0])*k//shards
+            if target <= pos:
+                continue
+
+            # Count the quotation marks up to the target position.
+            while pos < target:
+                block = f.read(min(target - pos, 1 << 24))
+                quotes += block.count(b'"')
+                pos += len(block)
+
+            # Move on to the next line break outside of quoted fields.
+            while True:
+                line = f.readline()
+                quotes += line.count(b'"')
+                pos += len(line)
+                if len(line) == 0 or quotes % 2 == 0:
+                    break
+            if pos < size:
+                offsets.append(pos)
+        offsets.append(size)
+    return(offsets)
+
+
+def _parse_shard(args):
+    """
+    Parse the byte range start:end of a csv-file containing 911-calls. Used by the worker processes
+    of the parallel engine. Returns the list of tuples for the calls table and the names of the
+    holidays in the order of their first appearance.
+    """
+    csvfile, start, end, dmin, dmax = args
+
+    wa_holidays = holidays.country_holidays('US', subdiv="WA")
+    date_min = None
+    date_max = None
+    if dmin != None:
+        date_min = dt.datetime.strptime(dmin,"%Y-%m-%d")
+    if dmax != None:
+        date_max = dt.datetime.strptime(dmax,"%Y-%m-%d")
+
+    with open(csvfile, 'rb') as f:
+        f.seek(start)
+        raw = f.read(end - start)
+
+    # Decode the bytes in the same way as a file opened in text mode.
+    data = []
+    holiday_names = []
+    for row in csv.reader(io.TextIOWrapper(io.BytesIO(raw))):
+        entry = _convert_call_row(row, wa_holidays, date_min, date_max)
+        if entry == None:
+            continue
+        if entry[11] != None and entry[11] not in holiday_names:
+            holiday_names.append(entry[11])
+        data.append(entry)
+    return(data, holiday_names)
 
 
 class callDB:
@@ -16,7 +173,7 @@ class callDB:
     """
 
     
-    def __init__(self, csvfile=None, db_file='calls.db', weather_data=None, covid_data=None, rebuild=False, load_only=False, dmin=None, dmax=None):
+    def __init__(self, csvfile=None, db_file='calls.db', weather_data=None, covid_data=None, rebuild=False, load_only=False, dmin=None, dmax=None, batch_size=10000, engine="stream", workers=None, cache_size=1024, read_only=False):
         """
         Create the database and fetch data from source csv file.
         - csvfile=None: name of the csv file containing emergency call data. Be sure to download a
@@ -28,24 +185,22 @@ class callDB:
           already existing entries will be skipped and not updated.
         - load_only=False: when true, an existing database file will be loaded and no new data is read.
           In that case the csfile can be omitted.
+        - dmin=None, dmax=None: only calls between these dates (given as 'YYYY-MM-DD') are stored.
+        - batch_size=10000: number of rows written to the database per transaction while the csv file
+          is streamed into the database. Memory usage is bounded by the batch size and not by the size
+          of the csv file.
+        - engine="stream": backend used to parse the csv file. "stream" parses the file row by row,
+          "columnar" parses it in large chunks column-wise with pandas/numpy, which is much faster.
+          "parallel" splits the file into byte ranges which are parsed by a pool of processes.
+        - workers=None: number of worker processes of the parallel engine. Defaults to the number of CPUs.
+        - cache_size=1024: number of results of get_date_details, get_weather, get_covid_info,
+          count_daily and get_type_stats kept in memory. Set to 0 to disable the cache.
+        - read_only=False: open the connections to the database read-only. Requires load_only.
         """
 
-        # Load historical population data for Seattle. Source:
-        # https://www.macrotrends.net/cities/23140/seattle/population
-        self.population = {2024: 3549000, 2023: 3519000, 2022: 3489000, 2021: 3461000, 2020: 3433000,
-                        2019: 3406000, 2018: 3379000, 2017: 3339000, 2016: 3299000, 2015: 3259000,
-                        2014: 3220000, 2013: 3182000, 2012: 3143000, 2011: 3106000, 2010: 3069000,
-                        2009: 3032000, 2008: 2996000, 2007: 2960000, 2006: 2924000, 2005: 2889000,
-                        2004: 2855000, 2003: 2820000, 2002: 2787000, 2001: 2753000, 2000: 2720000,
-                        1999: 2669000, 1998: 2613000, 1997: 2559000, 1996: 2505000, 1995: 2453000,
-                        1994: 2401000, 1993: 2351000, 1992: 2302000, 1991: 2253000, 1990: 2206000,
-                        1989: 2160000, 1988: 2114000, 1987: 2069000, 1986: 2025000, 1985: 1982000,
-                        1984: 1940000, 1983: 1899000, 1982: 1858000, 1981: 1819000, 1980: 1780000,
-                        1979: 1753000, 1978: 1730000, 1977: 1707000, 1976: 1685000, 1975: 1663000,
-                        1974: 1641000, 1973: 1619000, 1972: 1598000, 1971: 1577000, 1970: 1556000,
-                        1969: 1509000, 1968: 1456000, 1967: 1404000, 1966: 1354000, 1965: 1305000,
-                        1964: 1259000, 1963: 1214000, 1962: 1171000, 1961: 1129000, 1960: 1089000,
-                        1959: 1054000, 1958: 1021000}
+        # Population model shared with the feature functions, see pop_predict/predict.py.
+        self.pop = shared_predictor()
+        self.population = self.pop.population
 
         # Translation of weather condidition codes. For further details see https://www1.ncdc.noaa.gov/pub/data/ghcn/daily/readme.txt.
         self.weather_cond_dict = {"WT01" : "Fog, ice fog, or freezing fog (may include heavy fog)",
@@ -72,7 +227,13 @@ class callDB:
 
         # Set the database version to make sure that we use a compatible database if the 
         # load_only flag is set to True
-        self.__version = "v0.3.0"
+        self.__version = "v0.8.0"
+
+        # Indexes of the calls table with the indexed columns. Range queries on the timestamp
+        # can be answered from the covering indexes without reading the table.
+        self.__indexes = {"calls_timestamp": "timestamp",
+                          "calls_timestamp_type": "timestamp, type",
+                          "calls_timestamp_hour": "timestamp, hour"}
         
         # Boolean variables to indicate if the database contains weather/covid information.
         # Set to False a priori.
@@ -80,6 +241,26 @@ class callDB:
         self.covid_info = False
 
         self.db_file = db_file
+        self.read_only = read_only
+        if read_only and not load_only:
+            raise ValueError("A read-only database must be opened with load_only=True.")
+
+        # Every thread uses its own long-lived connection to the database. The connections are
+        # created on first use and closed by close().
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__connections = []
+
+        # Results of the per-date methods are cached. Writes invalidate the entries of the dates
+        # they touch.
+        self.cache = dateCache(cache_size)
+
+        # In-memory index of the cumulative number of calls, see build_count_index. The number of
+        # changes of the data is counted to rebuild the index lazily. The lock guards building
+        # and replacing the index, so concurrent lookups build it only once.
+        self.__count_index = None
+        self.__count_index_lock = threading.Lock()
+        self.__data_changes = 0
         
         # Create a holiday object to determine if a given date is a holiday.
         self.wa_holidays = holidays.country_holidays('US', subdiv="WA")
@@ -91,15 +272,16 @@ class callDB:
         # Check if the load_only flag is set to true.
         if load_only:
             
-            # First validate thhe database version.
-            if not self.__verify_version():
+            # First validate thhe database version. Databases of older versions are migrated,
+            # unless the database is opened read-only.
+            if not self.__verify_version() and (read_only or not self.__migrate()):
                 raise ValueError("Wrong database version. Clear database or rebuild!")
 
             # Build the holiday dictionary.
             self.__build_holiday_dict()
 
             # Check if the database contains weather data.
-            if "weather" in [col[1] for col in self.query_db("PRAGMA table_info(dates)")]:
+            if "weather" in [col[1] for col in self.query_db("PRAGMA table_list")]:
                 self.weather_info = True
 
             # Check if the database contains covid data.
@@ -119,12 +301,40 @@ class callDB:
         # Initiate the database
         self.__init_db(rebuild=rebuild)
 
-        # Parse the csv file containing the 911-calls and write to db.
+        # Remember the last row of the calls table to find the new calls after the ingest.
+        last_rowid = self.query_db("SELECT IFNULL(MAX(rowid), 0) FROM calls;")[0][0]
+
+        # Drop the indexes of an empty calls table. Loading into an unindexed table and building
+        # the indexes afterwards is much faster than updating them for every inserted row. When
+        # calls are appended to an existing database, the indexes are kept and updated, so they
+        # are not rebuilt over all calls.
+        bulk_load = last_rowid == 0
+        if bulk_load:
+            self.drop_indexes()
+            self.__drop_spatial_triggers()
+
+        # Parse the csv file containing the 911-calls and stream the rows to the db in batches.
         print("Parsing input file...")
-        call_data = self.__parse_csv(csvfile, dmin=dmin, dmax=dmax)
-        self.__write_to_db("calls", call_data)
+        if engine == "stream":
+            call_data = self.__parse_csv(csvfile, dmin=dmin, dmax=dmax)
+        elif engine == "columnar":
+            call_data = self.__parse_csv_columnar(csvfile, dmin=dmin, dmax=dmax)
+        elif engine == "parallel":
+            call_data = self.__parse_csv_parallel(csvfile, dmin=dmin, dmax=dmax, workers=workers)
+        else:
+            raise ValueError(f"Unknown ingest engine '{engine}'.")
+        start = time.perf_counter()
+        rows = self.__write_to_db("calls", call_data, batch_size=batch_size, report=True)
+        self.ingest_stats = {"engine": engine, "rows": rows, "seconds": time.perf_counter() - start}
         print("Done.")
 
+        # Build the indexes of the calls table after the bulk load.
+        if bulk_load:
+            print("Building indexes...")
+            self.create_indexes()
+            print("Done.")
+        self.__update_spatial_index(new_since=last_rowid)
+
         # Set timestamp and date of first and last day in database.
         self.first_timestamp = self.query_db("SELECT MIN(timestamp) FROM calls;")[0][0]
         self.first_date = dt.date.fromtimestamp(self.first_timestamp)
@@ -134,7 +344,12 @@ class callDB:
 
         # Create the table with daily infos
         print("Collecting daily info...")
-        self.__create_dates_table()
+        self.__create_dates_table(new_since=last_rowid)
+        print("Done.")
+
+        # Add the new calls to the weekly, monthly and yearly rollups.
+        print("Updating rollups...")
+        self.__update_rollups()
         print("Done.")
 
         # Load weather data if specified.
@@ -154,78 +369,272 @@ class callDB:
         Parse a csv-file containing data and 911-calls. Data can be retrieved from
         https://data.seattle.gov/Public-Safety/Seattle-Real-Time-Fire-911-Calls/kzjm-xkqj
 
-        The output is a list containing tuples which can be written to the database.
+        This method is a generator yielding one tuple per call which can be written to the
+        database. The file is read row by row, so the whole file is never held in memory.
         """
 
-        # Initialize variables to count holidays (hd_cnt) and for the output data (data)
+        # Initialize variable to count holidays (hd_cnt).
         hd_cnt = 1
-        data = []
+
+        # Convert the date boundaries once instead of for every row.
+        date_min = None
+        date_max = None
+        if dmin != None:
+            date_min = dt.datetime.strptime(dmin,"%Y-%m-%d")
+        if dmax != None:
+            date_max = dt.datetime.strptime(dmax,"%Y-%m-%d")
 
         # Open the csv file and iterate over the rows of the file.
         with open(csvfile, 'r') as f:
             linereader = csv.reader(f)
-            firstline = True
-            for row in linereader:                   
-                # Initialize holiday variable to 0 which represents None or no holiday.
-                hd = 0
-                hd_name = None
-                
-                # The first line contains column names. Treat differently and verify that
-                # the file has the correct format.
-                if firstline:
-                    if row != ['Address', 'Type', 'Datetime', 'Latitude', 'Longitude', 'Report Location', 'Incident Number']:
-                        print("""
+
+            # The first line contains column names. Verify that the file has the correct format.
+            if next(linereader, None) != ['Address', 'Type', 'Datetime', 'Latitude', 'Longitude', 'Report Location', 'Incident Number']:
+                print("""
 The csv file seems to be malformed. 
 Did you download the correct file from https://data.seattle.gov/Public-Safety/Seattle-Real-Time-Fire-911-Calls/kzjm-xkqj ?
-                        """)
-                        conn.close()
-                        raise(ValueError)         
-                           
-                    firstline = False
-                else:
-                    
-                    # Convert time.
-                    t = dt.datetime.strptime(row[2], "%m/%d/%Y %I:%M:%S %p")
-                    ts = int(t.timestamp())
-
-                    # Check if date is within boundaries.
-                    if dmin != None:
-                        date_min = dt.datetime.strptime(dmin,"%Y-%m-%d")
-                        if t < date_min:
-                            continue
-                    if dmax != None:
-                        date_max = dt.datetime.strptime(dmax,"%Y-%m-%d")
-                        if t > date_max:
-                            continue
-
-                    # Try to convert coordinates to float.
-                    try:
-                        lat = float(row[3])
-                        lon = float(row[4])
-                    except ValueError:
-                        lat,lon=None,None
-
-                    # Check if the date is a holiday and update the holiday_dict accordingly
-                    if t in self.wa_holidays:
-                        hd_name = self.wa_holidays.get(t)
-                        if hd_name in self.holiday_dict.keys():
-                            hd = self.holiday_dict[hd_name]
-                        else:
-                            self.holiday_dict.update({hd_name: hd_cnt})
-                            hd = hd_cnt
-                            hd_cnt += 1                            
-
-                    # Append tuple to data-list.
-                    data.append((row[6], row[0], t.strftime("%Y-%m-%d"), row[1], t.year,
-                                 t.month, t.day, t.weekday(), t.hour, t.minute, t.second,
-                                 hd_name, ts, lat, lon))
-        return(data)
-
-    def __write_to_db(self, table, data, connection=None, cursor=None):
+                """)
+                raise(ValueError)
+
+            for row in linereader:
+                entry = _convert_call_row(row, self.wa_holidays, date_min, date_max)
+                if entry == None:
+                    continue
+
+                # Update the holiday_dict if the holiday is not yet in the dictionary.
+                hd_name = entry[11]
+                if hd_name != None and hd_name not in self.holiday_dict.keys():
+                    self.holiday_dict.update({hd_name: hd_cnt})
+                    hd_cnt += 1
+
+                # Yield the tuple for this call.
+                yield(entry)
+
+    def __parse_csv_parallel(self, csvfile, dmin=None, dmax=None, workers=None):
+        """
+        Parse a csv-file containing data and 911-calls with a pool of worker processes. The file
+        is split into byte ranges aligned to record boundaries and every range is parsed by a
+        worker. The results are yielded in the order of the file, so the output is the same as
+        the output of __parse_csv.
+
+        Only a few ranges per worker are in flight at any time which bounds memory usage.
+        """
+
+        # Initialize variable to count holidays (hd_cnt).
+        hd_cnt = 1
+
+        if workers == None:
+            workers = os.cpu_count()
+
+        # Verify that the file has the correct format.
+        with open(csvfile, 'r') as f:
+            header = next(csv.reader(f), None)
+        if header != ['Address', 'Type', 'Datetime', 'Latitude', 'Longitude', 'Report Location', 'Incident Number']:
+            print("""
+The csv file seems to be malformed. 
+Did you download the correct file from https://data.seattle.gov/Public-Safety/Seattle-Real-Time-Fire-911-Calls/kzjm-xkqj ?
+            """)
+            raise(ValueError)
+
+        # Split the file into four ranges per worker.
+        offsets = _shard_offsets(csvfile, 4*workers)
+        shards = [(csvfile, offsets[i], offsets[i+1], dmin, dmax) for i in range(len(offsets)-1)]
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+
+            # Keep two ranges per worker in flight and collect the results in order.
+            pending = deque()
+            shards = iter(shards)
+            for shard in itertools.islice(shards, 2*workers):
+                pending.append(pool.submit(_parse_shard, shard))
+            while len(pending) > 0:
+                data, holiday_names = pending.popleft().result()
+                for shard in itertools.islice(shards, 1):
+                    pending.append(pool.submit(_parse_shard, shard))
+
+                # Update the holiday_dict in the order of first appearance.
+                for hd_name in holiday_names:
+                    if hd_name not in self.holiday_dict.keys():
+                        self.holiday_dict.update({hd_name: hd_cnt})
+                        hd_cnt += 1
+
+                yield from data
+
+    def __parse_csv_columnar(self, csvfile, dmin=None, dmax=None, chunksize=200000):
+        """
+        Parse a csv-file containing data and 911-calls column-wise. The file is read in chunks
+        of chunksize rows with pandas and all conversions (timestamps, coordinates, date parts and
+        holidays) are done as array operations.
+
+        This method is a generator yielding the same tuples as __parse_csv.
+        """
+
+        # Initialize variable to count holidays (hd_cnt).
+        hd_cnt = 1
+
+        # Verify that the file has the correct format.
+        header = list(pd.read_csv(csvfile, nrows=0).columns)
+        if header != ['Address', 'Type', 'Datetime', 'Latitude', 'Longitude', 'Report Location', 'Incident Number']:
+            print("""
+The csv file seems to be malformed. 
+Did you download the correct file from https://data.seattle.gov/Public-Safety/Seattle-Real-Time-Fire-911-Calls/kzjm-xkqj ?
+            """)
+            raise(ValueError)
+
+        # Convert the date boundaries to seconds since epoch of the naive local time.
+        epoch = dt.datetime(1970,1,1)
+        if dmin != None:
+            naive_min = (dt.datetime.strptime(dmin,"%Y-%m-%d") - epoch) // dt.timedelta(seconds=1)
+        if dmax != None:
+            naive_max = (dt.datetime.strptime(dmax,"%Y-%m-%d") - epoch) // dt.timedelta(seconds=1)
+
+        # Read the text columns as strings and keep empty fields as empty strings. The report
+        # location is not stored and therefore skipped.
+        reader = pd.read_csv(csvfile, usecols=['Address', 'Type', 'Datetime', 'Latitude', 'Longitude', 'Incident Number'],
+                             dtype={'Address': str, 'Type': str, 'Datetime': str, 'Incident Number': str},
+                             keep_default_na=False, na_values={'Latitude': [""], 'Longitude': [""]},
+                             chunksize=chunksize)
+        for chunk in reader:
+
+            # Convert time for the whole column at once.
+            t = self.__split_datetimes(chunk["Datetime"])
+
+            # Check if dates are within boundaries.
+            mask = np.ones(len(chunk), dtype=bool)
+            if dmin != None:
+                mask &= t["naive_ts"] >= naive_min
+            if dmax != None:
+                mask &= t["naive_ts"] <= naive_max
+            if not mask.all():
+                chunk = chunk[mask]
+                t = {key: value[mask] for key, value in t.items()}
+            if len(chunk) == 0:
+                continue
+
+            # Dates and holidays are only determined once for every distinct day in the chunk.
+            day_codes, days = pd.factorize(t["naive_ts"] // 86400)
+            day_strs = []
+            day_holidays = []
+            for d in days:
+                day = dt.date(1970,1,1) + dt.timedelta(days=int(d))
+                day_strs.append(day.strftime("%Y-%m-%d"))
+                hd_name = None
+
+                # Check if the date is a holiday and update the holiday_dict accordingly
+                if day in self.wa_holidays:
+                    hd_name = self.wa_holidays.get(day)
+                    if hd_name not in self.holiday_dict.keys():
+                        self.holiday_dict.update({hd_name: hd_cnt})
+                        hd_cnt += 1
+                day_holidays.append(hd_name)
+            day_strs = np.array(day_strs, dtype=object)[day_codes]
+            day_holidays = np.array(day_holidays, dtype=object)[day_codes]
+
+            # Convert local time to timestamps. The UTC offset is calculated at the beginning and the
+            # end of every distinct day. Only for the few days on which it changes (daylight saving time),
+            # it is calculated for every distinct hour.
+            start_offsets = self.__utc_offsets(days*86400)
+            end_offsets = self.__utc_offsets(days*86400 + 23*3600)
+            offsets = start_offsets[day_codes]
+            changing = np.isin(day_codes, np.flatnonzero(start_offsets != end_offsets))
+            if changing.any():
+                hour_codes, hours = pd.factorize(t["naive_ts"][changing] // 3600)
+                offsets[changing] = self.__utc_offsets(hours*3600)[hour_codes]
+            ts = t["naive_ts"] + offsets
+
+            # Convert coordinates to float. If one of them fails, both are set to None.
+            lat = pd.to_numeric(chunk["Latitude"], errors="coerce")
+            lon = pd.to_numeric(chunk["Longitude"], errors="coerce")
+            invalid = lat.isna() | lon.isna()
+
+            # Yield tuples built from the columns.
+            yield from zip(chunk["Incident Number"].tolist(),
+                           chunk["Address"].tolist(),
+                           day_strs.tolist(),
+                           chunk["Type"].tolist(),
+                           t["year"].tolist(),
+                           t["month"].tolist(),
+                           t["day"].tolist(),
+                           t["weekday"].tolist(),
+                           t["hour"].tolist(),
+                           t["minute"].tolist(),
+                           t["second"].tolist(),
+                           day_holidays.tolist(),
+                           ts.tolist(),
+                           lat.astype(object).where(~invalid, None).tolist(),
+                           lon.astype(object).where(~invalid, None).tolist())
+
+    def __split_datetimes(self, values):
+        """
+        Convert an array of strings of the form 'MM/DD/YYYY HH:MM:SS AM' to arrays of date and time
+        parts. Returns a dictionary of integer arrays with the keys year, month, day, weekday, hour,
+        minute, second and naive_ts (seconds since epoch of the naive local time).
+
+        Fixed-width strings are decoded directly from their bytes. Any other input is parsed
+        with pandas.to_datetime.
+        """
+        values = np.asarray(values, dtype=object)
+        fixed_width = len(values) > 0 and pd.Series(values).str.len().eq(22).all()
+
+        if fixed_width:
+            # Decode the digits byte-wise.
+            b = np.array(values, dtype="S22").view(np.uint8).reshape(-1, 22).astype(np.int64)
+            d = b - ord("0")
+            month = d[:,0]*10 + d[:,1]
+            day = d[:,3]*10 + d[:,4]
+            year = d[:,6]*1000 + d[:,7]*100 + d[:,8]*10 + d[:,9]
+            hour = d[:,11]*10 + d[:,12]
+            minute = d[:,14]*10 + d[:,15]
+            second = d[:,17]*10 + d[:,18]
+            pm = b[:,20] == ord("P")
+
+            # Validate separators, digits and ranges. Fall back to pandas otherwise.
+            digits = d[:, [0,1,3,4,6,7,8,9,11,12,14,15,17,18]]
+            valid = ((digits >= 0) & (digits <= 9)).all()
+            valid &= (b[:,[2,5]] == ord("/")).all() and (b[:,[13,16]] == ord(":")).all()
+            valid &= (b[:,[10,19]] == ord(" ")).all() and (b[:,21] == ord("M")).all()
+            valid &= ((b[:,20] == ord("A")) | pm).all()
+            valid &= ((hour >= 1) & (hour <= 12) & (minute < 60) & (second < 60)).all()
+            valid &= ((month >= 1) & (month <= 12) & (day >= 1)).all()
+            if valid:
+                hour = hour % 12 + 12*pm
+                days = ((year - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (month - 1)).astype("datetime64[D]") + (day - 1)
+
+                # Make sure the day exists within the month.
+                valid = ((days.astype("datetime64[M]") - days.astype("datetime64[Y]").astype("datetime64[M]")).astype(np.int64) + 1 == month).all()
+            fixed_width = valid
+
+        if not fixed_width:
+            t = pd.to_datetime(pd.Series(values, dtype=object), format="%m/%d/%Y %I:%M:%S %p")
+            year, month, day = t.dt.year.to_numpy(np.int64), t.dt.month.to_numpy(np.int64), t.dt.day.to_numpy(np.int64)
+            hour, minute, second = t.dt.hour.to_numpy(np.int64), t.dt.minute.to_numpy(np.int64), t.dt.second.to_numpy(np.int64)
+            days = t.dt.floor("D").to_numpy().astype("datetime64[D]")
+
+        days = days.astype(np.int64)
+        return({"year": year, "month": month, "day": day,
+                "weekday": (days + 3) % 7,  # 1970-01-01 was a Thursday.
+                "hour": hour, "minute": minute, "second": second,
+                "naive_ts": days*86400 + hour*3600 + minute*60 + second})
+
+    def __utc_offsets(self, naive_ts):
+        """
+        Return the difference between the timestamp and the naive local time (in seconds since
+        epoch) for an array of naive local times.
+        """
+        epoch = dt.datetime(1970,1,1)
+        return(np.array([int((epoch + dt.timedelta(seconds=int(s))).timestamp()) - int(s) for s in naive_ts],
+                        dtype=np.int64))
+
+    def __write_to_db(self, table, data, batch_size=None, report=False, connection=None, cursor=None):
         """
         Write data to database using the executemany method. The name of the table to insert the data
         and the data must be given. This method uses "INSERT OR IGNORE" so existing entries will not 
         be updated.
+
+        The data can be any iterable, e.g. a generator. If batch_size is given, the data is consumed in
+        batches of that size and every batch is written within its own transaction. If report is True,
+        the progress and the number of rows written per second are printed. Returns the number of rows
+        which were passed to the database.
         """
         # Get cursor and connection. Create if neccessary.
         cur,conn = self.__get_cursor(connection, cursor)
@@ -238,13 +647,60 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
         data_placeholder = "(" + ",".join(["?" for i in range(cols)]) + ")"
         sql_command = f"INSERT OR IGNORE INTO {table} VALUES {data_placeholder};"
 
-        # Execute command and commit changes to database.
-        cur.executemany(sql_command, data)
-        conn.commit()
+        # Consume the data batch by batch and write every batch within an explicit transaction.
+        data = iter(data)
+        rows = 0
+        start = time.perf_counter()
+        while True:
+            batch = list(itertools.islice(data, batch_size))
+            if len(batch) == 0:
+                break
+            with self.__batch(conn):
+                cur.executemany(sql_command, batch)
+            self.__invalidate_rows(table, batch)
+            if table == "calls":
+                self.__data_changes += 1
+            rows += len(batch)
+            if report:
+                rate = rows/max(time.perf_counter() - start, 1e-9)
+                print(f"Wrote {rows} rows to {table} ({rate:.0f} rows/s)", end="\r")
+
+        if report:
+            elapsed = time.perf_counter() - start
+            print(f"Wrote {rows} rows to {table} in {elapsed:.1f} s ({rows/max(elapsed, 1e-9):.0f} rows/s)")
+
+        return(rows)
+
+
+    def __invalidate_rows(self, table, rows):
+        """
+        Remove the cached results of the dates of rows written to a table. The whole cache is
+        cleared if the rows of the table do not belong to a date.
+        """
+        # Position of the date within the rows of the tables.
+        date_cols = {"calls": 2, "dates": 0, "covid": 0, "daily_type_counts": 0, "daily_hourly_counts": 0}
+        if table in date_cols:
+            self.cache.invalidate([row[date_cols[table]] for row in rows])
+        else:
+            self.cache.invalidate()
 
-        # Close connection if newly created.
-        if connection==None:
-            conn.close
+
+    def invalidate(self, dates=None):
+        """
+        Notify the object that the database was changed by another connection, e.g. another
+        callDB object or process. The cached results of the given dates ('YYYY-MM-DD'), or of all
+        dates if None, are removed and the count index is built again on its next use.
+        """
+        self.cache.invalidate(dates)
+        self.__data_changes += 1
+
+
+    def cache_info(self):
+        """
+        Returns a dictionary with the number of cache hits and misses, the number of cached results
+        and the maximal number of cached results.
+        """
+        return(self.cache.info())
         
 
             
@@ -271,17 +727,118 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
        
     def __create_connection(self):
         """ 
-        Create a database connection to a SQLite database 
+        Return the connection of the current thread to the SQLite database. The connection is
+        created on first use and then reused, so prepared statements stay cached. It is closed
+        when the thread ends.
+        """
+        holder = getattr(self.__local, "holder", None)
+        conn = None if holder == None else holder.connection
+        if conn == None:
+            try:
+                if self.read_only:
+                    uri = pathlib.Path(self.db_file).resolve().as_uri() + "?mode=ro"
+                    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256)
+                else:
+                    conn = sqlite3.connect(self.db_file, check_same_thread=False, cached_statements=256)
+            except sqlite3.Error as e:
+                print(e)
+                return(None)
+            # The connection is closed when the thread ends, so threads started per request
+            # do not leave open connections behind.
+            holder = _connectionHolder(conn)
+            weakref.finalize(holder, _release_connection, conn, self.__connections, self.__lock)
+            self.__local.holder = holder
+            with self.__lock:
+                self.__connections.append(conn)
+        return(conn)
+
+    def close(self):
+        """
+        Commit pending changes and close all connections to the database. A new connection is
+        opened if the database is used again.
+        """
+        with self.__lock:
+            for conn in self.__connections:
+                conn.commit()
+                conn.close()
+            self.__connections.clear()
+        self.__local = threading.local()
+        with self.__count_index_lock:
+            self.__close_count_index()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
         """
-        conn = None
+        Context manager for batch work. Yields the connection of the current thread within a
+        transaction, which is committed at the end of the block or rolled back on an exception.
+        Pass the connection to write_db to run several commands in the same transaction.
+        """
+        conn = self.__create_connection()
+
+        # A nested block joins the transaction of the outer block.
+        if self.__in_transaction(conn):
+            yield(conn)
+            return
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN;")
+        self.__local.transaction = conn
         try:
-            conn = sqlite3.connect(self.db_file)
-            #print(sqlite3.version)
-        except Error as e:
-            print(e)
+            yield(conn)
+        except BaseException:
+            conn.rollback()
+
+            # Results read within the transaction may have been cached and weather or covid
+            # data loaded within the transaction are gone.
+            self.cache.invalidate()
+            tables = [row[1] for row in self.query_db("PRAGMA table_list", connection=conn)]
+            self.weather_info = "weather" in tables
+            self.covid_info = "covid" in tables
+            raise
+        else:
+            conn.commit()
         finally:
-            if conn:
-                return(conn)
+            self.__local.transaction = None
+
+    def __in_transaction(self, conn):
+        """
+        Returns True if conn is the connection of a transaction() block of the current thread.
+        """
+        return(getattr(self.__local, "transaction", None) is conn)
+
+    def __commit(self, conn):
+        """
+        Commit conn, unless the changes belong to a transaction() block of the current thread.
+        """
+        if not self.__in_transaction(conn):
+            conn.commit()
+
+    @contextmanager
+    def __batch(self, conn):
+        """
+        Run a batch of writes on conn within one transaction. Within a transaction() block the
+        writes join its transaction, which is committed or rolled back at the end of the block.
+        Otherwise pending changes are committed and the batch is committed at the end.
+        """
+        if self.__in_transaction(conn):
+            yield
+            return
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN;")
+        try:
+            yield
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
 
     def __verify_version(self, connection=None, cursor=None):
         """
@@ -291,7 +848,7 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
         db_version = None
         try:
             result = self.query_db("SELECT * FROM version;", connection=conn, cursor=cur)
-        except OperationalError:
+        except sqlite3.OperationalError:
             return(False)
         if [(self.__version,)] == result:
             return(True)
@@ -301,6 +858,102 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
         
         
             
+    def __migrate(self):
+        """
+        Migrate a database created by an older version of callDB to the current version.
+        Returns True if the database has the current version afterwards.
+        """
+        try:
+            db_version = self.query_db("SELECT * FROM version;")[0][0]
+        except (sqlite3.OperationalError, IndexError):
+            return(False)
+
+        # v0.4.0 added the indexes of the calls table.
+        if db_version == "v0.3.0":
+            self.create_indexes()
+            db_version = "v0.4.0"
+
+        # v0.5.0 moved the weather data from a json column of the dates table to the weather table.
+        if db_version == "v0.4.0":
+            if "weather" in [col[1] for col in self.query_db("PRAGMA table_info(dates)")]:
+                self.__migrate_weather_column()
+            db_version = "v0.5.0"
+
+        # v0.6.0 replaced the details json column of the dates table by the tables of daily counts
+        # per type and per hour and fixed the order of the month, day and day_of_year columns.
+        if db_version == "v0.5.0":
+            self.__migrate_details_column()
+            db_version = "v0.6.0"
+
+        # v0.7.0 added the weekly, monthly and yearly rollup tables.
+        if db_version == "v0.6.0":
+            self.__update_rollups()
+            db_version = "v0.7.0"
+
+        # v0.8.0 added the spatial index of the call coordinates.
+        if db_version == "v0.7.0":
+            self.__update_spatial_index()
+            db_version = "v0.8.0"
+
+        if db_version != self.__version:
+            return(False)
+
+        self.write_db("UPDATE version SET id = ?;", (db_version,))
+        return(True)
+
+    def __migrate_weather_column(self, connection=None, cursor=None):
+        """
+        Move the weather data stored as json strings in the weather column of the dates table
+        to the weather table and drop the column.
+        """
+        cur,conn = self.__get_cursor(connection, cursor)
+
+        entries = [json.loads(row[0]) for row in self.query_db("SELECT weather FROM dates WHERE weather IS NOT NULL ORDER BY id;", connection=conn, cursor=cur)]
+        entries = [entry for entry in entries if len(entry) > 0]
+
+        # Collect the keys of all entries in the order of their first appearance.
+        keys = []
+        for entry in entries:
+            keys += [key for key in entry.keys() if key not in keys]
+
+        if len(entries) > 0:
+            self.__create_weather_table(keys, connection=conn, cursor=cur)
+            columns = ", ".join([key.lower() for key in keys])
+            placeholder = ",".join(["?" for key in keys])
+            with self.__batch(conn):
+                cur.executemany(f"INSERT OR IGNORE INTO weather ({columns}) VALUES ({placeholder});",
+                                [[entry.get(key) for key in keys] for entry in entries])
+
+        cur.execute("ALTER TABLE dates DROP COLUMN weather;")
+
+    def __migrate_details_column(self, connection=None, cursor=None):
+        """
+        Move the daily counts per type and per hour stored as json strings in the details column
+        of the dates table to their own tables and drop the column.
+        """
+        cur,conn = self.__get_cursor(connection, cursor)
+
+        type_data = []
+        hourly_data = []
+        holiday_data = {}
+        for date, details_txt in self.query_db("SELECT id, details FROM dates ORDER BY id;", connection=conn, cursor=cur):
+            details = json.loads(details_txt)
+            type_data += [(date, call_type, cnt) for call_type, cnt in details["type_stats"].items()]
+            hourly_data += [(date, hour, cnt) for hour, cnt in enumerate(details["hourly_stats"]) if cnt > 0]
+            if details["holiday"] > 0:
+                holiday_data.update({details["holiday"]: details["holiday_name"]})
+
+        cur.execute("CREATE TABLE daily_type_counts (date text, type text, count int, PRIMARY KEY (date, type));")
+        cur.execute("CREATE TABLE daily_hourly_counts (date text, hour int, count int, PRIMARY KEY (date, hour));")
+        cur.execute("CREATE TABLE holiday_names (id int PRIMARY KEY, name text);")
+        self.__write_to_db("daily_type_counts", type_data, connection=conn, cursor=cur)
+        self.__write_to_db("daily_hourly_counts", hourly_data, connection=conn, cursor=cur)
+        self.__write_to_db("holiday_names", sorted(holiday_data.items()), connection=conn, cursor=cur)
+
+        # Older versions wrote day_of_year, month and day to the columns month, day and day_of_year.
+        self.write_db("UPDATE dates SET month = day, day = day_of_year, day_of_year = month;", connection=conn, cursor=cur, commit=True)
+        cur.execute("ALTER TABLE dates DROP COLUMN details;")
+
     def __get_cursor(self, connection=None, cursor=None):
         """
         Create a database connection and cursor for database
@@ -321,7 +974,14 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
         Build a dictionary of holiday names with their associated numbers
         """
 
-        cur,conn = self.__get_cursor()
+        cur,conn = self.__get_cursor(connection, cursor)
+
+        # Use the numbers stored in the database.
+        if "holiday_names" in [row[1] for row in self.query_db("PRAGMA table_list", connection=conn, cursor=cur)]:
+            for hd_cnt, hd_name in self.query_db("SELECT id, name FROM holiday_names ORDER BY id;", connection=conn, cursor=cur):
+                self.holiday_dict.update({hd_name: hd_cnt})
+            return
+
         holidays = set(self.query_db("SELECT holiday FROM dates;", connection=conn, cursor=cur))
 
         hd_cnt = 1
@@ -332,9 +992,11 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
                 hd_cnt += 1
                 
 
-    def __create_dates_table(self, connection=None, cursor=None):
+    def __create_dates_table(self, new_since=0, connection=None, cursor=None):
         """
-        Create the table containing daily info.
+        Create the table containing daily info and the tables with the daily number of calls
+        per type and per hour. The entries of days with new calls, i.e. calls with a rowid
+        greater than new_since, are replaced.
         """
         cur,conn = self.__get_cursor(connection, cursor)
 
@@ -348,29 +1010,79 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
                                 weekday int,
                                 holiday text,
                                 calls int,        
-                                details text,
                                 population int
                               );"""
 
+        create_type_table = """CREATE TABLE IF NOT EXISTS daily_type_counts (
+                               date text,
+                               type text,
+                               count int,
+                               PRIMARY KEY (date, type)
+                             );"""
+
+        create_hourly_table = """CREATE TABLE IF NOT EXISTS daily_hourly_counts (
+                                 date text,
+                                 hour int,
+                                 count int,
+                                 PRIMARY KEY (date, hour)
+                               );"""
+
+        create_holiday_table = """CREATE TABLE IF NOT EXISTS holiday_names (
+                                  id int PRIMARY KEY,
+                                  name text
+                                );"""
+
         # Execute cmannd and create table.
         cur.execute(create_dates_table)
-
-        # Collect daily data.
-        dates_data = self.__collect_dates_info(self.first_date, self.last_date)
+        cur.execute(create_type_table)
+        cur.execute(create_hourly_table)
+        cur.execute(create_holiday_table)
+
+        # Remove the entries of days with new calls, so they are collected again.
+        new_days = """SELECT DISTINCT printf('%04d-%02d-%02d', year, month, day) FROM calls
+                      WHERE rowid > ?"""
+        if new_since > 0:
+            for table, col in [("dates", "id"), ("daily_type_counts", "date"), ("daily_hourly_counts", "date")]:
+                self.write_db(f"DELETE FROM {table} WHERE {col} IN ({new_days});", (new_since,))
+
+        # Collect the days which are not in the dates table, i.e. all days of a new database or,
+        # after an incremental ingest, the days with new calls and the new days without calls.
+        known = set([row[0] for row in self.query_db("SELECT id FROM dates;")])
+        total_days = (self.last_date - self.first_date).days + 1
+        days = [self.first_date + dt.timedelta(days=i) for i in range(total_days)]
+        days = [day for day in days if day.strftime("%Y-%m-%d") not in known]
+        if len(days) == 0:
+            dates_data, type_data, hourly_data = [], [], []
+        else:
+            dates_data, type_data, hourly_data = self.__collect_dates_info(days[0], days[-1])
+            missing = set([day.strftime("%Y-%m-%d") for day in days])
+            dates_data = [row for row in dates_data if row[0] in missing]
+            type_data = [row for row in type_data if row[0] in missing]
+            hourly_data = [row for row in hourly_data if row[0] in missing]
 
         # And write data to db.
         self.__write_to_db("dates", dates_data)
+        self.__write_to_db("daily_type_counts", type_data)
+        self.__write_to_db("daily_hourly_counts", hourly_data)
 
-        if connection == None:
-            conn.close()
+        # Store the numbers of the holidays.
+        self.write_db("DELETE FROM holiday_names;")
+        self.__write_to_db("holiday_names", [(hd_cnt, hd_name) for hd_name, hd_cnt in self.holiday_dict.items() if hd_cnt > 0])
 
 
     def __collect_dates_info(self, first_day, last_day):
         """
         Collect daily information for all days between first_day and last_day. 
-        Returns a list of tuples.
+        Returns three lists of tuples for the dates table and the tables of the daily
+        number of calls per type and per hour.
+
+        The calls per day, per type and per hour are aggregated for the whole range with two
+        GROUP BY queries instead of querying the calls table for every single day.
         """
 
+        # Aggregate the calls per day and type and per day and hour.
+        type_stats_dict, hourly_stats_dict = self.__aggregate_daily_stats(first_day, last_day)
+
         # Set variables for looping through all dates within bounds.
         delta = dt.timedelta(days=1)
         day = first_day
@@ -380,8 +1092,14 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
         # Set number of holidays in dictionary.
         hd_cnt = max(self.holiday_dict.values())+1
 
-        # Initialize return data list.
+        # Predict the population of all years at once, years after the known data are projected.
+        years = range(first_day.year, last_day.year + 1)
+        population = dict(zip(years, self.pop.predict_many(years).tolist()))
+
+        # Initialize return data lists.
         data = []
+        type_data = []
+        hourly_data = []
         
         # Loop over days.
         while day <= last_day:
@@ -425,53 +1143,325 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
             else:
                 holiday = None
 
-            # Count the number of calls on the day.               
-            calls = self.count_daily(date)
-
-            # Get the population data for that year.
-            pop = self.population[day.year]
-
             # Get numbers of calls per type of emergency.
-            type_stats = self.get_type_stats(date)
+            type_stats = type_stats_dict.get(date, {})
 
             # Get number of calls per hour.
-            hourly_stats = self.get_hourly_stats(date)
-
-            # Get the season.
-            season = self.get_season(day)
+            hourly_stats = hourly_stats_dict.get(date, [0]*24)
 
-            # Translate season dictionary to season name.
-            season_name = list(season.keys())[list(season.values()).index(1)]
+            # Count the number of calls on the day.
+            calls = sum(hourly_stats)
 
-            # Create details dictionary.
-            details = {"date": date, "year": day.year, "month": day.month,
-                       "day": day.day, "day_of_year": day_of_year, "population":pop, "calls": calls, "type_stats": type_stats,
-                       "weekday": weekday, "holiday": hd, "holiday_name": holiday, "season_name": season_name, "hourly_stats":hourly_stats}
-
-            # Update the details dictionary with the season dictionary.
-            details.update(season)
+            # Get the population data for that year.
+            pop = population[day.year]
 
-            # Dump the whole dictionary to a json formatted string.
-            details_txt = json.dumps(details)
-            
-            # Append info to data list.
-            data.append((date, day.year, day_of_year, day.month, day.day, weekday, holiday, calls, details_txt, pop))
+            # Append info to data lists.
+            data.append((date, day.year, day.month, day.day, day_of_year, weekday, holiday, calls, pop))
+            type_data += [(date, call_type, cnt) for call_type, cnt in type_stats.items()]
+            hourly_data += [(date, hour, cnt) for hour, cnt in enumerate(hourly_stats) if cnt > 0]
             
             day += delta
         
         print(f"Collecting daily data for day {total_days}/{total_days}")
 
-        return(data)
+        return(data, type_data, hourly_data)
         
 
+    def __aggregate_daily_stats(self, first_day, last_day):
+        """
+        Count the calls per type and per hour for every day between first_day and last_day.
+        Returns two dictionaries with dates as keys: the number of calls per type (in the same order
+        as get_type_stats) and the list of the number of calls per hour (as get_hourly_stats).
+        """
+
+        # Use the same day bounds as the per-day queries (see DAY_END).
+        start_ts = self.__date_to_ts(first_day)[0]
+        end_ts = self.__date_to_ts(last_day)[1]
+        bounds = f"timestamp >= ? AND timestamp < ? AND {self.__day_condition()}"
+
+        # Order the types of a day by their first call, as the rows are returned by get_type_stats.
+        # The day is identified by the year, month and day columns of the calls.
+        type_query = f"""SELECT year, month, day, type, COUNT(*) FROM calls WHERE {bounds}
+                         GROUP BY year, month, day, type ORDER BY year, month, day, MIN(timestamp), type;"""
+        hourly_query = f"""SELECT year, month, day, hour, COUNT(*) FROM calls WHERE {bounds}
+                           GROUP BY year, month, day, hour;"""
+
+        type_stats = {}
+        for year, month, day, call_type, cnt in self.query_db(type_query, (start_ts, end_ts)):
+            date = f"{year:04d}-{month:02d}-{day:02d}"
+            type_stats.setdefault(date, Counter()).update({call_type: cnt})
+
+        hourly_stats = {}
+        for year, month, day, hour, cnt in self.query_db(hourly_query, (start_ts, end_ts)):
+            date = f"{year:04d}-{month:02d}-{day:02d}"
+            hourly_stats.setdefault(date, [0]*24)[hour] = cnt
+
+        return(type_stats, hourly_stats)
+
+
+    def __update_rollups(self, connection=None, cursor=None):
+        """
+        Add the calls which are not yet contained in the rollup tables to the number of calls per
+        week, month and year (rollup_counts) and per week, month and year and type
+        (rollup_type_counts). The rowid of the last call added is stored in the rollup_state table,
+        so only new calls are aggregated. Weeks start on Monday and are identified by that date,
+        months by 'YYYY-MM' and years by 'YYYY'.
+
+        The rollups deliberately mirror the dates table: they use the same day bounds (see
+        DAY_END, calls at 23:59:59 are not counted), so count_days can combine them with the
+        daily tables and the rollup of a period equals the sum of dates.calls of its days.
+        """
+        cur,conn = self.__get_cursor(connection, cursor)
+
+        cur.execute("""CREATE TABLE IF NOT EXISTS rollup_counts (
+                       period text,
+                       id text,
+                       calls int,
+                       PRIMARY KEY (period, id)
+                     );""")
+        cur.execute("""CREATE TABLE IF NOT EXISTS rollup_type_counts (
+                       period text,
+                       id text,
+                       type text,
+                       count int,
+                       PRIMARY KEY (period, id, type)
+                     );""")
+        cur.execute("CREATE TABLE IF NOT EXISTS rollup_state (id int PRIMARY KEY, last_rowid int);")
+
+        state = self.query_db("SELECT last_rowid FROM rollup_state WHERE id = 0;", connection=conn, cursor=cur)
+        last_rowid = state[0][0] if len(state) > 0 else 0
+        max_rowid = self.query_db("SELECT IFNULL(MAX(rowid), 0) FROM calls;", connection=conn, cursor=cur)[0][0]
+        if max_rowid <= last_rowid:
+            return
+
+        # Identifiers of the periods of a call.
+        periods = {"week": "date(printf('%04d-%02d-%02d', year, month, day), '-' || week_day || ' days')",
+                   "month": "printf('%04d-%02d', year, month)",
+                   "year": "printf('%04d', year)"}
+        bounds = f"rowid > ? AND rowid <= ? AND {self.__day_condition()}"
+
+        # Add the counts of the new calls to the existing rows within one transaction.
+        with self.__batch(conn):
+            for period, period_id in periods.items():
+                cur.execute(f"""INSERT INTO rollup_type_counts
+                                SELECT ?, {period_id} AS pid, type, COUNT(*) FROM calls WHERE {bounds}
+                                GROUP BY pid, type ORDER BY pid, type
+                                ON CONFLICT (period, id, type) DO UPDATE SET count = count + excluded.count;""",
+                            (period, last_rowid, max_rowid))
+                cur.execute(f"""INSERT INTO rollup_counts
+                                SELECT ?, {period_id} AS pid, COUNT(*) FROM calls WHERE {bounds}
+                                GROUP BY pid ORDER BY pid
+                                ON CONFLICT (period, id) DO UPDATE SET calls = calls + excluded.calls;""",
+                            (period, last_rowid, max_rowid))
+            cur.execute("INSERT OR REPLACE INTO rollup_state VALUES (0, ?);", (max_rowid,))
+
+
+    def get_rollup(self, period, by_type=False, types=None):
+        """
+        Returns the number of calls per week, month or year (period="week", "month" or "year")
+        as a dictionary ordered by the period. Weeks are identified by the date of their Monday,
+        months by 'YYYY-MM' and years by 'YYYY'. If by_type is True, the values are Counters with
+        the number of calls per type, restricted to a list of types if given.
+        """
+        if period not in ["week", "month", "year"]:
+            print("The period must be 'week', 'month' or 'year'")
+            raise(ValueError)
+
+        if not by_type:
+            result = self.query_db("SELECT id, calls FROM rollup_counts WHERE period = ? ORDER BY id;", (period,))
+            return(dict(result))
+
+        query = "SELECT id, type, count FROM rollup_type_counts WHERE period = ?"
+        data = (period,)
+        if types != None:
+            query += " AND type IN (" + ",".join(["?" for t in types]) + ")"
+            data += tuple(types)
+        rollup = {}
+        for period_id, call_type, cnt in self.query_db(query + " ORDER BY id, type;", data):
+            rollup.setdefault(period_id, Counter()).update({call_type: cnt})
+        return(rollup)
+
+
+    def count_days(self, first_date=None, last_date=None, call_type=None):
+        """
+        Count the calls on the days between first_date and last_date (inclusive), optionally of
+        one type only. The range is split into whole years, months and weeks, which are read from
+        the rollup tables, and the remaining days, which are read from the daily tables. The days
+        are the same as in the dates table, so the result equals the sum of the daily numbers.
+        """
+        if first_date == None:
+            first_date = self.first_date
+        if last_date == None:
+            last_date = self.last_date
+        if type(first_date) == str:
+            first_date = dt.date.fromisoformat(first_date)
+        if type(last_date) == str:
+            last_date = dt.date.fromisoformat(last_date)
+
+        # Split the range, using the coarsest period which starts at a day and ends within the range.
+        pieces = {"year": [], "month": [], "week": [], "day": []}
+        day = first_date
+        while day <= last_date:
+            next_month = dt.date(day.year + day.month//12, day.month%12 + 1, 1)
+            if day.month == 1 and day.day == 1 and dt.date(day.year + 1, 1, 1) <= last_date + dt.timedelta(days=1):
+                pieces["year"].append(day.strftime("%Y"))
+                day = dt.date(day.year + 1, 1, 1)
+            elif day.day == 1 and next_month <= last_date + dt.timedelta(days=1):
+                pieces["month"].append(day.strftime("%Y-%m"))
+                day = next_month
+            elif day.weekday() == 0 and day + dt.timedelta(days=6) <= last_date:
+                pieces["week"].append(day.strftime("%Y-%m-%d"))
+                day += dt.timedelta(days=7)
+            else:
+                pieces["day"].append(day.strftime("%Y-%m-%d"))
+                day += dt.timedelta(days=1)
+
+        calls = 0
+        for period, ids in pieces.items():
+            if len(ids) == 0:
+                continue
+            placeholder = ",".join(["?" for i in ids])
+            if period == "day" and call_type == None:
+                query = f"SELECT SUM(calls) FROM dates WHERE id IN ({placeholder});"
+                data = tuple(ids)
+            elif period == "day":
+                query = f"SELECT SUM(count) FROM daily_type_counts WHERE date IN ({placeholder}) AND type = ?;"
+                data = tuple(ids) + (call_type,)
+            elif call_type == None:
+                query = f"SELECT SUM(calls) FROM rollup_counts WHERE period = ? AND id IN ({placeholder});"
+                data = (period,) + tuple(ids)
+            else:
+                query = f"SELECT SUM(count) FROM rollup_type_counts WHERE period = ? AND id IN ({placeholder}) AND type = ?;"
+                data = (period,) + tuple(ids) + (call_type,)
+            calls += self.query_db(query, data)[0][0] or 0
+        return(calls)
+
+
+    def __update_spatial_index(self, new_since=0, connection=None, cursor=None):
+        """
+        Add the coordinates of the calls with a rowid greater than new_since to the spatial index,
+        an R*Tree (calls_rtree) keyed by the rowid of the calls table. Calls without coordinates
+        are not indexed. Afterwards triggers keep the index in sync with inserts, updates and
+        deletes of the calls table.
+        """
+        cur,conn = self.__get_cursor(connection, cursor)
+        cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS calls_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon);")
+        cur.execute("""INSERT OR REPLACE INTO calls_rtree
+                       SELECT rowid, lat, lat, lon, lon FROM calls
+                       WHERE rowid > ? AND lat IS NOT NULL AND lon IS NOT NULL;""", (new_since,))
+
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS calls_rtree_insert AFTER INSERT ON calls
+                       WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL BEGIN
+                           INSERT OR REPLACE INTO calls_rtree VALUES (new.rowid, new.lat, new.lat, new.lon, new.lon);
+                       END;""")
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS calls_rtree_delete AFTER DELETE ON calls BEGIN
+                           DELETE FROM calls_rtree WHERE id = old.rowid;
+                       END;""")
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS calls_rtree_update AFTER UPDATE OF lat, lon ON calls BEGIN
+                           DELETE FROM calls_rtree WHERE id = old.rowid;
+                           INSERT INTO calls_rtree SELECT new.rowid, new.lat, new.lat, new.lon, new.lon
+                           WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+                       END;""")
+        self.__commit(conn)
+
+
+    def __drop_spatial_triggers(self, connection=None, cursor=None):
+        """
+        Drop the triggers of the spatial index, e.g. before a bulk load. The new calls are added
+        by __update_spatial_index afterwards.
+        """
+        cur,conn = self.__get_cursor(connection, cursor)
+        for name in ["calls_rtree_insert", "calls_rtree_delete", "calls_rtree_update"]:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name};")
+        self.__commit(conn)
+
+
+    def __spatial_query(self, box, start=None, end=None, start_ts=None, end_ts=None, call_type=None):
+        """
+        Returns the calls within box = (min_lat, max_lat, min_lon, max_lon) as tuples (id, type,
+        timestamp, lat, lon), optionally between two timepoints (see count_between) and of one
+        type only. The candidates are read from the spatial index and filtered with the exact
+        coordinates of the calls table.
+        """
+        if start_ts == None and start != None:
+            start_ts = dt.datetime.strptime(start, "%Y-%m-%d %H:%M:%S").timestamp()
+        if end_ts == None and end != None:
+            end_ts = dt.datetime.strptime(end, "%Y-%m-%d %H:%M:%S").timestamp()
+
+        # The R*Tree stores 32 bit floats rounded outwards, so its boxes contain the exact points.
+        query = """SELECT c.id, c.type, c.timestamp, c.lat, c.lon FROM calls_rtree AS r
+                   JOIN calls AS c ON c.rowid = r.id
+                   WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+                   AND c.lat BETWEEN ? AND ? AND c.lon BETWEEN ? AND ?"""
+        data = 2*(box[0], box[1], box[2], box[3])
+        if start_ts != None:
+            query += " AND c.timestamp >= ?"
+            data += (start_ts,)
+        if end_ts != None:
+            query += " AND c.timestamp < ?"
+            data += (end_ts,)
+        if call_type != None:
+            query += " AND c.type = ?"
+            data += (call_type,)
+        return(self.query_db(query + " ORDER BY c.timestamp, c.id;", data))
+
+
+    def __radius_box(self, lat, lon, radius):
+        """
+        Returns the bounding box (min_lat, max_lat, min_lon, max_lon) of the circle with the given
+        radius in meters around a point.
+        """
+        dlat = math.degrees(radius/EARTH_RADIUS)
+        if abs(lat) + dlat >= 90:
+            return((max(lat - dlat, -90), min(lat + dlat, 90), -180, 180))
+        dlon = math.degrees(math.asin(min(1.0, math.sin(radius/EARTH_RADIUS)/math.cos(math.radians(lat)))))
+        return((lat - dlat, lat + dlat, lon - dlon, lon + dlon))
+
+
+    def find_calls_in_box(self, min_lat, max_lat, min_lon, max_lon, start=None, end=None, start_ts=None, end_ts=None, call_type=None):
+        """
+        Returns the calls with coordinates within the bounding box as tuples (id, type, timestamp,
+        lat, lon) ordered by time. Optionally only calls between two timepoints (given as in
+        count_between, the end is excluded) and of one type are returned.
+        """
+        return(self.__spatial_query((min_lat, max_lat, min_lon, max_lon), start, end, start_ts, end_ts, call_type))
+
+
+    def find_calls_near(self, lat, lon, radius, start=None, end=None, start_ts=None, end_ts=None, call_type=None):
+        """
+        Returns the calls within radius meters of a point as tuples (id, type, timestamp, lat, lon,
+        distance) ordered by the distance in meters. The candidates within the bounding box of the
+        circle are read from the spatial index and filtered by their haversine distance. Time
+        range and type as in find_calls_in_box.
+        """
+        rows = self.__spatial_query(self.__radius_box(lat, lon, radius), start, end, start_ts, end_ts, call_type)
+        result = [row + (_haversine(lat, lon, row[3], row[4]),) for row in rows]
+        return(sorted([row for row in result if row[5] <= radius], key=lambda row: (row[5], row[2], row[0])))
+
+
+    def nearest_calls(self, lat, lon, k=10, start=None, end=None, start_ts=None, end_ts=None, call_type=None, radius=250):
+        """
+        Returns the k calls nearest to a point as tuples (id, type, timestamp, lat, lon, distance)
+        ordered by the distance in meters. The search radius starts at radius meters and is
+        doubled until it contains k calls, so calls outside the searched circle cannot be nearer.
+        Time range and type as in find_calls_in_box.
+        """
+        while True:
+            result = self.find_calls_near(lat, lon, radius, start, end, start_ts, end_ts, call_type)
+            if len(result) >= k or radius >= math.pi*EARTH_RADIUS:
+                return(result[:k])
+            radius *= 2
+
+
     def __insert_entry(self, entry, connection=None, cursor=None):
         """
         Insert an entry into the database without checking if it already exists.
         """
         cur,conn = self.__get_cursor(connection, cursor)        
         cur.execute("INSERT INTO calls VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", entry)
+        self.__data_changes += 1
         if connection == None:
-            conn.close()
+            self.__commit(conn)
 
 
     def __create_column(self, table, column, col_type, rebuild=False, connection=None, cursor=None):
@@ -491,8 +1481,6 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
         else:
             self.query_db(f"ALTER TABLE {table} ADD COLUMN {column} text;", connection=conn, cursor=cur)
 
-        if connection == None:
-            conn.close()
             
                
     def __init_db(self, connection=None, cursor=None, rebuild=False):
@@ -521,6 +1509,16 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
                 if rebuild:
                     cur.execute("DROP TABLE IF EXISTS calls;")
                     cur.execute("DROP TABLE IF EXISTS dates;")                
+                    cur.execute("DROP TABLE IF EXISTS weather;")
+                    cur.execute("DROP TABLE IF EXISTS daily_type_counts;")
+                    cur.execute("DROP TABLE IF EXISTS daily_hourly_counts;")
+                    cur.execute("DROP TABLE IF EXISTS holiday_names;")
+                    cur.execute("DROP TABLE IF EXISTS rollup_counts;")
+                    cur.execute("DROP TABLE IF EXISTS rollup_type_counts;")
+                    cur.execute("DROP TABLE IF EXISTS rollup_state;")
+                    cur.execute("DROP TABLE IF EXISTS calls_rtree;")
+                    self.__data_changes += 1
+                    self.cache.invalidate()
                 cur.execute(sql_create_main_table)
                 cur.execute("DROP TABLE IF EXISTS version;")
                 cur.execute("CREATE TABLE version (id text PRIMARY KEY);")
@@ -530,10 +1528,31 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
                 pass
         else:
             print("Cannot create database connection")
-        if connection == None:            
-            conn.close()
             
 
+    def create_indexes(self, connection=None, cursor=None):
+        """
+        Create the indexes of the calls table: an index on timestamp and covering indexes on
+        (timestamp, type) and (timestamp, hour), so range queries do not scan the whole table.
+        Existing indexes are kept.
+        """
+        cur,conn = self.__get_cursor(connection, cursor)
+        for name, columns in self.__indexes.items():
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON calls ({columns});")
+        cur.execute("ANALYZE calls;")
+        self.__commit(conn)
+
+
+    def drop_indexes(self, connection=None, cursor=None):
+        """
+        Drop the indexes of the calls table, e.g. before a bulk load.
+        """
+        cur,conn = self.__get_cursor(connection, cursor)
+        for name in self.__indexes.keys():
+            cur.execute(f"DROP INDEX IF EXISTS {name};")
+        self.__commit(conn)
+
+
     def __date_to_ts(self, date):
         """
         Convert a date (either as string or as date object) to a pair of timestamps
@@ -542,17 +1561,25 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
 
         # Convert date to datetime object
         if type(date) == str:                   
-            day = dt.datetime.strptime(date, "%Y-%m-%d").date()
+            day = dt.datetime.strptime(date_key(date), "%Y-%m-%d").date()
         elif type(date) == dt.datetime:
             day = date.date()
         elif type(date) == dt.date:
             day = date
 
         start_ts = dt.datetime(day.year, day.month, day.day, 0,0,0).timestamp()
-        end_ts = dt.datetime(day.year, day.month, day.day, 23,59,59).timestamp()
+        end_ts = (dt.datetime(day.year, day.month, day.day, 0,0,0) + dt.timedelta(seconds=DAY_END)).timestamp()
         return(start_ts,end_ts)
 
 
+    def __day_condition(self):
+        """
+        Returns the SQL condition on the local time of the calls which selects the calls within
+        the day bounds of __date_to_ts, for aggregations over many days.
+        """
+        return(f"hour*3600 + minute*60 + second < {DAY_END}")
+
+
     def exists(self, ID, table="calls", connection=None, cursor=None):
         """
         Check if an entry with a given id already exists.
@@ -562,8 +1589,6 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
         query = f"SELECT EXISTS(SELECT * FROM {table} WHERE id = ?);"
         cur.execute(query, (ID,))
         p = cur.fetchall()[0][0]        
-        if connection == None:
-            conn.close()
         if p == 1:
             return(True)
         else:
@@ -572,10 +1597,11 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
     def load_covid_info(self, filename, rebuild=False, connection=None, cursor=None):
         """
         Load COVID pandemic details from file. 
+
+        Every day between first_date and last_date gets an entry. Days without data in the file
+        are filled with zeros. The sums over the last 7 days are calculated for the whole range at
+        once and all entries are written within one transaction.
         """
-        
-        # Initialize data list
-        data = []
 
         # Get database connection and cursor
         cur,conn = self.__get_cursor(connection, cursor)
@@ -584,11 +1610,12 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
         # The World Health Organization (WHO) declared the outbreak
         # a public health emergency of international concern (PHEIC)
         # on 30 January 2020. The WHO ended its PHEIC declaration on 5 May 2023.
-        pandemic_start = dt.date(2020,1,30)
-        pandemic_end = dt.date(2023,5,5)
+        pandemic_start = np.datetime64("2020-01-30")
+        pandemic_end = np.datetime64("2023-05-05")
 
         if rebuild:
             cur.execute("DROP TABLE IF EXISTS covid")        
+            self.cache.invalidate()
 
         # SQL command to create new covid table            
         create_covid_table = """CREATE TABLE IF NOT EXISTS covid (
@@ -607,155 +1634,60 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
         # Create new table.
         cur.execute(create_covid_table)
 
+        # All days between the first and the last date of the database.
+        days = np.arange(np.datetime64(self.first_date), np.datetime64(self.last_date) + 1)
+        date_strs = np.datetime_as_string(days, unit="D").tolist()
+        index = {date_str: i for i, date_str in enumerate(date_strs)}
+
+        # Check for each day if it falls within the pandemic.
+        pandemic = ((days > pandemic_start) & (days < pandemic_end)).astype(np.int64)
+
+        # Daily numbers in the columns pcr_test, pcr_pos, hosp_cnt and death_cnt. Days without
+        # data are filled with zeros.
+        counts = np.zeros((len(days), 4), dtype=np.int64)
+
+        # Existing entries are kept and not updated from the file.
+        known = np.zeros(len(days), dtype=bool)
+        for row in self.query_db("SELECT id, pandemic, pcr_test, pcr_pos, hosp_cnt, death_cnt FROM covid;", connection=conn, cursor=cur):
+            if row[0] in index:
+                i = index[row[0]]
+                pandemic[i] = row[1]
+                counts[i] = row[2:6]
+                known[i] = True
+
         # Parse the csv file.
         with open(filename, 'r') as f:
             linereader = csv.reader(f)
-            firstline = True
+
+            # Skip the first line containing the column names.
+            next(linereader, None)
 
             # Iterate over the rows of file.
             for row in linereader:  
 
-                # Treat the first line differntly.
-                if firstline:
-                    firstline=False
-                    continue
-
-                # Initialize variables
-                pcr_pos,pcr_test,death_cnt,hosp_cnt = 0,0,0,0
-
                 # Get the date from the row
-                date = dt.datetime.strptime(row[2], "%m.%d.%Y").date()    
+                date_str = dt.datetime.strptime(row[2], "%m.%d.%Y").date().strftime("%Y-%m-%d")
 
-                # Check if the date falls within the pandemic and set pandemic variable accordingly.
-                if date < pandemic_end and date > pandemic_start:
-                    pandemic = 1
-                else:
-                    pandemic = 0
-
-                # Convert date to string.
-                date_str = date.strftime("%Y-%m-%d")
-
-                # Only add an entry if the date exists in the table of dates.           
-                if self.exists(date, table="dates"):
-
-                    # If the entry does not yet exist or the rebuild flag is set, create an entry.
-                    if rebuild or self.get_covid_info(date) == None:
-                        try:
-                            pcr_test = int(row[6])
-                        except ValueError:
-                            pcr_test = 0
+                # Only add an entry if the date exists in the table of dates and has no entry yet.
+                if date_str in index and not known[index[date_str]]:
+                    i = index[date_str]
+                    for k, col in enumerate([6, 7, 4, 5]):
                         try:
-                            pcr_pos = int(row[7])
+                            counts[i, k] = int(row[col])
                         except ValueError:
-                            pcr_pos = 0
-                        try:
-                            death_cnt = int(row[5])
-                        except ValueError:
-                            death_cnt = 0
-                        try:
-                            hosp_cnt = int(row[4])
-                        except ValueError:
-                            hosp_cnt = 0
-                        data.append((date_str,pandemic, pcr_test, pcr_pos, hosp_cnt, death_cnt,0,0,0,0))
-        
-        # Write all new entries to the db
-        self.__write_to_db("covid", data, connection=conn, cursor=cur)
-        conn.commit()
+                            counts[i, k] = 0
+                    known[i] = True
 
-        # Next, loop over all days to fill gaps in the table and calculate the accumulated sum 
-        # of various numbers over the last 7 days.
+        # Calculate the sums over the last 7 days (including the day itself) as the difference of
+        # cumulative sums. The days before first_date count as zero.
+        cumulative = np.vstack([np.zeros((1, 4), dtype=np.int64), np.cumsum(counts, axis=0)])
+        seven_day = cumulative[1:] - cumulative[np.maximum(np.arange(len(days)) - 6, 0)]
 
-        day = self.first_date
-        delta = dt.timedelta(days=1)
-
-        # Initiate vectors with the numbers of the last 7 days.
-        seven_day_pcr_test = [0,0,0,0,0,0,0]
-        seven_day_pcr_pos = [0,0,0,0,0,0,0]
-        seven_day_hosp_cnt = [0,0,0,0,0,0,0]
-        seven_day_death_cnt = [0,0,0,0,0,0,0]
-
-        # Start the loop.
-        while day <= self.last_date:
-            
-            # Convert day to string.
-            date_str = day.strftime("%Y-%m-%d")
-
-            # Check if the date already has an entry in the covid table.
-            if not self.exists(date_str, table="covid"):
-
-                # Initialize variables
-                pcr_test, pcr_pos = 0,0
-                hosp_cnt, death_cnt = 0,0
-
-                # Remove the first entry of the vectors
-                seven_day_pcr_test = seven_day_pcr_test[1:7]
-                seven_day_pcr_pos = seven_day_pcr_pos[1:7]
-                seven_day_hosp_cnt = seven_day_hosp_cnt[1:7]
-                seven_day_death_cnt = seven_day_death_cnt[1:7]
-
-                # And append the value of today.
-                seven_day_pcr_test.append(pcr_test)
-                seven_day_pcr_pos.append(pcr_pos)
-                seven_day_hosp_cnt.append(hosp_cnt)
-                seven_day_death_cnt.append(death_cnt)
-
-                # Check if the date falls within the pandemic and set pandemic variable accordingly.
-                if day < pandemic_end and day > pandemic_start:
-                    pandemic = 1
-                else:
-                    pandemic = 0
-
-                # Write data to database.
-                self.write_db("INSERT INTO covid VALUES (?,?,?,?,?,?,?,?,?,?)",
-                        (date_str,
-                        pandemic,
-                        pcr_test,
-                        pcr_pos,
-                        hosp_cnt,
-                        death_cnt,
-                        sum(seven_day_pcr_test),
-                        sum(seven_day_pcr_pos),
-                        sum(seven_day_hosp_cnt),
-                        sum(seven_day_death_cnt)
-                        ))
-            else:
-                
-                # If the entry already exists, get the numbers from the database
-                info = self.get_covid_info(day, connection=conn, cursor=cur)
-                pcr_test = info["pcr_test"]
-                pcr_pos = info["pcr_pos"]
-                hosp_cnt = info["hosp_cnt"]
-                death_cnt = info["death_cnt"]
-
-                # Remove the first entry of the vectors
-                seven_day_pcr_test = seven_day_pcr_test[1:7]
-                seven_day_pcr_pos = seven_day_pcr_pos[1:7]
-                seven_day_hosp_cnt = seven_day_hosp_cnt[1:7]
-                seven_day_death_cnt = seven_day_death_cnt[1:7]
-
-                # And append the value of today.
-                seven_day_pcr_test.append(pcr_test)
-                seven_day_pcr_pos.append(pcr_pos)
-                seven_day_hosp_cnt.append(hosp_cnt)
-                seven_day_death_cnt.append(death_cnt)    
-
-                # Update the database entry with the cumulative values.
-                self.write_db("""
-                        UPDATE covid SET
-                        seven_day_pcr_test = ?,
-                        seven_day_pcr_pos = ?,
-                        seven_day_hosp_cnt = ?,
-                        seven_day_death_cnt = ?
-                        WHERE id = ?""",
-                        (sum(seven_day_pcr_test),
-                        sum(seven_day_pcr_pos),
-                        sum(seven_day_hosp_cnt),
-                        sum(seven_day_death_cnt),
-                        date_str))
-            day += delta
-
-        # Commit the changes.
-        conn.commit()
+        # Write all entries within one transaction.
+        data = zip(date_strs, pandemic.tolist(), *counts.T.tolist(), *seven_day.T.tolist())
+        with self.__batch(conn):
+            cur.executemany("INSERT OR REPLACE INTO covid VALUES (?,?,?,?,?,?,?,?,?,?)", data)
+        self.cache.invalidate(date_strs)
 
         # Set the covid_info flag to True.
         self.covid_info = True
@@ -767,14 +1699,18 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
         exists and None otherways.
         """
 
+        date = date_key(date)
+        key = ("covid", date)
+        hit, covid = self.cache.get(key)
+        if hit:
+            return(covid)
+
         cur,conn = self.__get_cursor(connection, cursor)
         result = self.query_db("SELECT * FROM covid WHERE id=?", (date,), connection=conn, cursor=cur)
-        if connection == None:
-            conn.close()
         if len(result) == 0:
-            return(None)
+            covid = None
         else:
-            return({"pandemic": result[0][1],
+            covid = {"pandemic": result[0][1],
                     "pcr_test": result[0][2],
                     "pcr_pos": result[0][3],
                     "hosp_cnt": result[0][4],
@@ -782,114 +1718,162 @@ Did you download the correct file from https://data.seattle.gov/Public-Safety/Se
                     "seven_day_pcr_test": result[0][6],
                     "seven_day_pcr_pos": result[0][7],
                     "seven_day_hosp_cnt": result[0][8],
-                    "seven_day_death_cnt": result[0][9]})      
+                    "seven_day_death_cnt": result[0][9]}
+        self.cache.put(key, date, covid)
+        return(covid)
 
                 
 
 
+    def __create_weather_table(self, keys, rebuild=False, connection=None, cursor=None):
+        """
+        Create the weather table with a column for every key, e.g. a GHCN element like PRCP or TMAX.
+        Columns of existing tables are added if missing. Drop the table first, if rebuild flag is True.
+        STATION, NAME and DATE are text columns, the weather type flags WT01-WT22 are integer columns
+        and all other elements are real columns.
+        """
+        cur,conn = self.__get_cursor(connection, cursor)
+
+        if rebuild:
+            cur.execute("DROP TABLE IF EXISTS weather;")
+
+        # The table is keyed by date and station.
+        keys = list(keys) + [key for key in ["DATE", "STATION"] if key not in keys]
+        col_types = {}
+        for key in keys:
+            if key in ["STATION", "NAME", "DATE"]:
+                col_types.update({key.lower(): "text"})
+            elif key.startswith("WT"):
+                col_types.update({key.lower(): "int"})
+            else:
+                col_types.update({key.lower(): "real"})
+
+        cols = [row[1] for row in self.query_db("PRAGMA table_info(weather)", connection=conn, cursor=cur)]
+        if len(cols) == 0:
+            columns = ",\n".join([f"{col} {col_type}" for col, col_type in col_types.items()])
+            cur.execute(f"CREATE TABLE weather ({columns}, PRIMARY KEY (date, station));")
+        else:
+            for col, col_type in col_types.items():
+                if col not in cols:
+                    cur.execute(f"ALTER TABLE weather ADD COLUMN {col} {col_type};")
+
+
     def load_weather_info(self, filename, data_filter=None, rebuild=False, connection=None, cursor=None):
         """
         Load the weather info from a .csv file. A data_filter can be specified to include only 
         filtered columns in the database.
+
+        The weather data is stored in the weather table with one typed column per element of the
+        filter, keyed by date and station.
         """
         cur,conn = self.__get_cursor(connection, cursor)
 
-        # Create a new column for weather data.
-        self.__create_column("dates", "weather", "text", rebuild=rebuild, connection=conn, cursor=cur)
-
         # Initiate the filter
         filter_dict = {}
- 
-        # If no filter is given, read the column names from the first line of the .csv file
-        # and use them as filter.
-        if data_filter == None:
-            with open(filename, 'r') as f:
-                linereader = csv.reader(f)
-                data_filter = next(linereader)
+
+        # Initialize the list of new rows.
+        rows = []
 
         # Open the .csv file and iterate over all rows.        
         with open(filename, 'r') as f:
             linereader = csv.reader(f)
-            firstline = True
-            for row in linereader:  
 
-                # Treat the first line differently because it contains column names 
-                if firstline:
+            # The first line contains the column names. If no filter is given, use them as filter.
+            header = next(linereader)
+            if data_filter == None:
+                data_filter = header
 
-                    # Make sure the most important values are contained in the data
-                    if set(data_filter).issubset(set(row)):
+            # Make sure the most important values are contained in the data
+            if set(data_filter).issubset(set(header)):
 
-                        # Write for each element of the data_filter the corresponding row number to
-                        # filter_dict.
-                        for key in data_filter:
-                            filter_dict.update({key:row.index(key)})
-                        firstline = False
-                    else:
+                # Write for each element of the data_filter the corresponding row number to
+                # filter_dict.
+                for key in data_filter:
+                    filter_dict.update({key:header.index(key)})
+            else:
 
-                        # If not, print a message and raise an Error.
-                        print("""
+                # If not, print a message and raise an Error.
+                print("""
 The csv file seems to be malformed. Make sure to download the weather data as a .csv file from the CDO database of the NOAA at https://www.ncei.noaa.gov/cdo-web/.
-                        """)
-                        conn.close()
-                        raise(ValueError)
-                else:
+                """)
+                raise(ValueError)
 
-                    # Initialize weather dictionary
-                    weather = {}
+            # Create the weather table or add missing columns.
+            self.__create_weather_table(data_filter, rebuild=rebuild, connection=conn, cursor=cur)
 
-                    # Replace empty strings in row with 0
-                    row[:] = [x if x != "" else 0 for x in row]
-                    
-                    # Iterate over filter elements and try to convert corresponding entries to float.
-                    # If that fails, leave them as string. Finally add the key, value pair to the
-                    # weather dictionary.
-                    for k in range(len(data_filter)):                        
-                        try:
-                            weather.update({data_filter[k]: float(row[filter_dict[data_filter[k]]])})
-                        except ValueError:
-                            weather.update({data_filter[k]: row[filter_dict[data_filter[k]]]})
+            # Read the existing dates and the dates which already have weather data once. A date
+            # gets new weather data if it has none yet or if the rebuild flag is set.
+            dates = set([row[0] for row in self.query_db("SELECT id FROM dates;", connection=conn, cursor=cur)])
+            has_weather = set([row[0] for row in self.query_db("SELECT DISTINCT date FROM weather;", connection=conn, cursor=cur)])
 
-                    # If average, minimum and maximum temperature are in the filter and the average
-                    # temperature is 0, replace the average temperature with the mean of min and max
-                    # temperature.                                
-                    if set(["TAVG", "TMIN", "TMAX"]).issubset(data_filter) and weather["TAVG"] == 0:
-                        weather["TAVG"] = round((weather["TMAX"]-weather["TMIN"])/2,1)
+            # Check once if the average temperature can be replaced.
+            tavg_fallback = set(["TAVG", "TMIN", "TMAX"]).issubset(data_filter)
 
-                    # Get the date as string.
-                    date_str = weather["DATE"]
+            for row in linereader:  
 
-                    # Check if the date is in the dates table
-                    if self.exists(date_str, table="dates"):
+                # Initialize weather dictionary
+                weather = {}
 
-                        # Write the new entry if it does not exist yet or the rebuild flag is set.
-                        if rebuild or len(self.get_weather(date_str)) == 0:
-                            self.write_db("UPDATE dates SET weather = ? WHERE id = ?", (json.dumps(weather), date_str), connection=conn, cursor=cur, commit=True)
-                            conn.commit()
+                # Replace empty strings in row with 0
+                row[:] = [x if x != "" else 0 for x in row]
+                
+                # Iterate over filter elements and try to convert corresponding entries to float.
+                # If that fails, leave them as string. Finally add the key, value pair to the
+                # weather dictionary.
+                for key in data_filter:
+                    try:
+                        weather.update({key: float(row[filter_dict[key]])})
+                    except ValueError:
+                        weather.update({key: row[filter_dict[key]]})
+
+                # If average, minimum and maximum temperature are in the filter and the average
+                # temperature is 0, replace the average temperature with the mean of min and max
+                # temperature.                                
+                if tavg_fallback and weather["TAVG"] == 0:
+                    weather["TAVG"] = round((weather["TMAX"]-weather["TMIN"])/2,1)
+
+                # Check if the date is in the dates table and write the new entry if it does not
+                # exist yet or the rebuild flag is set.
+                if weather["DATE"] in dates and (rebuild or weather["DATE"] not in has_weather):
+                    rows.append([weather[key] for key in data_filter])
+
+        # Write all rows within one transaction.
+        columns = ", ".join([key.lower() for key in data_filter])
+        placeholder = ",".join(["?" for key in data_filter])
+        conflict = "REPLACE" if rebuild else "IGNORE"
+        with self.__batch(conn):
+            cur.executemany(f"INSERT OR {conflict} INTO weather ({columns}) VALUES ({placeholder});", rows)
+
+        # A rebuild removes the weather data of all dates, otherwise only the new rows change.
+        if rebuild:
+            self.cache.invalidate()
+        else:
+            self.cache.invalidate([row[data_filter.index("DATE")] for row in rows])
 
         self.weather_info = True
-        if connection == None:
-            conn.close()
 
 
     def query_db(self, query, data=(), connection=None, cursor=None):
         """ Perform a SQL query on the database and return results """
-        cur,conn = self.__get_cursor()
+        cur,conn = self.__get_cursor(connection, cursor)
         cur.execute(query, data)
         result = cur.fetchall()
-        if connection == None:
-            conn.close()
 
         return(result)
 
 
-    def write_db(self, query, data=(), commit = False, connection=None, cursor=None):
-        """ Perform a SQL command on the database """
-        cur,conn = self.__get_cursor()
+    def write_db(self, query, data=(), commit = False, dates=None, connection=None, cursor=None):
+        """
+        Perform a SQL command on the database. Pass the list of dates ('YYYY-MM-DD') changed by
+        the command as dates to keep the cached results of other dates, otherwise the whole cache
+        is cleared.
+        """
+        cur,conn = self.__get_cursor(connection, cursor)
         cur.execute(query, data)
-        if commit or connection == None:
+        self.cache.invalidate(dates)
+        self.__data_changes += 1
+        if (commit or connection == None) and not self.__in_transaction(conn):
             conn.commit()
-        if connection == None:
-            conn.close()
    
 
     def get_type_stats(self, date=None, start_ts=None, end_ts=None):
@@ -897,8 +1881,16 @@ The csv file seems to be malformed. Make sure to download the weather data as a
         Returns a statistic of the 911 calls between two timestamps. I.e. the number of calls
         for the different types. Returns a dictionary.
         """
+        key = None
         if date != None:
             start_ts, end_ts = self.__date_to_ts(date)
+
+            # Only the statistics of dates are cached.
+            date_str = dt.datetime.fromtimestamp(start_ts).strftime("%Y-%m-%d")
+            key = ("type_stats", date_str)
+            hit, stats = self.cache.get(key)
+            if hit:
+                return(stats)
         elif start_ts==None or end_ts==None:
             print("You need to provide a date or two timestamps")
             return({})
@@ -909,31 +1901,325 @@ The csv file seems to be malformed. Make sure to download the weather data as a
         type_list = []
         for row in result:
             type_list.append(row[0])
-        return(Counter(type_list))
+        stats = Counter(type_list)
+        if key != None:
+            self.cache.put(key, date_str, stats)
+        return(stats)
+
+
+    def get_date_details(self, date, type_stats=True, hourly_stats=True):
+        """
+        Retrieve the details for a given date from the database. The details are assembled from
+        the dates table and the tables with the daily number of calls per type and per hour.
+        Set type_stats or hourly_stats to False to skip reading the respective counts.
+        """
+        date = date_key(date)
+        key = ("details", date, type_stats, hourly_stats)
+        hit, details = self.cache.get(key)
+        if hit:
+            return(details)
+
+        query = "SELECT id, holiday, calls, population FROM dates WHERE id = ?"
+        date_str, holiday, calls, pop = self.query_db(query, data=(date,))[0]
+
+        day = dt.date.fromisoformat(date_str)
+        season = self.get_season(day)
+        season_name = list(season.keys())[list(season.values()).index(1)]
+
+        details = {"date": date_str, "year": day.year, "month": day.month, "day": day.day,
+                   "day_of_year": day.timetuple().tm_yday, "population": pop, "calls": calls}
+        if type_stats:
+            details.update({"type_stats": self.get_daily_type_counts(date_str)})
+        details.update({"weekday": day.weekday(), "holiday": self.holiday_dict.get(holiday, 0),
+                        "holiday_name": holiday, "season_name": season_name})
+        if hourly_stats:
+            details.update({"hourly_stats": self.get_daily_hourly_counts(date_str)})
+        details.update(season)
+        self.cache.put(key, date_str, details)
+        return(details)
+
+
+    def get_daily_type_counts(self, date, types=None):
+        """
+        Returns the number of calls per type on a date as a Counter. If a list of types is given,
+        only the counts of these types are read.
+        """
+        query = "SELECT type, count FROM daily_type_counts WHERE date = ?"
+        data = (date,)
+        if types != None:
+            query += " AND type IN (" + ",".join(["?" for t in types]) + ")"
+            data += tuple(types)
+        result = self.query_db(query + " ORDER BY rowid;", data=data)
+        return(Counter(dict(result)))
+
+
+    def get_daily_hourly_counts(self, date):
+        """
+        Returns the number of calls per hour on a date as a list of 24 numbers.
+        """
+        stat = [0]*24
+        for hour, cnt in self.query_db("SELECT hour, count FROM daily_hourly_counts WHERE date = ?;", data=(date,)):
+            stat[hour] = cnt
+        return(stat)
+
+
+    def get_hourly_matrix(self, first_date=None, last_date=None):
+        """
+        Returns the number of calls per hour for every day between first_date and last_date
+        (inclusive) as an array of shape (days, 24). The counts of the whole range are read with
+        one query and placed into the array with one assignment.
+        """
+        if first_date == None:
+            first_date = self.first_date
+        if last_date == None:
+            last_date = self.last_date
+        first_day = np.datetime64(str(first_date), "D")
+        days = int((np.datetime64(str(last_date), "D") - first_day).astype(np.int64)) + 1
+        matrix = np.zeros((max(days, 0), 24), dtype=np.int64)
+
+        query = "SELECT date, hour, count FROM daily_hourly_counts WHERE date >= ? AND date <= ?;"
+        result = self.query_db(query, (str(first_date), str(last_date)))
+        if len(result) > 0:
+            dates, hours, counts = zip(*result)
+            day_index = (np.array(dates, dtype="datetime64[D]") - first_day).astype(np.int64)
+            matrix[day_index, np.array(hours)] = counts
+        return(matrix)
+
+
+    def fingerprint(self):
+        """
+        Returns a dictionary describing the state of the data in the database: the database version,
+        the last timestamp and the number of rows of the calls, dates, weather and covid tables.
+        Any ingestion changes the fingerprint.
+        """
+        tables = [row[1] for row in self.query_db("PRAGMA table_list")]
+        fingerprint = {"version": self.__version,
+                       "last_timestamp": self.query_db("SELECT MAX(timestamp) FROM calls;")[0][0]}
+        for table in ["calls", "dates", "weather", "covid"]:
+            if table in tables:
+                fingerprint.update({table: self.query_db(f"SELECT COUNT(*) FROM {table};")[0][0]})
+            else:
+                fingerprint.update({table: 0})
+        return(fingerprint)
+
+
+    def history_fingerprint(self, before=None):
+        """
+        Returns a dictionary describing the data of the days before the date before ('YYYY-MM-DD',
+        all days if None): for the dates, weather and covid tables the number of rows and the sums
+        of the value columns, computed with one aggregate query per table. Reloading the same
+        data (e.g. INSERT OR REPLACE of the covid rows) does not change the fingerprint.
+        Days appended after before do not change the fingerprint, changes of the data of earlier
+        days (e.g. backfilled weather or covid rows) do.
+        """
+        if before == None:
+            before = "9999-12-31"
+        tables = [row[1] for row in self.query_db("PRAGMA table_list")]
+        fingerprint = {"version": self.__version}
+        for table, column in [("dates", "id"), ("weather", "date"), ("covid", "id")]:
+            if table not in tables:
+                fingerprint.update({table: None})
+                continue
+            values = [row[1] for row in self.query_db(f"PRAGMA table_info({table})") if row[1] not in [column, "station", "holiday"]]
+            totals = "".join([f", TOTAL({value})" for value in values])
+            fingerprint.update({table: self.query_db(f"SELECT COUNT(*){totals} FROM {table} WHERE {column} < ?;", (str(before),))[0]})
+        return(fingerprint)
+
+
+    def get_feature_matrix(self, first_date, last_date, categories=None, cache_dir=None):
+        """
+        Returns a DataFrame with one row per day between first_date and last_date (inclusive) and
+        the columns used to train the models: the number of calls (CALLS), calendar features,
+        weather and covid data. If a list of categories is given, the number of calls per category
+        and the number of the remaining calls ("Misc Emergencies") are added.
+
+        The data is read with a few joined queries for the whole range. Missing weather or covid
+        data results in NaN values.
+
+        If a cache_dir is given, the matrix is stored there as .npz file, keyed by the fingerprint
+        of the database, the date range and the categories. Later calls with the same key load the
+        file instead of querying the data. Files of an outdated fingerprint are removed.
+        """
+        first_date, last_date = str(first_date), str(last_date)
+
+        if cache_dir != None:
+            fingerprint = self.fingerprint()
+            key = json.dumps({"fingerprint": fingerprint, "first_date": first_date, "last_date": last_date,
+                              "categories": categories}, sort_keys=True)
+            cache_file = os.path.join(cache_dir, "features_" + hashlib.sha256(key.encode()).hexdigest()[:32] + ".npz")
+            if os.path.exists(cache_file):
+                return(self.__load_feature_cache(cache_file))
+            features = self.get_feature_matrix(first_date, last_date, categories)
+            self.__write_feature_cache(cache_dir, cache_file, features, fingerprint)
+            return(features)
+
+        # Weather elements and the names of the features. Elements which were not loaded are NULL.
+        weather_features = {"TMIN": "tmin", "TMAX": "tmax", "TAVG": "tavg", "SNOW": "snow", "PRCP": "prcp",
+                            "FOG": "wt01", "HVY_FOG": "wt02", "THUNDER": "wt03", "ICE": "wt04",
+                            "HAIL": "wt05", "GLAZE": "wt06", "HAZE": "wt08"}
+        weather_cols = []
+        if self.weather_info:
+            weather_cols = [row[1] for row in self.query_db("PRAGMA table_info(weather)")]
+        weather_select = ", ".join([f"w.{col}" if col in weather_cols else "NULL" for col in weather_features.values()])
+
+        # Covid columns and the names of the features.
+        covid_features = {"PCR_TESTS": "pcr_test", "WEEKLY_PCR_TESTS": "seven_day_pcr_test",
+                          "PCR_TESTS_POS": "pcr_pos", "WEEKLY_PCR_TESTS_POS": "seven_day_pcr_pos",
+                          "HOSP_CNT": "hosp_cnt", "DEATH_CNT": "death_cnt",
+                          "WEEKLY_HOSP_CNT": "seven_day_hosp_cnt", "WEEKLY_DEATH_CNT": "seven_day_death_cnt",
+                          "PANDEMIC": "pandemic"}
+        if self.covid_info:
+            covid_select = ", ".join([f"c.{col}" for col in covid_features.values()])
+            covid_join = "LEFT JOIN covid c ON c.id = d.id"
+        else:
+            covid_select = ", ".join(["NULL" for col in covid_features.values()])
+            covid_join = ""
+
+        # Join the daily data with the weather data of the first station and the covid data.
+        weather_join = ""
+        if self.weather_info:
+            weather_join = """LEFT JOIN weather w ON w.date = d.id
+                              AND w.rowid = (SELECT MIN(rowid) FROM weather WHERE date = d.id)"""
+        query = f"""SELECT d.id, d.calls, d.day, d.month, d.year, d.holiday, d.weekday, d.population,
+                    d.day_of_year, {weather_select}, {covid_select}
+                    FROM dates d {weather_join} {covid_join}
+                    WHERE d.id >= ? AND d.id <= ? ORDER BY d.id;"""
+        columns = ["DATE", "CALLS", "DAY", "MONTH", "YEAR", "HOLIDAY_NAME", "WEEKDAY", "POP", "DAY_YEAR"]
+        columns += list(weather_features.keys()) + list(covid_features.keys())
+        raw = pd.DataFrame(self.query_db(query, (first_date, last_date)), columns=columns)
+
+        # Derive the calendar features as array operations.
+        month = raw["MONTH"].to_numpy()
+        holiday = raw["HOLIDAY_NAME"].map(lambda name: self.holiday_dict.get(name, 0)).to_numpy(dtype=np.int64)
+        data = {"CALLS": raw["CALLS"], "DAY": raw["DAY"], "MONTH": raw["MONTH"], "YEAR": raw["YEAR"],
+                "HOLIDAY": holiday,
+                "WEEKEND_BOOL": (raw["WEEKDAY"] >= 5).astype(np.int64),
+                "HOLIDAY_BOOL": (holiday > 0).astype(np.int64),
+                "WEEKDAY": raw["WEEKDAY"], "POP": raw["POP"], "DAY_YEAR": raw["DAY_YEAR"],
+                "WINTER": ((month == 12) | (month <= 2)).astype(np.int64),
+                "SPRING": ((month >= 3) & (month <= 5)).astype(np.int64),
+                "SUMMER": ((month >= 6) & (month <= 8)).astype(np.int64),
+                "FALL": ((month >= 9) & (month <= 11)).astype(np.int64)}
+
+        # Weather values are floats.
+        weather = raw[list(weather_features.keys())].astype(np.float64)
+        for feature in ["TMIN", "TMAX", "TAVG", "SNOW"]:
+            data.update({feature: weather[feature]})
+        data.update({"SNOW_BOOL": (weather["SNOW"] > 0).astype(np.int64)})
+        for feature in ["PRCP", "FOG", "HVY_FOG", "THUNDER", "ICE", "HAIL", "GLAZE", "HAZE"]:
+            data.update({feature: weather[feature]})
+        for feature in covid_features.keys():
+            data.update({feature: raw[feature]})
+        features = pd.DataFrame(data)
+
+        # Add the number of calls per category.
+        if categories != None:
+            counts = pd.DataFrame(0, index=raw["DATE"], columns=list(categories), dtype=np.int64)
+            if len(categories) > 0:
+                query = f"""SELECT date, type, count FROM daily_type_counts
+                            WHERE date >= ? AND date <= ? AND type IN ({",".join(["?" for cat in categories])});"""
+                result = pd.DataFrame(self.query_db(query, (first_date, last_date) + tuple(categories)), columns=["date", "type", "count"])
+                pivot = result.pivot(index="date", columns="type", values="count")
+                counts.update(pivot)
+                counts = counts.astype(np.int64)
+            counts = counts.reset_index(drop=True)
+            features = pd.concat([features, counts], axis=1)
+            features["Misc Emergencies"] = features["CALLS"] - counts.sum(axis=1)
+
+        return(features)
+
+
+    def __load_feature_cache(self, cache_file):
+        """
+        Load a feature matrix stored by __write_feature_cache.
+        """
+        with np.load(cache_file, allow_pickle=False) as cache:
+            columns = cache["columns"].tolist()
+            return(pd.DataFrame({col: cache[f"col_{i}"] for i, col in enumerate(columns)}))
 
 
-    def get_date_details(self, date):
+    def __write_feature_cache(self, cache_dir, cache_file, features, fingerprint):
         """
-        Retrieve the details for a given date from the database.
+        Store a feature matrix as .npz file with one array per column and remove the files of
+        other fingerprints.
         """
-        query = "SELECT details FROM dates WHERE id = ?"
-        result = self.query_db(query, data=(date,))[0][0]
-        return(json.loads(result))
+        os.makedirs(cache_dir, exist_ok=True)
+        fingerprint_txt = json.dumps(fingerprint, sort_keys=True)
+        for name in os.listdir(cache_dir):
+            if name.startswith("features_") and name.endswith(".npz"):
+                with np.load(os.path.join(cache_dir, name), allow_pickle=False) as cache:
+                    outdated = str(cache["fingerprint"]) != fingerprint_txt
+                if outdated:
+                    os.remove(os.path.join(cache_dir, name))
+
+        # Write to a temporary file first, so an interrupted write never leaves a broken cache.
+        arrays = {f"col_{i}": features[col].to_numpy() for i, col in enumerate(features.columns)}
+        tmp_file = cache_file[:-4] + ".tmp.npz"
+        np.savez(tmp_file, columns=np.array(list(features.columns), dtype=str),
+                 fingerprint=np.array(fingerprint_txt), **arrays)
+        os.replace(tmp_file, cache_file)
 
 
     def get_weather(self, date, connection=None, cursor=None):
         """
         Get weather details for date. Returns an empty dictionary if no entry exists.
         """
+        if not self.weather_info:
+            return({})
+        date = date_key(date)
+        key = ("weather", date)
+        hit, weather = self.cache.get(key)
+        if hit:
+            return(weather)
+
         cur,conn = self.__get_cursor(connection, cursor)
-        result = self.query_db("SELECT weather FROM dates WHERE id=?", (date,), connection=conn, cursor=cur)
-        if connection == None:
-            conn.close()
-        if result[0][0] == None:
+        cur.execute("SELECT * FROM weather WHERE date = ? ORDER BY rowid LIMIT 1;", (date,))
+        result = cur.fetchall()
+        if len(result) == 0:
+            self.cache.put(key, date, {})
             return({})
-        else:
-            return(json.loads(result[0][0]))                 
-        
+
+        # Translate the columns back to the keys of the weather data. Elements which were not
+        # loaded are NULL and omitted, numbers are returned as floats.
+        weather = {}
+        for col, value in zip([col[0] for col in cur.description], result[0]):
+            if value == None:
+                continue
+            if type(value) == int:
+                value = float(value)
+            weather.update({col.upper(): value})
+        self.cache.put(key, date, weather)
+        return(weather)
+
+
+    def find_weather_days(self, filters, first_date=None, last_date=None):
+        """
+        Returns the sorted list of dates between first_date and last_date (inclusive) with weather
+        data matching all filters. A filter is a tuple (column, operator, value) with a column of
+        the weather table, an operator of =, !=, <, <=, > and >= and a value, e.g.
+        find_weather_days([("snow", ">", 0), ("tmax", "<", 2)]).
+        """
+        if first_date == None:
+            first_date = self.first_date
+        if last_date == None:
+            last_date = self.last_date
+
+        # Only known columns and operators are written to the query, the values are bound.
+        columns = [row[1] for row in self.query_db("PRAGMA table_info(weather)")]
+        conditions = []
+        data = (str(first_date), str(last_date))
+        for column, operator, value in filters:
+            if column.lower() not in columns:
+                raise ValueError(f"Unknown weather column '{column}'.")
+            if operator not in ["=", "!=", "<", "<=", ">", ">="]:
+                raise ValueError(f"Unknown operator '{operator}'.")
+            conditions.append(f" AND {column.lower()} {operator} ?")
+            data += (value,)
+        query = f"""SELECT DISTINCT date FROM weather
+                    WHERE date >= ? AND date <= ?{"".join(conditions)} ORDER BY date;"""
+        result = self.query_db(query, data)
+        return([row[0] for row in result])
+
 
     def get_hourly_stats(self, date=None, start_ts=None, end_ts=None):
         """
@@ -968,7 +2254,7 @@ The csv file seems to be malformed. Make sure to download the weather data as a
         """
 
         if date != None:
-            day = dt.datetime.strptime(date, "%Y-%m-%d").date()
+            day = dt.datetime.strptime(date_key(date), "%Y-%m-%d").date()
         elif date_tuple != None:
             day = dt.datetime(year = date_tuple[0], month = date_tuple[1], day = date_tuple[2]).date()
         elif timestamp != None:
@@ -977,17 +2263,25 @@ The csv file seems to be malformed. Make sure to download the weather data as a
             print("You need to provide at least one argument")
             return(0)
 
+        key = ("count_daily", day.strftime("%Y-%m-%d"))
+        hit, result = self.cache.get(key)
+        if hit:
+            return(result)
+
         start_ts = dt.datetime(day.year, day.month, day.day, 0,0,0).timestamp()
         end_ts = dt.datetime(day.year, day.month, day.day, 23,59,59).timestamp()
                              
         result = self.count_between(start_ts=start_ts, end_ts=end_ts)
+        self.cache.put(key, key[1], result)
         return(result)
 
 
-    def count_between(self, start=None, end=None, start_ts=None, end_ts=None):
+    def count_between(self, start=None, end=None, start_ts=None, end_ts=None, call_type=None):
         """
-        Count the number of 911 calls between two timepoints.
+        Count the number of 911 calls between two timepoints, optionally of one type only.
         Times must be given either as a string of the form 'YYYY-MM-DD HH:MM:SS' or as a timestamp.
+        The start is included and the end is excluded. If build_count_index was called, the
+        number is read from the count index instead of the database.
         """
         
         if start == None and start_ts == None:
@@ -1006,12 +2300,142 @@ The csv file seems to be malformed. Make sure to download the weather data as a
             except ValueError as e:
                 print(e)
             
+        if self.__count_index != None and start_ts != None and end_ts != None:
+            return(self.__count_from_index(start_ts, end_ts, call_type))
+
         query = """
-        SELECT COUNT(*) FROM calls WHERE timestamp >= ? AND timestamp < ?;
+        SELECT COUNT(*) FROM calls WHERE timestamp >= ? AND timestamp < ?
         """
+        data = (start_ts, end_ts,)
+        if call_type != None:
+            query += " AND type = ?"
+            data += (call_type,)
 
-        result = self.query_db(query, (start_ts, end_ts,))
+        result = self.query_db(query + ";", data)
 
         return(result[0][0])
+
+
+    def build_count_index(self, resolution="second", mmap_dir=None):
+        """
+        Build an in-memory index of the cumulative number of calls per second, minute or hour
+        (resolution="second", "minute" or "hour"). Afterwards count_between and count_daily find
+        the number of calls between two timestamps by two binary searches. Calls in buckets which
+        are only partly within the interval are counted in the database, so the results are
+        always the same as without index; with resolution="second" no query of the calls is needed.
+
+        The index of a type of calls is built on first use. The indexes are built again on first
+        use after the data has been changed, by this object or by other connections or processes
+        (checked with PRAGMA data_version on a connection of the index). If mmap_dir is given, the
+        indexes are stored there as .npy files and memory-mapped.
+        """
+        resolutions = {"second": 1, "minute": 60, "hour": 3600}
+        if resolution not in resolutions:
+            print("The resolution must be 'second', 'minute' or 'hour'")
+            raise(ValueError)
+        if mmap_dir != None:
+            os.makedirs(mmap_dir, exist_ok=True)
+        with self.__count_index_lock:
+            self.__close_count_index()
+            self.__count_index = {"resolution": resolutions[resolution], "mmap_dir": mmap_dir,
+                                  "state": None, "indexes": {}, "connection": None}
+
+
+    def drop_count_index(self):
+        """
+        Remove the count index. count_between queries the database again.
+        """
+        with self.__count_index_lock:
+            self.__close_count_index()
+            self.__count_index = None
+
+
+    def __close_count_index(self):
+        """
+        Close the connection used to detect changes of the data for the count index.
+        """
+        settings = self.__count_index
+        if settings != None and settings["connection"] != None:
+            with self.__lock:
+                settings["connection"].close()
+                settings["connection"] = None
+
+
+    def __count_index_state(self):
+        """
+        Returns the state of the data for the count index: the number of changes made by this
+        object and the data version of a connection which only reads. The data version changes
+        whenever another connection, e.g. of another thread, object or process, commits changes.
+        """
+        settings = self.__count_index
+        with self.__lock:
+            if settings["connection"] == None:
+                if self.read_only:
+                    uri = pathlib.Path(self.db_file).resolve().as_uri() + "?mode=ro"
+                    settings["connection"] = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                else:
+                    settings["connection"] = sqlite3.connect(self.db_file, check_same_thread=False)
+            version = settings["connection"].execute("PRAGMA data_version;").fetchone()[0]
+        return((self.__data_changes, version))
+
+
+    def __get_count_index(self, call_type=None):
+        """
+        Returns the count index of all calls or of one type of calls and builds it if it does not
+        exist or the data has changed since it was built. Returns None if the count index was
+        dropped in the meantime.
+        """
+        with self.__count_index_lock:
+            settings = self.__count_index
+            if settings == None:
+                return(None)
+
+            # Drop the indexes if the data was changed since they were built.
+            state = self.__count_index_state()
+            if settings["state"] != state:
+                settings.update({"state": state, "indexes": {}})
+
+            key = "" if call_type == None else call_type
+            if key not in settings["indexes"]:
+                if call_type == None:
+                    result = self.query_db("SELECT timestamp FROM calls ORDER BY timestamp;")
+                else:
+                    result = self.query_db("SELECT timestamp FROM calls WHERE type = ? ORDER BY timestamp;", (call_type,))
+                mmap_file = None
+                if settings["mmap_dir"] != None:
+                    name = "counts_" + hashlib.sha256(key.encode()).hexdigest()[:16] + ".npy"
+                    mmap_file = os.path.join(settings["mmap_dir"], name)
+                timestamps = np.array([row[0] for row in result], dtype=np.int64)
+                settings["indexes"][key] = countIndex(timestamps, settings["resolution"], mmap_file)
+            return(settings["indexes"][key])
+
+
+    def __count_from_index(self, start_ts, end_ts, call_type=None):
+        """
+        Count the calls between start_ts (inclusive) and end_ts (exclusive) with the count index.
+        Calls in the partly covered buckets at the bounds are counted in the database.
+        """
+        if end_ts <= start_ts:
+            return(0)
+        index = self.__get_count_index(call_type)
+        if index == None:
+            query = "SELECT COUNT(*) FROM calls WHERE timestamp >= ? AND timestamp < ?"
+            data = (start_ts, end_ts)
+            if call_type != None:
+                query += " AND type = ?"
+                data += (call_type,)
+            return(self.query_db(query + ";", data)[0][0])
+        count = 0
+        for sign, bound in [(1, end_ts), (-1, start_ts)]:
+            before, bucket_start, bucket_end = index.count_before(bound)
+            if bucket_start < bucket_end:
+                query = "SELECT COUNT(*) FROM calls WHERE timestamp >= ? AND timestamp < ?"
+                data = (bucket_start, bucket_end)
+                if call_type != None:
+                    query += " AND type = ?"
+                    data += (call_type,)
+                before += self.query_db(query + ";", data)[0][0]
+            count += sign*before
+        return(count)
         
             
@@ -0,0 +1,43 @@
+import math
+import numpy as np
+
+
+class countIndex:
+    """
+    The countIndex class holds the cumulative number of calls per time bucket (e.g. per second,
+    minute or hour), so the number of calls before a timestamp is found by a binary search.
+    Only buckets containing calls are stored.
+    """
+
+    def __init__(self, timestamps, resolution=1, mmap_file=None):
+        """
+        Build the index.
+        - timestamps: sorted array of the (integer) timestamps of the calls.
+        - resolution=1: width of the buckets in seconds.
+        - mmap_file=None: if given, the index is stored in this .npy file and memory-mapped.
+        """
+        self.resolution = resolution
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        buckets, counts = np.unique(timestamps - timestamps % resolution, return_counts=True)
+        table = np.vstack([buckets, np.cumsum(counts)])
+        if mmap_file != None:
+            np.save(mmap_file, table)
+            table = np.load(mmap_file, mmap_mode="r")
+        self.buckets = table[0]
+        self.cumulative = table[1]
+
+    def count_before(self, bound):
+        """
+        Count the calls before bound. Returns a tuple (count, start, end): count is the number of
+        calls before start, the beginning of the bucket containing bound. The calls between
+        start and end (exclusive) are not contained in the index and have to be added, if start
+        is less than end. As timestamps are integers, bound is rounded up first.
+        """
+        end = math.ceil(bound)
+        start = end - end % self.resolution
+        i = int(np.searchsorted(self.buckets, start, side="left"))
+        count = int(self.cumulative[i-1]) if i > 0 else 0
+        return(count, start, end)
+
+    def __len__(self):
+        return(len(self.buckets))
@@ -0,0 +1,102 @@
+import sys
+import sqlite3
+import holidays
+import numpy as np
+import pandas as pd
+
+from call_db.calls import callDB
+from pop_predict.predict import shared_predictor
+from train import load_or_train, relevant_features, weather_defaults, covid_defaults
+
+
+def batch_features(call_db, pop, dates, scenarios=None):
+    """
+    Returns the features of many dates to be predicted as a DataFrame, computed as array
+    operations. The features are the same as those of train.prediction_features.
+    - dates: list or array of dates (strings 'YYYY-MM-DD' or date objects).
+    - scenarios=None: DataFrame with one row per date and optional weather and covid columns
+      (e.g. TMAX, WEEKLY_HOSP_CNT). Missing columns and values are replaced by weather_defaults
+      and covid_defaults.
+    """
+    days = pd.to_datetime(pd.Series(dates).astype(str), format="%Y-%m-%d")
+    month = days.dt.month.to_numpy()
+    weekday = days.dt.weekday.to_numpy()
+
+    # Build the holidays of all years and look them up at once.
+    years = days.dt.year.to_numpy()
+    wa_holidays = holidays.country_holidays("US", subdiv="WA", years=sorted(set(years.tolist())))
+    holiday_days = np.array(sorted(wa_holidays.keys()), dtype="datetime64[D]")
+    day_values = days.to_numpy().astype("datetime64[D]")
+
+    # The population of all years is predicted with one call.
+    unique_years, year_index = np.unique(years, return_inverse=True)
+    population = pop.predict_many(unique_years)[year_index]
+
+    features = pd.DataFrame({"POP": population,
+                             "MONTH": month,
+                             "SUMMER": ((month >= 6) & (month <= 8)).astype(np.int64),
+                             "WINTER": ((month == 12) | (month <= 2)).astype(np.int64),
+                             "WEEKEND_BOOL": (weekday >= 5).astype(np.int64),
+                             "HOLIDAY_BOOL": np.isin(day_values, holiday_days).astype(np.int64),
+                             "PANDEMIC": ((day_values > np.datetime64("2020-01-30")) & (day_values < np.datetime64("2023-05-05"))).astype(np.int64)})
+
+    # Weather and covid values of the scenarios or the defaults.
+    for key, default in list(weather_defaults.items()) + list(covid_defaults.items()):
+        values = np.full(len(days), default, dtype=np.float64)
+        if scenarios is not None and key in scenarios:
+            given = pd.to_numeric(scenarios[key]).to_numpy(dtype=np.float64)
+            values = np.where(np.isnan(given), values, given)
+        features[key] = values
+    features["SNOW_BOOL"] = features["SNOW_BOOL"].astype(np.int64)
+    return(features)
+
+
+def forecast(model, call_db, dates=None, first_date=None, last_date=None, scenarios=None, pop=None, features=relevant_features):
+    """
+    Predict the number of calls for many dates with one call of the model. The dates are given
+    as a list, as a range from first_date to last_date (inclusive) or as the DATE column of a
+    DataFrame of scenarios with optional weather and covid columns. Returns a DataFrame with the
+    dates, the features and the predicted number of calls (CALLS).
+    """
+    if pop is None:
+        pop = shared_predictor()
+    if scenarios is not None:
+        dates = scenarios["DATE"]
+    elif dates is None:
+        dates = pd.date_range(first_date, last_date, freq="D").strftime("%Y-%m-%d")
+    data = batch_features(call_db, pop, dates, scenarios)[features]
+    result = pd.concat([pd.DataFrame({"DATE": pd.Series(dates).astype(str).to_numpy()}), data], axis=1)
+    result["CALLS"] = model.predict(data)
+    return(result)
+
+
+def write_forecast(result, filename, table="forecasts"):
+    """
+    Write a forecast to a .csv file or, if filename ends with .db or .sqlite, to a table of a
+    SQLite database. An existing table is replaced.
+    """
+    if filename.endswith(".db") or filename.endswith(".sqlite"):
+        conn = sqlite3.connect(filename)
+        result.to_sql(table, conn, if_exists="replace", index=False)
+        conn.commit()
+        conn.close()
+    else:
+        result.to_csv(filename, index=False)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    # python forecast.py <db_file> <first_date> <last_date> [output]
+    # python forecast.py <db_file> <scenario.csv> [output]
+    db = callDB(db_file=args[1], load_only=True)
+    model = load_or_train("model.pkl", db)["model"]
+    if args[2].endswith(".csv"):
+        result = forecast(model, db, scenarios=pd.read_csv(args[2]))
+        output = args[3] if len(args) > 3 else "forecast.csv"
+    else:
+        result = forecast(model, db, first_date=args[2], last_date=args[3])
+        output = args[4] if len(args) > 4 else "forecast.csv"
+    write_forecast(result, output)
+    print(f"Wrote {len(result)} forecasts to {output}")
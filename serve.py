@@ -0,0 +1,166 @@
+import sys
+import json
+import time
+import datetime as dt
+import pandas as pd
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from call_db.calls import callDB
+from pop_predict.predict import shared_predictor
+from train import calls_estimator, load_or_train, prediction_features, relevant_features, weather_defaults, covid_defaults
+
+
+class callsPredictor:
+    """
+    The callsPredictor class keeps the database, the population model and the trained estimator
+    in memory and predicts the number of 911 calls for one or many dates.
+    """
+
+    def __init__(self, call_db, model=None, features=relevant_features, cache_dir="feature_cache", model_file=None):
+        """
+        Train the estimator on the data of call_db, unless a trained model is given. If a
+        model_file is given, the model is loaded from that file if it matches the database and
+        otherwise trained and stored there.
+        """
+        self.db = call_db
+        self.pop = shared_predictor()
+        self.features = features
+        if model == None and model_file != None:
+            start = time.perf_counter()
+            model = load_or_train(model_file, call_db, features, cache_dir)["model"]
+            print(f"Loaded the model in {time.perf_counter() - start:.3f} s")
+        elif model == None:
+            start = time.perf_counter()
+            model = calls_estimator(features, cache_dir=cache_dir, call_db=call_db)
+            print(f"Trained the model in {time.perf_counter() - start:.1f} s")
+        self.model = model
+
+    def predict(self, requests):
+        """
+        Predict the number of calls for a list of requests. Each request is a dictionary with a
+        date ('YYYY-MM-DD') and optional dictionaries weather and covid, which override
+        weather_defaults and covid_defaults. All dates are predicted with one call of the model.
+        Returns the list of predictions.
+        """
+        if type(requests) != list:
+            raise ValueError("The requests must be a list")
+        rows = []
+        for request in requests:
+            if type(request) != dict:
+                raise ValueError("A request must be an object")
+            if type(request.get("date")) != str:
+                raise ValueError("A request must contain a date 'YYYY-MM-DD'")
+            dt.date.fromisoformat(request["date"])
+            for key in ["weather", "covid"]:
+                if type(request.get(key, {})) != dict:
+                    raise ValueError(f"{key} must be an object")
+            unknown = set(request.get("weather", {})) - set(weather_defaults) | set(request.get("covid", {})) - set(covid_defaults)
+            if len(unknown) > 0:
+                raise ValueError(f"Unknown features: {', '.join(sorted(unknown))}")
+            rows.append(prediction_features(self.db, self.pop, request["date"], request.get("weather"), request.get("covid")))
+        if len(rows) == 0:
+            return([])
+        return([float(calls) for calls in self.model.predict(pd.DataFrame(rows)[self.features])])
+
+
+class predictionHandler(BaseHTTPRequestHandler):
+    """
+    Handle the requests of the prediction server:
+    - GET /health: returns {"status": "ok"}.
+    - GET /predict?date=YYYY-MM-DD&TMAX=...: prediction for one date. Weather and covid features
+      can be passed as parameters.
+    - POST /predict: prediction for one request {"date": ..., "weather": {...}, "covid": {...}}.
+    - POST /predict/batch: predictions for {"requests": [...]}.
+    """
+    predictor = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self.__respond(200, {"status": "ok"})
+        elif url.path == "/predict":
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            request = {"date": params.pop("date", None),
+                       "weather": {key: params.pop(key) for key in weather_defaults.keys() if key in params},
+                       "covid": {key: params.pop(key) for key in covid_defaults.keys() if key in params}}
+            if len(params) > 0:
+                self.__respond(400, {"error": f"Unknown parameters: {', '.join(sorted(params))}"})
+                return
+            self.__predict([request], single=True)
+        else:
+            self.__respond(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.__respond(400, {"error": "Invalid Content-Length"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or "{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self.__respond(400, {"error": "Invalid JSON"})
+            return
+        if url.path == "/predict":
+            self.__predict([body], single=True)
+        elif url.path == "/predict/batch" and type(body) != dict:
+            self.__respond(400, {"error": "Invalid request: the body must be an object"})
+        elif url.path == "/predict/batch":
+            self.__predict(body.get("requests", []), single=False)
+        else:
+            self.__respond(404, {"error": "Not found"})
+
+    def __predict(self, requests, single):
+        try:
+            predictions = self.predictor.predict(requests)
+        except (KeyError, TypeError, ValueError) as e:
+            self.__respond(400, {"error": f"Invalid request: {e}"})
+            return
+        results = [{"date": request["date"], "calls": calls} for request, calls in zip(requests, predictions)]
+        if single:
+            self.__respond(200, results[0])
+        else:
+            self.__respond(200, {"predictions": results})
+
+    def __respond(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(predictor, host="127.0.0.1", port=8000):
+    """
+    Create the HTTP server answering requests with predictor. Every request is handled in its
+    own thread. Call serve_forever() on the returned server to start it.
+    """
+    handler = type("handler", (predictionHandler,), {"predictor": predictor})
+    return(ThreadingHTTPServer((host, port), handler))
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    db = callDB(db_file=args[1], load_only=True)
+    port = 8000
+    if len(args) > 2:
+        port = int(args[2])
+    model_file = "model.pkl"
+    if len(args) > 3:
+        model_file = args[3]
+    server = create_server(callsPredictor(db, model_file=model_file), port=port)
+    print(f"Serving predictions on http://127.0.0.1:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,39 @@
+import asyncio
+import sqlite3
+import pytest
+
+from call_db.calls import callDB
+from call_db.async_calls import asyncCallDB
+
+csv_fn = "test.csv"
+
+
+def test_async_queries(tmp_path):
+    db_file = str(tmp_path / "async.db")
+    db = callDB(csv_fn, db_file, dmin="2022-01-01", dmax="2022-01-10", weather_data="weather_data.csv", covid_data="COVID.csv")
+    days = [row[0] for row in db.query_db("SELECT id FROM dates ORDER BY id;")]
+
+    async def run():
+        async with asyncCallDB(db_file, readers=3) as adb:
+            results = await asyncio.gather(*[adb.get_date_details(day) for day in days*10])
+            assert results == [db.get_date_details(day) for day in days*10]
+
+            start, end = db.first_timestamp, db.last_timestamp
+            assert await adb.count_between(start_ts=start, end_ts=end) == db.count_between(start_ts=start, end_ts=end)
+            assert await adb.get_weather(days[3]) == db.get_weather(days[3])
+            assert await adb.get_covid_info(days[3]) == db.get_covid_info(days[3])
+            assert await adb.get_type_stats(date=days[3]) == db.get_type_stats(date=days[3])
+            assert await adb.get_hourly_stats(date=days[3]) == db.get_hourly_stats(date=days[3])
+            results = await asyncio.gather(*[adb.find_calls_near(47.6062, -122.3321, radius, start_ts=start) for radius in [500, 1000, 2000]])
+            assert results == [db.find_calls_near(47.6062, -122.3321, radius, start_ts=start) for radius in [500, 1000, 2000]]
+            assert await adb.nearest_calls(47.6062, -122.3321, 5) == db.nearest_calls(47.6062, -122.3321, 5)
+            assert await adb.find_calls_in_box(47.6, 47.62, -122.34, -122.32) == db.find_calls_in_box(47.6, 47.62, -122.34, -122.32)
+
+            # Reads use read-only connections, writes go through the writer.
+            with pytest.raises(sqlite3.OperationalError):
+                await adb.query_db("UPDATE dates SET calls = 0;")
+            await adb.write_db("UPDATE dates SET calls = 0 WHERE id = ?;", (days[3],), dates=[days[3]])
+            assert (await adb.get_date_details(days[3]))["calls"] == 0
+
+    asyncio.run(run())
+    db.close()
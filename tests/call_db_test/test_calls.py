@@ -1,6 +1,10 @@
+import os
+import tempfile
 import pytest
+import pandas as pd
 
 from call_db.calls import callDB
+from call_db.count_index import countIndex
 import datetime as dt
 
 start_date = "2022-01-01"
@@ -8,7 +12,7 @@ end_date = "2022-01-31"
 weather_fn = "weather_data.csv"
 csv_fn = "test.csv"#Seattle_Real_Time_Fire_911_Calls_20240111.csv"
 
-db_fn = "test.db"
+db_fn = os.path.join(tempfile.mkdtemp(), "test.db")
 
 #call(["rm", db_fn])
 db = callDB(csv_fn, db_fn, rebuild=True, dmin=start_date, dmax=end_date)
@@ -184,3 +188,399 @@ def test_load_weather_info():
  'WT05': 0.0,
  'WT06': 0.0,
  'WT08': 0.0}
+
+def test_batch_size(tmp_path):
+    small_batch_db = callDB(csv_fn, str(tmp_path / "batch.db"), rebuild=True, dmin=start_date, dmax=end_date, batch_size=100)
+
+    assert small_batch_db.count_between() == db.count_between()
+    assert small_batch_db.get_date_details("2022-01-13") == db.get_date_details("2022-01-13")
+
+def test_columnar_engine(tmp_path):
+    columnar_db = callDB(csv_fn, str(tmp_path / "columnar.db"), rebuild=True, dmin=start_date, dmax=end_date, engine="columnar")
+
+    query = "SELECT * FROM calls ORDER BY id;"
+    assert columnar_db.query_db(query) == db.query_db(query)
+    assert columnar_db.holiday_dict == db.holiday_dict
+
+def test_parallel_engine(tmp_path):
+    parallel_db = callDB(csv_fn, str(tmp_path / "parallel.db"), rebuild=True, dmin=start_date, dmax=end_date, engine="parallel", workers=2)
+
+    query = "SELECT * FROM calls ORDER BY id;"
+    assert parallel_db.query_db(query) == db.query_db(query)
+    assert parallel_db.holiday_dict == db.holiday_dict
+
+def test_indexes():
+    indexes = [row[1] for row in db.query_db("PRAGMA index_list(calls);")]
+    assert {"calls_timestamp", "calls_timestamp_type", "calls_timestamp_hour"}.issubset(indexes)
+
+    plan = db.query_db("EXPLAIN QUERY PLAN SELECT type FROM calls WHERE timestamp >= ? AND timestamp < ?;", (0, 1))
+    assert "COVERING INDEX calls_timestamp_type" in plan[0][3]
+
+def test_dates_table_matches_range_queries():
+    day = db.first_date
+    while day <= db.last_date:
+        details = db.get_date_details(day.strftime("%Y-%m-%d"))
+        assert details["calls"] == db.count_daily(day.strftime("%Y-%m-%d"))
+        assert details["type_stats"] == db.get_type_stats(day)
+        assert details["hourly_stats"] == db.get_hourly_stats(day)
+        day += dt.timedelta(days=1)
+
+def test_transaction():
+    query = "SELECT calls FROM dates WHERE id = ?;"
+    with pytest.raises(ZeroDivisionError):
+        with db.transaction() as conn:
+            db.write_db("UPDATE dates SET calls = 0 WHERE id = ?;", ("2022-01-13",), connection=conn)
+            1/0
+    assert db.query_db(query, ("2022-01-13",)) == [(318,)]
+
+    with db.transaction() as conn:
+        db.write_db("UPDATE dates SET calls = 0 WHERE id = ?;", ("2022-01-13",), connection=conn)
+        db.write_db("UPDATE dates SET calls = 318 WHERE id = ?;", ("2022-01-13",), connection=conn)
+    assert db.query_db(query, ("2022-01-13",)) == [(318,)]
+
+def test_transaction_joins_batches(tmp_path):
+    tx_db = callDB(csv_fn, str(tmp_path / "transaction.db"), dmin="2022-01-01", dmax="2022-01-10")
+
+    # Bulk loads within a transaction block are rolled back with it.
+    with pytest.raises(ZeroDivisionError):
+        with tx_db.transaction() as conn:
+            tx_db.load_covid_info("COVID.csv", connection=conn)
+            tx_db.load_weather_info("weather_data.csv", connection=conn)
+            assert tx_db.query_db("SELECT COUNT(*) FROM covid;", connection=conn)[0][0] > 0
+            1/0
+    tables = [row[1] for row in tx_db.query_db("PRAGMA table_list")]
+    assert "covid" not in tables and "weather" not in tables
+    assert not tx_db.covid_info and not tx_db.weather_info
+
+    with tx_db.transaction() as conn:
+        tx_db.load_covid_info("COVID.csv", connection=conn)
+    assert tx_db.get_covid_info("2022-01-05") != None
+    tx_db.close()
+
+def test_connections():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda day: db.count_daily(date=day), ["2022-01-06"]*8))
+    assert results == [336]*8
+
+    # The connections of finished threads are closed.
+    db.query_db("SELECT 1;")
+    for i in range(20):
+        thread = threading.Thread(target=db.query_db, args=("SELECT COUNT(*) FROM calls;",))
+        thread.start()
+        thread.join()
+    assert len(db._callDB__connections) == 1
+
+    db.close()
+    assert db.count_daily(date="2022-01-06") == 336
+
+def test_load_weather_info_keeps_entries():
+    db.write_db("UPDATE weather SET tmin = ? WHERE date = ?;", (-1.0, "2022-01-14"))
+    db.load_weather_info("weather_data.csv")
+    assert db.get_weather("2022-01-14")["TMIN"] == -1.0
+
+    db.load_weather_info("weather_data.csv", rebuild=True)
+    assert db.get_weather("2022-01-14")["TMIN"] == 3.3
+
+def test_load_covid_info():
+    db.load_covid_info("COVID.csv", rebuild=True)
+    assert db.get_covid_info("2022-01-11") == {"pandemic": 1,
+        "pcr_test": 10968,
+        "pcr_pos": 1833,
+        "hosp_cnt": 16,
+        "death_cnt": 3,
+        "seven_day_pcr_test": 65293,
+        "seven_day_pcr_pos": 12694,
+        "seven_day_hosp_cnt": 98,
+        "seven_day_death_cnt": 15}
+
+    days = [db.first_date + dt.timedelta(days=i) for i in range((db.last_date - db.first_date).days + 1)]
+    info = [db.get_covid_info(day.strftime("%Y-%m-%d")) for day in days]
+    for i in range(len(days)):
+        window = info[max(i-6, 0):i+1]
+        assert info[i]["seven_day_hosp_cnt"] == sum([entry["hosp_cnt"] for entry in window])
+        assert info[i]["seven_day_pcr_test"] == sum([entry["pcr_test"] for entry in window])
+
+def test_find_weather_days():
+    result = db.find_weather_days([("tmax", "<", 7), ("WT01", "=", 1)])
+    assert "2022-01-16" in result
+    assert all([db.get_weather(day)["TMAX"] < 7 for day in result])
+
+    for filters in [[("tmax < 7) OR (1", "=", 1)], [("tmax", "< 7 OR 1 =", 1)]]:
+        with pytest.raises(ValueError):
+            db.find_weather_days(filters)
+
+def test_migrate_legacy_db(tmp_path):
+    import shutil
+    import json
+
+    # Turn a copy of the test database into a v0.4.0 database with json columns for the
+    # weather data and the daily details.
+    db_file = str(tmp_path / "v0.4.0.db")
+    shutil.copy(db_fn, db_file)
+    old_db = callDB(db_file=db_file, load_only=True)
+    days = [row[0] for row in old_db.query_db("SELECT id FROM dates;")]
+    old_db.write_db("ALTER TABLE dates ADD COLUMN details text;")
+    old_db.write_db("ALTER TABLE dates ADD COLUMN weather text;")
+    for day in days:
+        old_db.write_db("UPDATE dates SET details = ?, weather = ? WHERE id = ?;",
+                        (json.dumps(db.get_date_details(day)), json.dumps(db.get_weather(day)), day))
+    old_db.write_db("UPDATE dates SET month = day_of_year, day = month, day_of_year = day;")
+    for table in ["weather", "daily_type_counts", "daily_hourly_counts", "holiday_names",
+                  "rollup_counts", "rollup_type_counts", "rollup_state", "calls_rtree"]:
+        old_db.write_db(f"DROP TABLE {table};")
+    for trigger in ["calls_rtree_insert", "calls_rtree_delete", "calls_rtree_update"]:
+        old_db.write_db(f"DROP TRIGGER {trigger};")
+    old_db.write_db("UPDATE version SET id = ?;", ("v0.4.0",))
+    old_db.close()
+
+    migrated_db = callDB(db_file=db_file, load_only=True)
+    for day in days:
+        assert migrated_db.get_weather(day) == db.get_weather(day)
+        assert migrated_db.get_date_details(day) == db.get_date_details(day)
+    assert migrated_db.query_db("SELECT * FROM dates ORDER BY id;") == db.query_db("SELECT * FROM dates ORDER BY id;")
+    assert migrated_db.get_rollup("week", by_type=True) == db.get_rollup("week", by_type=True)
+    assert migrated_db.nearest_calls(47.6062, -122.3321, 20) == db.nearest_calls(47.6062, -122.3321, 20)
+
+def test_daily_counts():
+    assert db.get_daily_type_counts("2022-01-13", types=["Aid Response", "Rubbish Fire", "Unknown"]) == {'Aid Response': 133, 'Rubbish Fire': 6}
+    assert db.get_daily_hourly_counts("2022-01-13") == db.get_hourly_stats(date="2022-01-13")
+
+    result = db.get_date_details("2022-01-13", type_stats=False, hourly_stats=False)
+    assert "type_stats" not in result and "hourly_stats" not in result
+    assert result["calls"] == 318
+    assert db.query_db("SELECT month, day, day_of_year FROM dates WHERE id = ?;", ("2022-01-13",)) == [(1, 13, 13)]
+
+def test_hourly_matrix():
+    matrix = db.get_hourly_matrix("2022-01-12", "2022-01-14")
+    assert matrix.shape == (3, 24)
+    for i, day in enumerate(["2022-01-12", "2022-01-13", "2022-01-14"]):
+        assert list(matrix[i]) == db.get_daily_hourly_counts(day)
+    assert db.get_hourly_matrix().sum() == db.query_db("SELECT SUM(calls) FROM dates;")[0][0]
+
+def test_rollups():
+    dates = db.query_db("SELECT id, calls FROM dates;")
+    months = {}
+    for day, calls in dates:
+        months[day[:7]] = months.get(day[:7], 0) + calls
+    assert db.get_rollup("month") == months
+    assert db.get_rollup("year") == {"2022": sum(months.values())}
+
+    # The rollups equal direct counts of the calls within the day bounds of the dates table and
+    # leave out exactly the calls after DAY_END.
+    from call_db.calls import DAY_END
+    direct = db.query_db(f"SELECT year, month, COUNT(*) FROM calls WHERE hour*3600 + minute*60 + second < {DAY_END} GROUP BY year, month;")
+    assert db.get_rollup("month") == {f"{year:04d}-{month:02d}": cnt for year, month, cnt in direct}
+    late = db.query_db(f"SELECT COUNT(*) FROM calls WHERE hour*3600 + minute*60 + second >= {DAY_END};")[0][0]
+    assert sum(db.get_rollup("year").values()) + late == db.query_db("SELECT COUNT(*) FROM calls;")[0][0]
+    assert db.get_rollup("week")["2022-01-10"] == sum([calls for day, calls in dates if "2022-01-10" <= day <= "2022-01-16"])
+    assert db.get_rollup("month", by_type=True, types=["Aid Response"])["2022-01"]["Aid Response"] == \
+        db.query_db("SELECT SUM(count) FROM daily_type_counts WHERE type = 'Aid Response';")[0][0]
+
+    for first, last in [("2022-01-01", "2022-01-30"), ("2021-12-01", "2022-12-31"), ("2022-01-05", "2022-01-24"), ("2022-01-13", "2022-01-13")]:
+        assert db.count_days(first, last) == sum([calls for day, calls in dates if first <= day <= last])
+        assert db.count_days(first, last, call_type="Medic Response") == db.query_db(
+            "SELECT IFNULL(SUM(count), 0) FROM daily_type_counts WHERE type = 'Medic Response' AND date >= ? AND date <= ?;", (first, last))[0][0]
+
+def test_rollups_incremental(tmp_path):
+    db_file = str(tmp_path / "incremental.db")
+    callDB(csv_fn, db_file, dmin="2022-01-01", dmax="2022-01-10").close()
+    updated = callDB(csv_fn, db_file, dmin="2022-01-01", dmax="2022-01-20")
+    full = callDB(csv_fn, str(tmp_path / "full.db"), dmin="2022-01-01", dmax="2022-01-20")
+    for period in ["week", "month", "year"]:
+        assert updated.get_rollup(period, by_type=True) == full.get_rollup(period, by_type=True)
+        assert updated.get_rollup(period) == full.get_rollup(period)
+    assert updated.query_db("SELECT * FROM dates ORDER BY id;") == full.query_db("SELECT * FROM dates ORDER BY id;")
+    assert updated.find_calls_near(47.6062, -122.3321, 2000) == full.find_calls_near(47.6062, -122.3321, 2000)
+    updated.close()
+    full.close()
+
+def test_count_index_threads(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Concurrent lookups after a change of the data build the index only once.
+    db.build_count_index("hour")
+    expected = db.count_between(start_ts=db.first_timestamp, end_ts=db.last_timestamp)
+    db.write_db("UPDATE calls SET type = type WHERE rowid = 1;")
+    builds = []
+    original = countIndex.__init__
+    def counting_init(self, *args, **kwargs):
+        builds.append(True)
+        original(self, *args, **kwargs)
+    monkeypatch.setattr(countIndex, "__init__", counting_init)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda i: db.count_between(start_ts=db.first_timestamp, end_ts=db.last_timestamp), range(32)))
+    assert results == [expected]*32
+    assert len(builds) == 1
+    db.drop_count_index()
+
+def test_incremental_keeps_indexes(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "incremental.db")
+    callDB(csv_fn, db_file, dmin="2022-01-01", dmax="2022-01-10").close()
+    dropped = []
+    monkeypatch.setattr(callDB, "drop_indexes", lambda self, *args, **kwargs: dropped.append(True))
+    updated = callDB(csv_fn, db_file, dmin="2022-01-01", dmax="2022-01-20")
+    assert dropped == []
+    assert len(updated.query_db("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'calls_rtree_%';")) == 3
+    assert updated.query_db("SELECT COUNT(*) FROM dates;")[0][0] == 19
+    updated.close()
+
+def test_count_index(tmp_path):
+    import random
+
+    random.seed(0)
+    bounds = [(db.first_timestamp, db.last_timestamp), (db.first_timestamp, db.last_timestamp + 1), (0, 2e9)]
+    for i in range(100):
+        start = random.uniform(db.first_timestamp - 3600, db.last_timestamp + 3600)
+        bounds.append((start, start + random.choice([0, 1, 59.5, 60, 3600, 86399, 86400*7])))
+        bounds.append((int(start), int(start) + 60))
+    bounds += [db._callDB__date_to_ts(day) for day in ["2022-01-06", "2022-01-13"]]
+    expected = [db.count_between(start_ts=start, end_ts=end) for start, end in bounds]
+    expected_type = [db.count_between(start_ts=start, end_ts=end, call_type="Aid Response") for start, end in bounds]
+
+    for resolution in ["second", "minute", "hour"]:
+        db.build_count_index(resolution, mmap_dir=str(tmp_path) if resolution == "minute" else None)
+        assert [db.count_between(start_ts=start, end_ts=end) for start, end in bounds] == expected
+        assert [db.count_between(start_ts=start, end_ts=end, call_type="Aid Response") for start, end in bounds] == expected_type
+    assert db.count_between(start_ts=db.last_timestamp, end_ts=db.first_timestamp) == 0
+    assert len(list(tmp_path.glob("counts_*.npy"))) == 2
+
+    # The index is built again after the data has changed.
+    start, end = db._callDB__date_to_ts("2022-01-13")
+    row = db.query_db("SELECT * FROM calls WHERE timestamp >= ? ORDER BY timestamp LIMIT 1;", (start,))[0]
+    db.write_db("DELETE FROM calls WHERE id = ?;", (row[0],))
+    assert db.count_between(start_ts=start, end_ts=end) == 317
+    db.write_db("INSERT INTO calls VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);", row)
+    assert db.count_between(start_ts=start, end_ts=end) == 318
+
+    # Changes by another connection to the same database are detected as well.
+    other = callDB(db_file=db_fn, load_only=True)
+    other.write_db("DELETE FROM calls WHERE id = ?;", (row[0],))
+    assert db.count_between(start_ts=start, end_ts=end) == 317
+    other.write_db("INSERT INTO calls VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);", row)
+    assert db.count_between(start_ts=start, end_ts=end) == 318
+    other.close()
+    db.drop_count_index()
+
+def test_cache():
+    db.cache.invalidate()
+    misses = db.cache_info()["misses"]
+    details = db.get_date_details("2022-01-13")
+    details["type_stats"]["Aid Response"] = 0
+    assert db.get_date_details("2022-01-13")["type_stats"]["Aid Response"] == 133
+    assert db.cache_info()["misses"] == misses + 1
+
+    assert db.count_daily(date="2022-01-13") == 318
+    assert db.count_daily(date_tuple=(2022, 1, 13)) == 318
+    assert db.get_type_stats(date="2022-01-12") == db.get_type_stats(date="2022-01-12")
+    assert db.cache_info()["hits"] >= 3
+
+    # Writes only invalidate the given dates.
+    db.write_db("UPDATE dates SET calls = 0 WHERE id = ?;", ("2022-01-13",), commit=True, dates=["2022-01-13"])
+    assert db.get_date_details("2022-01-13")["calls"] == 0
+    db.write_db("UPDATE dates SET calls = 318 WHERE id = ?;", ("2022-01-13",), commit=True, dates=["2022-01-13"])
+    assert db.get_date_details("2022-01-13")["calls"] == 318
+    assert db.cache_info()["size"] > 1
+
+    db.write_db("UPDATE weather SET tmax = ? WHERE date = ?;", (-5.0, "2022-01-14"))
+    assert db.get_weather("2022-01-14")["TMAX"] == -5.0
+    db.load_weather_info("weather_data.csv", rebuild=True)
+    assert db.get_weather("2022-01-14")["TMAX"] != -5.0
+
+def test_cache_date_keys():
+    # Dates, datetimes and date strings share the cache entries of a date.
+    db.cache.invalidate()
+    details = db.get_date_details(dt.datetime(2022, 1, 13))
+    misses = db.cache_info()["misses"]
+    assert db.get_date_details("2022-01-13") == details
+    assert db.get_date_details(dt.date(2022, 1, 13)) == details
+    assert db.get_covid_info(dt.datetime(2022, 1, 13)) == db.get_covid_info("2022-01-13")
+    assert db.get_weather(dt.datetime(2022, 1, 14)) == db.get_weather("2022-01-14")
+    assert db.cache_info()["misses"] == misses + 2
+
+    # Invalidating the date string removes the entries looked up with a datetime.
+    db.write_db("UPDATE dates SET calls = 0 WHERE id = ?;", ("2022-01-13",), commit=True, dates=["2022-01-13"])
+    assert db.get_date_details(dt.datetime(2022, 1, 13))["calls"] == 0
+    db.write_db("UPDATE dates SET calls = 318 WHERE id = ?;", ("2022-01-13",), commit=True, dates=[dt.datetime(2022, 1, 13)])
+    assert db.get_date_details("2022-01-13")["calls"] == 318
+
+def test_cache_size(tmp_path):
+    small = callDB(csv_fn, str(tmp_path / "small.db"), dmin="2022-01-01", dmax="2022-01-05", cache_size=2)
+    for day in ["2022-01-01", "2022-01-02", "2022-01-03", "2022-01-01"]:
+        small.count_daily(date=day)
+    assert small.cache_info() == {"hits": 0, "misses": 4, "size": 2, "maxsize": 2}
+    small.close()
+
+def test_get_feature_matrix():
+    categories = ["Aid Response", "Medic Response", "Unknown"]
+    result = db.get_feature_matrix(db.first_date, db.last_date, categories)
+    assert len(result) == (db.last_date - db.first_date).days + 1
+
+    for i, row in result.iterrows():
+        day = (db.first_date + dt.timedelta(days=i)).strftime("%Y-%m-%d")
+        details = db.get_date_details(day)
+        weather = db.get_weather(day)
+        covid = db.get_covid_info(day)
+        assert row["CALLS"] == details["calls"]
+        assert row["HOLIDAY"] == details["holiday"]
+        assert row["WEEKEND_BOOL"] == int(details["weekday"] >= 5)
+        assert row["WINTER"] == details["Winter"] and row["SUMMER"] == details["Summer"]
+        assert row["TMAX"] == weather["TMAX"] and row["HAZE"] == weather["WT08"]
+        assert row["WEEKLY_HOSP_CNT"] == covid["seven_day_hosp_cnt"]
+        assert row["Aid Response"] == details["type_stats"].get("Aid Response", 0)
+        assert row["Unknown"] == 0
+        assert row["Misc Emergencies"] == details["calls"] - row["Aid Response"] - row["Medic Response"]
+
+def test_feature_cache(tmp_path):
+    import os
+
+    cache_dir = str(tmp_path / "cache")
+    categories = ["Aid Response", "Rescue Lock In/Out"]
+    result = db.get_feature_matrix(db.first_date, db.last_date, categories, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    cached = db.get_feature_matrix(db.first_date, db.last_date, categories, cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(cached, result)
+
+    # Changing the data invalidates the cache.
+    fingerprint = db.fingerprint()
+    db.write_db("DELETE FROM covid WHERE id = ?;", (str(db.last_date),))
+    assert db.fingerprint() != fingerprint
+    result = db.get_feature_matrix(db.first_date, db.last_date, categories, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    assert result["WEEKLY_HOSP_CNT"].isna().iloc[-1]
+    db.load_covid_info("COVID.csv")
+
+def test_spatial_index():
+    from call_db.calls import _haversine
+
+    calls = db.query_db("SELECT id, type, timestamp, lat, lon FROM calls WHERE lat IS NOT NULL;")
+    assert db.query_db("SELECT COUNT(*) FROM calls_rtree;")[0][0] == len(calls)
+
+    # Bounding box, combined with a time range and a type.
+    start_ts = dt.datetime(2022, 1, 5).timestamp()
+    end_ts = dt.datetime(2022, 1, 10).timestamp()
+    result = db.find_calls_in_box(47.6, 47.62, -122.34, -122.32, start="2022-01-05 00:00:00", end="2022-01-10 00:00:00")
+    expected = [row for row in calls if 47.6 <= row[3] <= 47.62 and -122.34 <= row[4] <= -122.32 and start_ts <= row[2] < end_ts]
+    assert len(result) > 0
+    assert result == sorted(expected, key=lambda row: (row[2], row[0]))
+    assert db.find_calls_in_box(47.6, 47.62, -122.34, -122.32, call_type="Aid Response") == \
+        sorted([row for row in calls if 47.6 <= row[3] <= 47.62 and -122.34 <= row[4] <= -122.32 and row[1] == "Aid Response"], key=lambda row: (row[2], row[0]))
+
+    # Radius and nearest neighbors compared with the distances of all calls.
+    distances = sorted([row + (_haversine(47.6062, -122.3321, row[3], row[4]),) for row in calls], key=lambda row: (row[5], row[2], row[0]))
+    assert db.find_calls_near(47.6062, -122.3321, 1000) == [row for row in distances if row[5] <= 1000]
+    assert db.nearest_calls(47.6062, -122.3321, 50) == distances[:50]
+    assert db.nearest_calls(0, 0, 3, radius=1000) == sorted([row + (_haversine(0, 0, row[3], row[4]),) for row in calls], key=lambda row: (row[5], row[2], row[0]))[:3]
+    assert db.nearest_calls(47.6062, -122.3321, 5, start_ts=start_ts, end_ts=end_ts) == [row for row in distances if start_ts <= row[2] < end_ts][:5]
+
+    # The index follows updates, deletes and inserts of the calls table.
+    call = distances[0]
+    row = db.query_db("SELECT * FROM calls WHERE id = ?;", (call[0],))[0]
+    db.write_db("UPDATE calls SET lat = ?, lon = ? WHERE id = ?;", (47.0, -122.0, call[0]), dates=[])
+    assert db.find_calls_near(47.0, -122.0, 1) == [call[:3] + (47.0, -122.0, 0.0)]
+    db.write_db("DELETE FROM calls WHERE id = ?;", (call[0],), dates=[])
+    assert db.find_calls_near(47.0, -122.0, 1) == []
+    db.write_db("INSERT INTO calls VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);", row, dates=[])
+    assert db.nearest_calls(47.6062, -122.3321, 50) == distances[:50]
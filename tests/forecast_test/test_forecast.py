@@ -0,0 +1,38 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from call_db.calls import callDB
+from pop_predict.predict import populationPredictor
+from train import train_model, prediction_features, relevant_features
+from forecast import batch_features, forecast, write_forecast
+
+
+def test_forecast(tmp_path):
+    db = callDB("test.csv", str(tmp_path / "forecast.db"), dmin="2022-01-01", dmax="2022-01-20",
+                weather_data="weather_data.csv", covid_data="COVID.csv")
+    model = train_model(relevant_features, cache_dir=None, call_db=db)["model"]
+    pop = populationPredictor()
+
+    # The batch features equal the features of single dates.
+    dates = pd.date_range("2019-12-20", "2026-01-10", freq="D").strftime("%Y-%m-%d")
+    features = batch_features(db, pop, dates)[relevant_features]
+    expected = pd.DataFrame([prediction_features(db, pop, date) for date in dates])[relevant_features]
+    pd.testing.assert_frame_equal(features, expected, check_dtype=False)
+
+    scenarios = pd.DataFrame({"DATE": ["2024-07-04", "2024-12-24"], "TMAX": [30, np.nan], "WEEKLY_HOSP_CNT": [5, 80]})
+    result = forecast(model, db, scenarios=scenarios, pop=pop)
+    rows = [prediction_features(db, pop, "2024-07-04", {"TMAX": 30}, {"WEEKLY_HOSP_CNT": 5}),
+            prediction_features(db, pop, "2024-12-24", None, {"WEEKLY_HOSP_CNT": 80})]
+    assert (result["CALLS"] == model.predict(pd.DataFrame(rows)[relevant_features])).all()
+    assert list(result["DATE"]) == ["2024-07-04", "2024-12-24"]
+
+    result = forecast(model, db, first_date="2024-01-01", last_date="2024-12-31", pop=pop)
+    assert len(result) == 366
+    write_forecast(result, str(tmp_path / "forecast.csv"))
+    assert len(pd.read_csv(str(tmp_path / "forecast.csv"))) == 366
+    write_forecast(result, str(tmp_path / "forecast.db"))
+    conn = sqlite3.connect(str(tmp_path / "forecast.db"))
+    assert conn.execute("SELECT COUNT(*), MIN(DATE) FROM forecasts;").fetchall() == [(366, "2024-01-01")]
+    conn.close()
+    db.close()
@@ -10,3 +10,14 @@ def test_predict():
 
     result = pop.predict(2050)
     assert result == 3795162
+
+def test_predict_many():
+    years = [1958, 2020, 2024, 2025, 2050, 2025, 2100]
+    result = pop.predict_many(years)
+    assert list(result) == [pop.predict(year) for year in years]
+    assert result[4] == 3795162
+    assert len(pop.predict_many([])) == 0
+
+    # The projection starts at the last known year.
+    other = populationPredictor({2000: 100000, 2001: 110000, 2002: 121000})
+    assert other.last_year == 2002 and other.predict(2003) == 133100
@@ -0,0 +1,60 @@
+import json
+import threading
+import urllib.request
+import urllib.error
+import http.client
+import pytest
+
+from call_db.calls import callDB
+from serve import callsPredictor, create_server
+
+
+def test_serve(tmp_path):
+    db = callDB("test.csv", str(tmp_path / "serve.db"), dmin="2022-01-01", dmax="2022-01-31",
+                weather_data="weather_data.csv", covid_data="COVID.csv")
+    predictor = callsPredictor(db, cache_dir=None)
+    server = create_server(predictor, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def request(path, content=None):
+        data = None if content == None else json.dumps(content).encode()
+        with urllib.request.urlopen(urllib.request.Request(url + path, data=data)) as response:
+            return(json.loads(response.read()))
+
+    assert request("/health") == {"status": "ok"}
+
+    # Missing values are replaced by the defaults of the interactive prompts.
+    default = predictor.predict([{"date": "2024-02-01", "weather": {"TMAX": 18, "PRCP": 0}}])[0]
+    assert request("/predict?date=2024-02-01") == {"date": "2024-02-01", "calls": default}
+    assert request("/predict", {"date": "2024-02-01", "covid": {"WEEKLY_HOSP_CNT": 0}})["calls"] == default
+
+    cold = predictor.predict([{"date": "2024-02-01", "weather": {"TMAX": -5, "SNOW_BOOL": 1}}])[0]
+    assert request("/predict?date=2024-02-01&TMAX=-5&SNOW_BOOL=1")["calls"] == cold
+
+    batch = [{"date": "2024-02-01"}, {"date": "2024-02-01", "weather": {"TMAX": -5, "SNOW_BOOL": 1}}]
+    assert request("/predict/batch", {"requests": batch})["predictions"] == [{"date": "2024-02-01", "calls": default},
+                                                                              {"date": "2024-02-01", "calls": cold}]
+
+    for path, content in [("/predict?date=2024-02-30", None), ("/predict?date=2024-02-01&RAIN=1", None),
+                          ("/predict", {"date": "2024-02-01", "weather": {"RAIN": 1}}),
+                          ("/predict", None), ("/predict", [1, 2]), ("/predict", {"date": 20240201}),
+                          ("/predict", {"date": "2024-02-01", "weather": [1]}),
+                          ("/predict/batch", {"requests": "ab"}), ("/predict/batch", [1]),
+                          ("/predict/batch", {"requests": [1]})]:
+        with pytest.raises(urllib.error.HTTPError) as e:
+            request(path, content)
+        assert e.value.code == 400
+
+    # Malformed bodies and lengths are answered with 400 as well.
+    for length, body in [("abc", b"{}"), ("-1", b"{}"), ("2", b"\xff\xfe")]:
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        conn.putrequest("POST", "/predict")
+        conn.putheader("Content-Length", length)
+        conn.endheaders(body)
+        assert conn.getresponse().status == 400
+        conn.close()
+
+    server.shutdown()
+    server.server_close()
+    db.close()
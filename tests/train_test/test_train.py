@@ -0,0 +1,110 @@
+import time
+import pytest
+import numpy as np
+
+from call_db.calls import callDB
+from train import train_model, save_model, load_model, load_or_train, relevant_features
+
+
+def test_model_artifact(tmp_path):
+    db = callDB("test.csv", str(tmp_path / "train.db"), dmin="2022-01-01", dmax="2022-01-20",
+                weather_data="weather_data.csv", covid_data="COVID.csv")
+    model_file = str(tmp_path / "model.pkl")
+
+    artifact = load_or_train(model_file, db, cache_dir=None)
+    assert artifact["features"] == relevant_features
+    assert artifact["first_date"] == "2022-01-01" and artifact["last_timestamp"] == db.last_timestamp
+    assert set(["mae", "rmse", "r2"]).issubset(artifact["metrics"])
+
+    # A matching artifact is loaded instead of training a new model.
+    start = time.perf_counter()
+    loaded = load_or_train(model_file, db, cache_dir=None, retrain=False)
+    assert time.perf_counter() - start < 1
+    features = db.get_feature_matrix(db.first_date, db.last_date)[relevant_features]
+    assert (loaded["model"].predict(features) == artifact["model"].predict(features)).all()
+
+    with pytest.raises(ValueError):
+        load_model(model_file, db, relevant_features[:-1])
+
+    # New data makes the artifact outdated.
+    db.close()
+    db = callDB("test.csv", str(tmp_path / "train.db"), dmin="2022-01-01", dmax="2022-01-25",
+                weather_data="weather_data.csv", covid_data="COVID.csv")
+    with pytest.raises(ValueError):
+        load_or_train(model_file, db, cache_dir=None, retrain=False)
+    retrained = load_or_train(model_file, db, cache_dir=None)
+    assert retrained["last_timestamp"] == db.last_timestamp
+    assert load_model(model_file, db)["last_date"] == str(db.last_date)
+    db.close()
+
+def test_category_models(tmp_path):
+    from train_categories import train_category_models, frequent_categories
+
+    db = callDB("test.csv", str(tmp_path / "categories.db"), dmin="2022-01-01", dmax="2022-01-30",
+                weather_data="weather_data.csv", covid_data="COVID.csv")
+    categories = frequent_categories(db, 300)
+    counts = dict(db.query_db("SELECT type, SUM(count) FROM daily_type_counts GROUP BY type;"))
+    assert categories == sorted([t for t in counts if counts[t] > 300], key=lambda t: (-counts[t], t))
+
+    artifact = train_category_models(db, 300, workers=2, cache_dir=None)
+    assert artifact["targets"] == ["CALLS"] + categories
+    assert set(artifact["models"]) == set(artifact["targets"]) == set(artifact["metrics"])
+
+    # The models are evaluated on the last quarter of the days.
+    calls = [row[0] for row in db.query_db("SELECT calls FROM dates ORDER BY id;")]
+    assert artifact["metrics"]["CALLS"]["mean_calls"] == pytest.approx(np.mean(calls[-8:]))
+
+    model_file = str(tmp_path / "categories.pkl")
+    save_model(artifact, model_file)
+    loaded = load_model(model_file, db)
+    features = db.get_feature_matrix(db.first_date, db.last_date)[relevant_features]
+    for target in artifact["targets"]:
+        assert (loaded["models"][target].predict(features) == artifact["models"][target].predict(features)).all()
+    db.close()
+
+def test_hourly_model(tmp_path):
+    from train_hourly import train_hourly_model, forecast_hourly
+
+    db = callDB("test.csv", str(tmp_path / "hourly.db"), dmin="2022-01-01", dmax="2022-01-30",
+                weather_data="weather_data.csv", covid_data="COVID.csv")
+    artifact = train_hourly_model(db, cache_dir=None)
+    assert set(["mae", "rmse", "daily_mae"]).issubset(artifact["metrics"])
+
+    result = forecast_hourly(artifact["model"], db, "2024-03-04")
+    assert len(result) == 168
+    assert list(result["HOUR"][:25]) == list(range(24)) + [0]
+    assert list(result["DATE"].unique()) == ["2024-03-04", "2024-03-05", "2024-03-06", "2024-03-07",
+                                             "2024-03-08", "2024-03-09", "2024-03-10"]
+    assert (result["CALLS"] >= 0).all()
+    db.close()
+
+def test_refresh_model(tmp_path):
+    from train import refresh_model, check_model
+
+    db_file = str(tmp_path / "refresh.db")
+    db = callDB("test.csv", db_file, dmin="2022-01-01", dmax="2022-01-20",
+                weather_data="weather_data.csv", covid_data="COVID.csv")
+    artifact = train_model(relevant_features, cache_dir=None, call_db=db)
+    db.close()
+
+    db = callDB("test.csv", db_file, dmin="2022-01-01", dmax="2022-01-25",
+                weather_data="weather_data.csv", covid_data="COVID.csv")
+    refreshed = refresh_model(artifact, db, added_estimators=10)
+    assert refreshed["model"].n_estimators == 260
+    assert artifact["model"].n_estimators == 250
+    assert refresh_model(refreshed, db) is refreshed
+    assert check_model(refreshed, db, relevant_features) == []
+    full = db.get_feature_matrix(db.first_date, db.last_date)
+    assert refreshed["data"].equals(full[relevant_features + ["CALLS"]])
+    assert refreshed["test_index"] == [i for i in artifact["test_index"] if i < 18]
+
+    # Changed data of trained days leads to a new model.
+    db.write_db("UPDATE weather SET tmax = tmax + 5 WHERE date = ?;", ("2022-01-05",), dates=["2022-01-05"])
+    assert len(check_model(refreshed, db, relevant_features)) == 1
+    retrained = refresh_model(artifact, db, added_estimators=10)
+    assert retrained["model"].n_estimators == 250 and check_model(retrained, db, relevant_features) == []
+
+    # A changed schema leads to a new model.
+    retrained = refresh_model(refreshed, db, relevant_features[:-1])
+    assert retrained["model"].n_estimators == 250 and retrained["features"] == relevant_features[:-1]
+    db.close()
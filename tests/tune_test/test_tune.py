@@ -0,0 +1,24 @@
+import json
+
+from call_db.calls import callDB
+from tune import tune, time_series_folds
+
+
+def test_time_series_folds():
+    folds = time_series_folds(100, n_splits=4)
+    assert len(folds) == 4
+    for train_index, test_index in folds:
+        assert train_index.max() < test_index.min()
+        assert list(train_index) == list(range(len(train_index)))
+
+
+def test_tune(tmp_path):
+    db = callDB("test.csv", str(tmp_path / "tune.db"), dmin="2022-01-01", dmax="2022-01-30",
+                weather_data="weather_data.csv", covid_data="COVID.csv")
+    results = tune(db, spaces=["GradientBoostingRegressor"], n_iter=3, n_splits=3, workers=2, cache_dir=None)
+    assert len(results) == 3
+    assert list(results.columns) == ["estimator", "params", "fit_time", "predict_time", "mae", "mae_std", "rmse"]
+    assert results["mae"].is_monotonic_increasing
+    assert (results["fit_time"] > 0).all()
+    assert set(json.loads(results["params"][0])) == set(["n_estimators", "learning_rate", "subsample", "max_depth"])
+    db.close()
@@ -1,5 +1,5 @@
 from call_db.calls import callDB
-from pop_predict.predict import populationPredictor
+from pop_predict.predict import shared_predictor
 import numpy as np
 import math
 import pandas as pd
@@ -11,96 +11,246 @@ from sklearn.model_selection import train_test_split
 from sklearn.model_selection import cross_val_score
 import sklearn.metrics as metrics
 import datetime as dt
+import os
+import pickle
+import copy
+import time
+import sklearn
 
-def collect_data(call_db, first_date, last_date, categories=None):
-    data = []
+relevant_features = ["POP", "PRCP", "MONTH", "TMAX", "SNOW_BOOL", "SUMMER", "WINTER", "HAZE", "HAIL", "WEEKEND_BOOL", "HOLIDAY_BOOL", "WEEKLY_HOSP_CNT", "WEEKLY_DEATH_CNT", "WEEKLY_PCR_TESTS", "WEEKLY_PCR_TESTS_POS", "PANDEMIC"]
 
-    delta = dt.timedelta(days=1)
-    day = first_date
+# Values used for a forecast if no weather or covid information is given.
+weather_defaults = {"PRCP": 0, "TMAX": 18, "SNOW_BOOL": 0, "HAZE": 0, "HAIL": 0}
+covid_defaults = {"WEEKLY_HOSP_CNT": 0, "WEEKLY_DEATH_CNT": 0, "WEEKLY_PCR_TESTS": 0, "WEEKLY_PCR_TESTS_POS": 0}
 
-    while day <= last_date:
-        details = call_db.get_date_details(day)
-        weather = call_db.get_weather(day)
-        covid = call_db.get_covid_info(day)
-        weekend = 0
-        holiday = 0
-        snow = 0
-    
-        if details["weekday"] >= 5:
-            weekend = 1
-        if details["holiday"] > 0:
-            holiday = 1
-        if weather["SNOW"] > 0:
-            snow = 1
-            
-        daily_data = {
-            #"HOURLY_CALLS": details["hourly_stats"],
-            "CALLS": details["calls"],
-            "DAY": details["day"],
-            "MONTH": details["month"],
-            "YEAR": details["year"],        
-            "HOLIDAY": details["holiday"],
+def collect_data(call_db, first_date, last_date, categories=None, cache_dir=None):
+    return(call_db.get_feature_matrix(first_date, last_date, categories, cache_dir=cache_dir))
+
+def prediction_features(call_db, pop, date, weather=None, covid=None):
+    """
+    Returns the features of a date to be predicted as a dictionary. Missing weather and covid
+    values are replaced by weather_defaults and covid_defaults.
+    """
+    if type(date) == str:
+        date = dt.datetime.strptime(date, "%Y-%m-%d").date()
+    weather = dict(weather_defaults, **(weather or {}))
+    covid = dict(covid_defaults, **(covid or {}))
+
+    weekend = 0
+    if date.weekday() in [5,6]:
+        weekend = 1
+
+    holiday = 0
+    if date in call_db.wa_holidays:
+        holiday = 1
+
+    pandemic_start = dt.date(2020,1,30)
+    pandemic_end = dt.date(2023,5,5)
+
+    pandemic = 0
+    if date > pandemic_start and date < pandemic_end:
+        pandemic = 1
+
+    season = call_db.get_season(date)
+    return({"POP": pop.predict(date.year),
+            "PRCP": float(weather["PRCP"]),
+            "MONTH": date.month,
+            "TMAX": float(weather["TMAX"]),
+            "SNOW_BOOL": int(weather["SNOW_BOOL"]),
+            "SUMMER": season["Summer"],
+            "WINTER": season["Winter"],
+            "HAZE": float(weather["HAZE"]),
+            "HAIL": float(weather["HAIL"]),
             "WEEKEND_BOOL": weekend,
             "HOLIDAY_BOOL": holiday,
-            "WEEKDAY": details["weekday"],
-            "POP": details["population"],
-            "DAY_YEAR": details["day_of_year"],
-            "WINTER": details["Winter"],
-            "SPRING": details["Spring"],
-            "SUMMER": details["Summer"], 
-            "FALL": details["Fall"],
-            "TMIN": weather["TMIN"],
-            "TMAX": weather["TMAX"],
-            "TAVG": weather["TAVG"],
-            "SNOW": weather["SNOW"],
-            "SNOW_BOOL": snow,
-            "PRCP": weather["PRCP"],
-            "FOG": weather["WT01"],
-            "HVY_FOG": weather["WT02"],
-            "THUNDER": weather["WT03"],
-            "ICE": weather["WT04"],
-            "HAIL": weather["WT05"],
-            "GLAZE": weather["WT06"],
-            "HAZE": weather["WT08"],    
-            "PCR_TESTS": covid["pcr_test"],
-            "WEEKLY_PCR_TESTS": covid["seven_day_pcr_test"],
-            "PCR_TESTS_POS": covid["pcr_pos"],
-            "WEEKLY_PCR_TESTS_POS": covid["seven_day_pcr_pos"],
-            "HOSP_CNT": covid["hosp_cnt"],
-            "DEATH_CNT": covid["death_cnt"],
-            "WEEKLY_HOSP_CNT": covid["seven_day_hosp_cnt"],
-            "WEEKLY_DEATH_CNT": covid["seven_day_death_cnt"],
-            "PANDEMIC": covid["pandemic"]
-        }
-
-        if categories != None:
-            sum = 0
-            cat_data = details["type_stats"]
-            for cat in categories:
-                if cat not in cat_data.keys():
-                    daily_data.update({cat: 0})
-                else:
-                    daily_data.update({cat: cat_data[cat]})
-                    sum += cat_data[cat]
-            daily_data.update({"Misc Emergencies": (details["calls"] - sum)})
-   
-        data.append(daily_data)
-        day += delta
-
-    return(pd.DataFrame(data))
-
-def calls_estimator(relevant_features):
-    full_data = collect_data(db, db.first_date, db.last_date)
+            "WEEKLY_HOSP_CNT": float(covid["WEEKLY_HOSP_CNT"]),
+            "WEEKLY_DEATH_CNT": float(covid["WEEKLY_DEATH_CNT"]),
+            "WEEKLY_PCR_TESTS": float(covid["WEEKLY_PCR_TESTS"]),
+            "WEEKLY_PCR_TESTS_POS": float(covid["WEEKLY_PCR_TESTS_POS"]),
+            "PANDEMIC": pandemic})
+
+def calls_estimator(relevant_features, cache_dir="feature_cache", call_db=None):
+    return(train_model(relevant_features, cache_dir=cache_dir, call_db=call_db)["model"])
+
+def train_model(relevant_features, cache_dir="feature_cache", call_db=None):
+    """
+    Train the estimator on all data of the database and return the model artifact: a dictionary
+    with the estimator, the ordered list of features, the training date range, the database
+    version, the last timestamp and the fingerprint of the data, the metrics on the test split
+    and the scikit-learn version. The artifact also keeps the training matrix (data, one row per
+    day), the rows of the test split (test_index) and the fingerprint of the data of the days
+    before the last training day (history), which are used by refresh_model.
+    """
+    if call_db == None:
+        call_db = db
+    start = time.perf_counter()
+    full_data = collect_data(call_db, call_db.first_date, call_db.last_date, cache_dir=cache_dir)
     rand_training_X, rand_test_X, rand_training_y, rand_test_y = train_test_split(full_data[relevant_features], full_data["CALLS"], random_state=42, test_size=0.25)
     model = GradientBoostingRegressor(n_estimators=250,
                                     learning_rate = 0.2,
                                     subsample = 0.75).fit(rand_training_X, rand_training_y)
-    return(model)
+    prediction = model.predict(rand_test_X)
+    fingerprint = call_db.fingerprint()
+    return({"model": model,
+            "features": list(relevant_features),
+            "first_date": str(call_db.first_date),
+            "last_date": str(call_db.last_date),
+            "db_version": fingerprint["version"],
+            "last_timestamp": call_db.last_timestamp,
+            "fingerprint": fingerprint,
+            "metrics": {"mae": metrics.mean_absolute_error(rand_test_y, prediction),
+                        "rmse": math.sqrt(metrics.mean_squared_error(rand_test_y, prediction)),
+                        "r2": metrics.r2_score(rand_test_y, prediction),
+                        "training_rows": len(rand_training_X),
+                        "test_rows": len(rand_test_X),
+                        "seconds": time.perf_counter() - start},
+            "sklearn_version": sklearn.__version__,
+            "data": full_data[list(relevant_features) + ["CALLS"]],
+            "history": call_db.history_fingerprint(call_db.last_date),
+            "test_index": list(rand_test_X.index)})
+
+def refresh_model(artifact, call_db=None, relevant_features=relevant_features, added_estimators=25, cache_dir="feature_cache"):
+    """
+    Update a model artifact with the days which were added to the database after its training
+    cutoff. Only the feature rows from the last training day on are collected and appended to
+    the stored training matrix (the last training day may have been incomplete). Then
+    added_estimators boosting stages are fitted with warm_start on a copy of the model. The test
+    split of the artifact is kept, so the metrics stay comparable.
+
+    The model is only refreshed if the only change of the data are appended days. It is trained
+    from scratch with train_model if the features, the database version, the scikit-learn
+    version or the first date changed, if the data of the trained days changed (e.g. backfilled
+    weather or covid rows), if there are no new days or if the artifact has no training matrix.
+    An artifact which matches the database is returned unchanged.
+    """
+    if call_db == None:
+        call_db = db
+    history = None
+    if "history" in artifact:
+        history = call_db.history_fingerprint(artifact["last_date"])
+    if len(check_model(artifact, call_db, relevant_features, history)) == 0:
+        return(artifact)
+    start = time.perf_counter()
+    fingerprint = call_db.fingerprint()
+    checks = [("features", artifact["features"], list(relevant_features)),
+              ("first_date", artifact["first_date"], str(call_db.first_date)),
+              ("db_version", artifact["db_version"], fingerprint["version"]),
+              ("sklearn_version", artifact["sklearn_version"], sklearn.__version__)]
+    changed = [name for name, old, new in checks if old != new]
+    if "data" not in artifact or "history" not in artifact or not hasattr(artifact["model"], "warm_start"):
+        changed.append("model")
+    if len(changed) == 0 and dt.date.fromisoformat(artifact["last_date"]) >= call_db.last_date:
+        changed.append("no new days")
+    if len(changed) == 0 and history != artifact["history"]:
+        changed.append("data of trained days")
+    if len(changed) > 0:
+        print(f"Cannot refresh the model ({', '.join(changed)}). Training a new model.")
+        return(train_model(relevant_features, cache_dir=cache_dir, call_db=call_db))
+
+    # Keep the rows before the last training day and append the rows from that day on.
+    kept = (dt.date.fromisoformat(artifact["last_date"]) - dt.date.fromisoformat(artifact["first_date"])).days
+    new_data = collect_data(call_db, artifact["last_date"], call_db.last_date)
+    data = pd.concat([artifact["data"].iloc[:kept], new_data[list(relevant_features) + ["CALLS"]]], ignore_index=True)
+    test_index = [i for i in artifact["test_index"] if i < kept]
+    train_index = np.setdiff1d(np.arange(len(data)), test_index)
+
+    # Add boosting stages fitted to the residuals of the existing stages.
+    model = copy.deepcopy(artifact["model"])
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + added_estimators)
+    model.fit(data[relevant_features].iloc[train_index], data["CALLS"].iloc[train_index])
+
+    test_X = data[relevant_features].iloc[test_index]
+    test_y = data["CALLS"].iloc[test_index]
+    prediction = model.predict(test_X)
+    refreshed = dict(artifact)
+    refreshed.update({"model": model,
+                      "last_date": str(call_db.last_date),
+                      "last_timestamp": call_db.last_timestamp,
+                      "fingerprint": fingerprint,
+                      "metrics": {"mae": metrics.mean_absolute_error(test_y, prediction),
+                                  "rmse": math.sqrt(metrics.mean_squared_error(test_y, prediction)),
+                                  "r2": metrics.r2_score(test_y, prediction),
+                                  "training_rows": len(train_index),
+                                  "test_rows": len(test_index),
+                                  "seconds": time.perf_counter() - start},
+                      "data": data,
+                      "history": call_db.history_fingerprint(call_db.last_date),
+                      "test_index": test_index})
+    return(refreshed)
+
+def save_model(artifact, filename):
+    """
+    Store a model artifact returned by train_model in a file.
+    """
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, "wb") as f:
+        pickle.dump(artifact, f)
+    os.replace(tmp_file, filename)
+
+def check_model(artifact, call_db, relevant_features, history=None):
+    """
+    Returns the list of reasons why a model artifact does not match the features and the data
+    of the database. The list is empty if the artifact can be used. If the artifact contains the
+    fingerprint of the data of its trained days (history), changes of that data are detected as
+    well; pass history if call_db.history_fingerprint of the last training day is already known.
+    """
+    fingerprint = call_db.fingerprint()
+    checks = [("features", artifact["features"], list(relevant_features)),
+              ("first_date", artifact["first_date"], str(call_db.first_date)),
+              ("last_date", artifact["last_date"], str(call_db.last_date)),
+              ("db_version", artifact["db_version"], fingerprint["version"]),
+              ("last_timestamp", artifact["last_timestamp"], call_db.last_timestamp),
+              ("fingerprint", artifact["fingerprint"], fingerprint),
+              ("sklearn_version", artifact["sklearn_version"], sklearn.__version__)]
+    if "history" in artifact:
+        if history == None:
+            history = call_db.history_fingerprint(artifact["last_date"])
+        checks.append(("history", artifact["history"], history))
+    return([f"{name} changed from {old} to {new}" for name, old, new in checks if old != new])
+
+def load_model(filename, call_db=None, relevant_features=relevant_features):
+    """
+    Load a model artifact stored by save_model. If a database is given, raise a ValueError if
+    the artifact does not match the features or the data of the database.
+    """
+    with open(filename, "rb") as f:
+        artifact = pickle.load(f)
+    if call_db != None:
+        mismatch = check_model(artifact, call_db, relevant_features)
+        if len(mismatch) > 0:
+            raise ValueError(f"The model in {filename} does not match: " + "; ".join(mismatch))
+    return(artifact)
+
+def load_or_train(filename, call_db=None, relevant_features=relevant_features, cache_dir="feature_cache", retrain=True, refresh=True):
+    """
+    Load the model artifact from filename if it matches the features and the data of the
+    database. Otherwise the model is updated with refresh_model (or trained again, if refresh is
+    False) and stored in filename if retrain is True, or a ValueError is raised.
+    """
+    if call_db == None:
+        call_db = db
+    if os.path.exists(filename):
+        artifact = load_model(filename)
+        mismatch = check_model(artifact, call_db, relevant_features)
+        if len(mismatch) == 0:
+            return(artifact)
+        if not retrain:
+            raise ValueError(f"The model in {filename} does not match: " + "; ".join(mismatch))
+        print(f"The model in {filename} does not match: " + "; ".join(mismatch))
+        if refresh:
+            artifact = refresh_model(artifact, call_db, relevant_features, cache_dir=cache_dir)
+        else:
+            artifact = train_model(relevant_features, cache_dir=cache_dir, call_db=call_db)
+    elif not retrain:
+        raise ValueError(f"No model found in {filename}")
+    else:
+        artifact = train_model(relevant_features, cache_dir=cache_dir, call_db=call_db)
+    save_model(artifact, filename)
+    return(artifact)
 
 if __name__ == "__main__":
     db = callDB("Seattle_Real_Time_Fire_911_Calls_20240111.csv", weather_data="weather_data.csv", covid_data= "COVID.csv", rebuild=True, dmin="2010-01-01", load_only=True)
-    relevant_features = ["POP", "PRCP", "MONTH", "TMAX", "SNOW_BOOL", "SUMMER", "WINTER", "HAZE", "HAIL", "WEEKEND_BOOL", "HOLIDAY_BOOL", "WEEKLY_HOSP_CNT", "WEEKLY_DEATH_CNT", "WEEKLY_PCR_TESTS", "WEEKLY_PCR_TESTS_POS", "PANDEMIC"]
-    model = calls_estimator(relevant_features)
+    model = load_or_train("model.pkl")["model"]
     date_str = input("Please enter the date for which the 911-Calls should be predicted. Use the format YYYY-MM-DD.")
     weather = input(f"Do you have weather information for {date_str}? y/N")
     if weather in ["y","yes", "Y", "YES", "Yes"]:
@@ -145,43 +295,12 @@ if __name__ == "__main__":
         WEEKLY_PCR_TESTS = 0
         WEEKLY_PCR_TESTS_POS = 0
 
-    pop = populationPredictor()
-
-    date = dt.datetime.strptime(date_str, "%Y-%m-%d").date()
-
-    weekend = 0
-    if date.weekday() in [5,6]:
-        weekend = 1
-
-    holiday = 0
-    if date in db.wa_holidays:
-        holiday = 1
-
-    pandemic_start = dt.date(2020,1,30)
-    pandemic_end = dt.date(2023,5,5)
-
-    pandemic = 0
-    
-    if date > pandemic_start and date < pandemic_end:
-        pandemic = 1
-    
+    pop = shared_predictor()
 
-    details = [{"POP": pop.predict(date.year),
-               "PRCP": PRCP,
-               "MONTH": date.month,
-               "TMAX": TMAX,
-               "SNOW_BOOL": SNOW_BOOL,
-               "SUMMER": db.get_season(date)["Summer"],
-               "WINTER": db.get_season(date)["Winter"],
-               "HAZE": HAZE,
-               "HAIL": HAIL,
-               "WEEKEND_BOOL": weekend,
-               "HOLIDAY_BOOL": holiday,
-               "WEEKLY_HOSP_CNT": WEEKLY_HOSP_CNT,
-               "WEEKLY_DEATH_CNT": WEEKLY_DEATH_CNT,
-               "WEEKLY_PCR_TESTS": WEEKLY_PCR_TESTS,
-               "WEEKLY_PCR_TESTS_POS": WEEKLY_PCR_TESTS_POS,
-               "PANDEMIC": pandemic},]
+    details = [prediction_features(db, pop, date_str,
+                                   weather={"PRCP": PRCP, "TMAX": TMAX, "SNOW_BOOL": SNOW_BOOL, "HAZE": HAZE, "HAIL": HAIL},
+                                   covid={"WEEKLY_HOSP_CNT": WEEKLY_HOSP_CNT, "WEEKLY_DEATH_CNT": WEEKLY_DEATH_CNT,
+                                          "WEEKLY_PCR_TESTS": WEEKLY_PCR_TESTS, "WEEKLY_PCR_TESTS_POS": WEEKLY_PCR_TESTS_POS}),]
 
     calls_prediction = model.predict(pd.DataFrame(details))
 
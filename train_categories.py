@@ -0,0 +1,123 @@
+import sys
+import time
+import math
+import numpy as np
+import pandas as pd
+import sklearn
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.ensemble import GradientBoostingRegressor
+import sklearn.metrics as metrics
+
+from call_db.calls import callDB
+from train import collect_data, relevant_features, save_model
+
+
+# Feature matrix and targets of a worker process, attached once by _attach_matrix.
+_shared = {}
+
+
+def _attach_matrix(name, shape, features, train_index, test_index):
+    """
+    Attach the shared memory block holding the features and the targets in a worker process.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    _shared.update({"shm": shm, "matrix": np.ndarray(shape, dtype=np.float64, buffer=shm.buf),
+                    "features": features, "train_index": train_index, "test_index": test_index})
+
+
+def _fit_target(column):
+    """
+    Fit the regressor of one target column of the shared matrix and evaluate it on the test
+    split. Returns the model and its metrics.
+    """
+    start = time.perf_counter()
+    matrix = _shared["matrix"]
+    features = _shared["features"]
+
+    # The features are named, so the models can be used with feature matrices of callDB.
+    X = pd.DataFrame(matrix[:, :len(features)], columns=features, copy=False)
+    y = matrix[:, len(features) + column]
+    train_index, test_index = _shared["train_index"], _shared["test_index"]
+    model = GradientBoostingRegressor(n_estimators=250,
+                                      learning_rate = 0.2,
+                                      subsample = 0.75).fit(X.iloc[train_index], y[train_index])
+    prediction = model.predict(X.iloc[test_index])
+    return(model, {"mae": metrics.mean_absolute_error(y[test_index], prediction),
+                   "rmse": math.sqrt(metrics.mean_squared_error(y[test_index], prediction)),
+                   "mean_calls": float(y[test_index].mean()),
+                   "seconds": time.perf_counter() - start})
+
+
+def frequent_categories(call_db, min_calls=5000):
+    """
+    Returns the types of calls with more than min_calls calls, ordered by the number of calls.
+    """
+    query = """SELECT type FROM daily_type_counts GROUP BY type HAVING SUM(count) > ?
+               ORDER BY SUM(count) DESC, type;"""
+    return([row[0] for row in call_db.query_db(query, (min_calls,))])
+
+
+def train_category_models(call_db, min_calls=5000, features=relevant_features, workers=None, cache_dir="feature_cache"):
+    """
+    Train one regressor for the total number of calls (CALLS) and one for every type of calls
+    with more than min_calls calls. The feature matrix with the number of calls per category is
+    collected once and put into shared memory, the regressors are fitted on a pool of worker
+    processes. The models are evaluated on the last quarter of the days (a chronological
+    holdout), so no day after a test day is used for training.
+
+    Returns the model artifact: a dictionary like the one of train.train_model, but with a
+    dictionary of models per target (models), the list of targets and the metrics per target.
+    """
+    start = time.perf_counter()
+    categories = frequent_categories(call_db, min_calls)
+    targets = ["CALLS"] + categories
+    data = collect_data(call_db, call_db.first_date, call_db.last_date, categories, cache_dir=cache_dir)
+    matrix = np.ascontiguousarray(data[list(features) + targets].to_numpy(dtype=np.float64))
+
+    # Hold out the last days for the evaluation, the rows of the matrix are ordered by date.
+    n_test = int(math.ceil(len(data)*0.25))
+    train_index = np.arange(len(data) - n_test)
+    test_index = np.arange(len(data) - n_test, len(data))
+
+    # Copy the matrix to shared memory once, the workers only attach to it.
+    shm = shared_memory.SharedMemory(create=True, size=matrix.nbytes)
+    try:
+        np.ndarray(matrix.shape, dtype=np.float64, buffer=shm.buf)[:] = matrix
+        initargs = (shm.name, matrix.shape, list(features), train_index, test_index)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_matrix, initargs=initargs) as pool:
+            results = list(pool.map(_fit_target, range(len(targets))))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    fingerprint = call_db.fingerprint()
+    return({"models": {target: result[0] for target, result in zip(targets, results)},
+            "targets": targets,
+            "features": list(features),
+            "first_date": str(call_db.first_date),
+            "last_date": str(call_db.last_date),
+            "db_version": fingerprint["version"],
+            "last_timestamp": call_db.last_timestamp,
+            "fingerprint": fingerprint,
+            "metrics": {target: result[1] for target, result in zip(targets, results)},
+            "seconds": time.perf_counter() - start,
+            "sklearn_version": sklearn.__version__})
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    # python train_categories.py <db_file> [min_calls] [output] [workers]
+    db = callDB(db_file=args[1], load_only=True)
+    min_calls = int(args[2]) if len(args) > 2 else 5000
+    output = args[3] if len(args) > 3 else "category_models.pkl"
+    workers = int(args[4]) if len(args) > 4 else None
+    artifact = train_category_models(db, min_calls, workers=workers)
+    save_model(artifact, output)
+
+    print(f"Trained {len(artifact['targets'])} models in {artifact['seconds']:.1f} s")
+    for target in artifact["targets"]:
+        result = artifact["metrics"][target]
+        print(f"{target:>40}: MAE {result['mae']:7.2f} (mean {result['mean_calls']:7.1f} calls per day), {result['seconds']:.1f} s")
@@ -0,0 +1,82 @@
+import sys
+import time
+import math
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import train_test_split
+import sklearn.metrics as metrics
+
+from call_db.calls import callDB
+from pop_predict.predict import shared_predictor
+from train import collect_data, relevant_features, save_model, load_model
+from forecast import batch_features
+
+
+def train_hourly_model(call_db, features=relevant_features, cache_dir="feature_cache", estimator=None):
+    """
+    Train a multi-output model predicting the number of calls in each of the 24 hours of a day.
+    The targets are the matrix of the number of calls per day and hour of the database. By
+    default a RandomForestRegressor is used, which fits all 24 outputs at once.
+
+    Returns the model artifact: a dictionary like the one of train.train_model, where the
+    metrics contain the error per hour (mae, rmse) and the error of the daily totals (daily_mae).
+    """
+    start = time.perf_counter()
+    if estimator == None:
+        estimator = RandomForestRegressor(n_estimators=200, min_samples_leaf=3, random_state=0, n_jobs=-1)
+    data = collect_data(call_db, call_db.first_date, call_db.last_date, cache_dir=cache_dir)
+    targets = call_db.get_hourly_matrix(call_db.first_date, call_db.last_date)
+    training_X, test_X, training_y, test_y = train_test_split(data[features], targets, random_state=42, test_size=0.25)
+    model = estimator.fit(training_X, training_y)
+    prediction = model.predict(test_X)
+    fingerprint = call_db.fingerprint()
+    return({"model": model,
+            "features": list(features),
+            "first_date": str(call_db.first_date),
+            "last_date": str(call_db.last_date),
+            "db_version": fingerprint["version"],
+            "last_timestamp": call_db.last_timestamp,
+            "fingerprint": fingerprint,
+            "metrics": {"mae": metrics.mean_absolute_error(test_y, prediction),
+                        "rmse": math.sqrt(metrics.mean_squared_error(test_y, prediction)),
+                        "daily_mae": metrics.mean_absolute_error(test_y.sum(axis=1), prediction.sum(axis=1)),
+                        "training_rows": len(training_X),
+                        "test_rows": len(test_X),
+                        "seconds": time.perf_counter() - start},
+            "sklearn_version": sklearn.__version__})
+
+
+def forecast_hourly(model, call_db, first_date, days=7, scenarios=None, pop=None, features=relevant_features):
+    """
+    Predict the number of calls per hour for a number of days starting at first_date (a week by
+    default) with one call of the model. Weather and covid values can be given as a DataFrame of
+    scenarios with one row per day, see forecast.batch_features. Returns a DataFrame with one
+    row per day and hour (DATE, HOUR, CALLS).
+    """
+    if pop is None:
+        pop = shared_predictor()
+    dates = pd.date_range(first_date, periods=days, freq="D").strftime("%Y-%m-%d")
+    prediction = model.predict(batch_features(call_db, pop, dates, scenarios)[features])
+    return(pd.DataFrame({"DATE": np.repeat(np.array(dates), 24),
+                         "HOUR": np.tile(np.arange(24), days),
+                         "CALLS": prediction.ravel()}))
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    # python train_hourly.py <db_file> <first_date> [days] [model_file]
+    db = callDB(db_file=args[1], load_only=True)
+    days = int(args[3]) if len(args) > 3 else 7
+    model_file = args[4] if len(args) > 4 else "hourly_model.pkl"
+    try:
+        artifact = load_model(model_file, db)
+    except (FileNotFoundError, ValueError):
+        artifact = train_hourly_model(db)
+        save_model(artifact, model_file)
+        print(f"Trained the model in {artifact['metrics']['seconds']:.1f} s, MAE per hour {artifact['metrics']['mae']:.2f}")
+    result = forecast_hourly(artifact["model"], db, args[2], days)
+    print(result.pivot(index="DATE", columns="HOUR", values="CALLS").round(1).to_string())
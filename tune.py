@@ -0,0 +1,124 @@
+import sys
+import json
+import time
+import math
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
+from sklearn.model_selection import TimeSeriesSplit, ParameterGrid, ParameterSampler
+import sklearn.metrics as metrics
+
+from call_db.calls import callDB
+from train import collect_data, relevant_features
+
+
+# Estimators and the values of their hyperparameters which are searched.
+search_spaces = {"GradientBoostingRegressor": (GradientBoostingRegressor,
+                                               {"n_estimators": [100, 250, 500],
+                                                "learning_rate": [0.05, 0.1, 0.2],
+                                                "subsample": [0.75, 1.0],
+                                                "max_depth": [3, 5]}),
+                 "HistGradientBoostingRegressor": (HistGradientBoostingRegressor,
+                                                   {"max_iter": [200, 500, 1500],
+                                                    "learning_rate": [0.05, 0.1, 0.2],
+                                                    "max_leaf_nodes": [15, 31, 100, 500]})}
+
+# Feature matrix and targets of a worker process, set once by _init_worker.
+_shared = {}
+
+
+def _init_worker(X, y, folds):
+    """
+    Store the feature matrix, the targets and the folds in the worker process, so they are not
+    sent again with every trial.
+    """
+    _shared.update({"X": X, "y": y, "folds": folds})
+
+
+def _run_trial(trial):
+    """
+    Fit and evaluate one set of hyperparameters on all folds. Returns one dictionary per fold.
+    """
+    name, params = trial
+    estimator = search_spaces[name][0]
+    X, y = _shared["X"], _shared["y"]
+    rows = []
+    for fold, (train_index, test_index) in enumerate(_shared["folds"]):
+        start = time.perf_counter()
+        model = estimator(random_state=0, **params).fit(X[train_index], y[train_index])
+        fit_time = time.perf_counter() - start
+        start = time.perf_counter()
+        prediction = model.predict(X[test_index])
+        predict_time = time.perf_counter() - start
+        rows.append({"fold": fold, "fit_time": fit_time, "predict_time": predict_time,
+                     "mae": metrics.mean_absolute_error(y[test_index], prediction),
+                     "rmse": math.sqrt(metrics.mean_squared_error(y[test_index], prediction))})
+    return(rows)
+
+
+def time_series_folds(n, n_splits=5):
+    """
+    Returns forward-chaining folds for n days in chronological order: every fold trains on all
+    days before its test days, so no future day is used for training.
+    """
+    return(list(TimeSeriesSplit(n_splits=n_splits).split(np.arange(n))))
+
+
+def tune(call_db, features=relevant_features, spaces=None, n_iter=None, n_splits=5, workers=None, random_state=42, cache_dir="feature_cache"):
+    """
+    Search the hyperparameters of the estimators in spaces (default: all of search_spaces) with
+    forward-chaining time-series folds. If n_iter is None, all combinations are tried (grid
+    search), otherwise n_iter random combinations per estimator. The trials run on a pool of
+    worker processes which receive the feature matrix once.
+
+    Returns a DataFrame with one row per trial: the estimator, the hyperparameters (as json),
+    the mean fit and predict time per fold and the mean and standard deviation of the errors
+    over the folds, sorted by the mean absolute error.
+    """
+    if spaces == None:
+        spaces = list(search_spaces.keys())
+
+    # Collect the feature matrix once. The days are in chronological order.
+    data = collect_data(call_db, call_db.first_date, call_db.last_date, cache_dir=cache_dir)
+    X = data[features].to_numpy(dtype=np.float64)
+    y = data["CALLS"].to_numpy(dtype=np.float64)
+    folds = time_series_folds(len(data), n_splits)
+
+    trials = []
+    for name in spaces:
+        grid = search_spaces[name][1]
+        if n_iter == None:
+            candidates = ParameterGrid(grid)
+        else:
+            candidates = ParameterSampler(grid, n_iter=min(n_iter, len(ParameterGrid(grid))), random_state=random_state)
+        trials += [(name, params) for params in candidates]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(X, y, folds)) as pool:
+        fold_results = list(pool.map(_run_trial, trials))
+    print(f"Ran {len(trials)} trials with {n_splits} folds in {time.perf_counter() - start:.1f} s")
+
+    rows = []
+    for (name, params), result in zip(trials, fold_results):
+        result = pd.DataFrame(result)
+        rows.append({"estimator": name, "params": json.dumps(params, sort_keys=True),
+                     "fit_time": result["fit_time"].mean(), "predict_time": result["predict_time"].mean(),
+                     "mae": result["mae"].mean(), "mae_std": result["mae"].std(ddof=0),
+                     "rmse": result["rmse"].mean()})
+    return(pd.DataFrame(rows).sort_values("mae", ignore_index=True))
+
+
+if __name__ == "__main__":
+
+    args = sys.argv
+
+    # python tune.py <db_file> [n_iter] [output]
+    db = callDB(db_file=args[1], load_only=True)
+    n_iter = None
+    if len(args) > 2 and int(args[2]) > 0:
+        n_iter = int(args[2])
+    output = args[3] if len(args) > 3 else "tuning_results.csv"
+    results = tune(db, n_iter=n_iter)
+    results.to_csv(output, index=False)
+    print(results.head(10).to_string())